@@ -0,0 +1,281 @@
+"""
+Two-tier cache for hot, read-mostly objects (compiled tests, course
+entitlements, public counters).
+
+Reads go to a bounded per-process LRU first, then to the Django cache
+(Redis). Deleting a key removes it from Redis and broadcasts it over
+pub/sub, so every process drops its local copy; local entries also expire
+after TIERED_CACHE_LOCAL_TTL seconds in case a message was missed.
+
+Misses are single-flight: one worker recomputes while the others wait for
+its result. Entries are recomputed shortly before they expire with
+probability growing towards the expiry (XFetch), so a popular key is
+refreshed by one request instead of expiring under load.
+
+Values in the local tier are shared between requests: treat them as read-only.
+"""
+import json
+import logging
+import math
+import random
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django_redis import get_redis_connection
+from django_redis.exceptions import ConnectionInterrupted
+from redis.exceptions import RedisError
+
+logger = logging.getLogger(__name__)
+
+INVALIDATION_CHANNEL = 'cache:invalidate'
+STATS_KEY = 'cache:stats'
+CACHE_ERRORS = (RedisError, ConnectionInterrupted)
+
+MISSING = object()
+
+
+class LocalLRU:
+    """Thread-safe LRU of (value, expires_at) with a fixed number of entries."""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return MISSING
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self.entries[key]
+                return MISSING
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def delete(self, keys):
+        with self.lock:
+            for key in keys:
+                self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class TieredCache:
+    beta = 1.0  # XFetch eagerness, 1.0 is the value from the paper
+    lock_timeout = 30  # Seconds a crashed recompute may hold the lock
+    poll_interval = 0.05
+
+    def __init__(self, alias='default'):
+        self.alias = alias
+        self.local = LocalLRU(settings.TIERED_CACHE_LOCAL_SIZE)
+        self.flights = {}  # key -> threading.Lock, coalesces threads of this process
+        self.flights_lock = threading.Lock()
+        self.counts = Counter()
+        self.counts_lock = threading.Lock()
+        self.counts_flushed_at = time.monotonic()
+        self.listener = None  # Thread, or False when the cache has no pub/sub
+
+    @property
+    def remote(self):
+        return caches[self.alias]
+
+    def get_or_set(self, key, compute, timeout):
+        """
+        Cached value of the key, computed with compute() on a miss and kept
+        for timeout seconds. None results are not cached.
+        """
+        self.listen()
+        value = self.local.get(key)
+        if value is not MISSING:
+            self.count('local_hits')
+            return value
+
+        with self.flight(key):
+            value = self.local.get(key)  # Filled by another thread while this one waited
+            if value is not MISSING:
+                self.count('local_hits')
+                return value
+            value = self.fetch(key, compute, timeout)
+        if value is not None:
+            self.local.set(key, value, min(timeout, settings.TIERED_CACHE_LOCAL_TTL))
+        return value
+
+    def fetch(self, key, compute, timeout):
+        entry = self.remote_get(key)
+        if entry is not None:
+            value, delta, expires_at = entry
+            # XFetch: recompute early with probability rising as the expiry nears
+            if time.time() - delta * self.beta * math.log(random.random() or 1e-12) < expires_at:
+                self.count('remote_hits')
+                return value
+            if not self.acquire(key):
+                self.count('remote_hits')  # Somebody else is already refreshing it
+                return value
+            self.count('early_recomputes')
+            return self.recompute(key, compute, timeout)
+
+        self.count('misses')
+        if not self.acquire(key):
+            self.count('lock_waits')
+            deadline = time.monotonic() + settings.TIERED_CACHE_LOCK_WAIT
+            while True:
+                time.sleep(self.poll_interval)
+                entry = self.remote_get(key)
+                if entry is not None:
+                    return entry[0]
+                if self.acquire(key):
+                    break
+                if time.monotonic() >= deadline:
+                    self.count('lock_timeouts')
+                    return compute()  # The holder is too slow or gone; do not wait any longer
+        return self.recompute(key, compute, timeout)
+
+    def recompute(self, key, compute, timeout):
+        try:
+            started = time.time()
+            value = compute()
+            if value is not None:
+                delta = time.time() - started
+                self.remote_set(key, (value, delta, time.time() + timeout), timeout)
+            return value
+        finally:
+            self.release(key)
+
+    def delete(self, *keys):
+        """Drop the keys in Redis and in the local tier of every process."""
+        if not keys:
+            return
+        self.local.delete(keys)
+        try:
+            self.remote.delete_many(keys)
+            get_redis_connection(self.alias).publish(INVALIDATION_CHANNEL, json.dumps(keys))
+        except NotImplementedError:  # Cache is not Redis (tests): a single process, nothing to broadcast
+            pass
+        except CACHE_ERRORS:
+            logger.warning("Could not invalidate %s", keys, exc_info=True)
+
+    def flight(self, key):
+        with self.flights_lock:
+            lock = self.flights.get(key)
+            if lock is None:
+                if len(self.flights) > settings.TIERED_CACHE_LOCAL_SIZE:
+                    self.flights = {k: v for k, v in self.flights.items() if v.locked()}
+                lock = self.flights[key] = threading.Lock()
+            return lock
+
+    def acquire(self, key):
+        try:
+            return self.remote.add(f'{key}:lock', 1, self.lock_timeout)
+        except CACHE_ERRORS:
+            return True  # Redis is down: compute locally
+
+    def release(self, key):
+        try:
+            self.remote.delete(f'{key}:lock')
+        except CACHE_ERRORS:
+            pass
+
+    def remote_get(self, key):
+        try:
+            return self.remote.get(key)
+        except CACHE_ERRORS:
+            self.count('errors')
+            return None
+
+    def remote_set(self, key, entry, timeout):
+        try:
+            self.remote.set(key, entry, timeout)
+        except CACHE_ERRORS:
+            self.count('errors')
+
+    # Invalidation messages
+
+    def listen(self):
+        if self.listener is None or (self.listener and not self.listener.is_alive()):
+            with self.flights_lock:
+                if self.listener is None or (self.listener and not self.listener.is_alive()):
+                    self.listener = threading.Thread(target=self.read_invalidations, name='cache-invalidation',
+                                                     daemon=True)
+                    self.listener.start()
+
+    def read_invalidations(self):
+        while True:
+            try:
+                pubsub = get_redis_connection(self.alias).pubsub(ignore_subscribe_messages=True)
+            except NotImplementedError:  # Cache is not Redis: deletes are local already
+                self.listener = False
+                return
+            try:
+                pubsub.subscribe(INVALIDATION_CHANNEL)
+                # Messages sent while disconnected are lost, so start from an empty local tier
+                self.local.clear()
+                for message in pubsub.listen():
+                    if message['type'] == 'message':
+                        self.local.delete(json.loads(message['data']))
+            except RedisError:
+                logger.warning("Cache invalidation subscription lost, reconnecting", exc_info=True)
+                self.local.clear()
+                time.sleep(1)
+            finally:
+                pubsub.close()
+
+    # Instrumentation
+
+    def count(self, name):
+        with self.counts_lock:
+            self.counts[name] += 1
+            if time.monotonic() - self.counts_flushed_at < settings.TIERED_CACHE_STATS_INTERVAL:
+                return
+            counts, self.counts = self.counts, Counter()
+            self.counts_flushed_at = time.monotonic()
+        self.push_stats(counts)
+
+    def push_stats(self, counts):
+        """Add the counters of this process to the shared totals."""
+        try:
+            pipe = get_redis_connection(self.alias).pipeline()
+            for name, value in counts.items():
+                pipe.hincrby(STATS_KEY, name, value)
+            pipe.execute()
+        except (RedisError, NotImplementedError):
+            pass
+
+    def stats(self):
+        """Totals of every process (plus the unflushed counters of this one) and the hit ratio."""
+        with self.counts_lock:
+            totals = Counter(self.counts)
+        try:
+            totals.update({
+                name.decode(): int(value)
+                for name, value in get_redis_connection(self.alias).hgetall(STATS_KEY).items()
+            })
+        except (RedisError, NotImplementedError):
+            pass
+        hits = totals['local_hits'] + totals['remote_hits']
+        lookups = hits + totals['misses'] + totals['early_recomputes']
+        return {**totals, 'hit_ratio': round(hits / lookups, 4) if lookups else None}
+
+    def reset_stats(self):
+        with self.counts_lock:
+            self.counts = Counter()
+        try:
+            get_redis_connection(self.alias).delete(STATS_KEY)
+        except (RedisError, NotImplementedError):
+            pass
+
+
+tiered = TieredCache()
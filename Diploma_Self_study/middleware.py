@@ -0,0 +1,83 @@
+from django.http import FileResponse
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+from django.utils.regex_helper import _lazy_re_compile
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is used without it
+    brotli = None
+
+re_accepts_brotli = _lazy_re_compile(r"\bbr\b")
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """
+    Compress JSON API responses with brotli when the client accepts it and
+    the brotli package is installed, everything else with Django's gzip.
+    Streaming responses are compressed chunk by chunk.
+
+    HTML pages (admin, forms) carry CSRF tokens next to reflected input, so
+    they stay on gzip, whose random-length padding (max_random_bytes)
+    mitigates BREACH; the API authenticates with headers and has no such
+    secrets to leak through the compressed length.
+    """
+    brotli_quality = 5
+    offloaded_headers = ("X-Accel-Redirect", "X-Sendfile")
+
+    @staticmethod
+    def is_json(response):
+        content_type = response.get("Content-Type", "").split(";")[0].strip().lower()
+        return content_type == "application/json" or content_type.endswith("+json")
+
+    def process_response(self, request, response):
+        # Compressors buffer output, which would hold back Server-Sent Events
+        if response.get("Content-Type", "").startswith("text/event-stream"):
+            return response
+        # Files: keep byte ranges and sendfile()/X-Accel-Redirect intact
+        if isinstance(response, FileResponse) or any(header in response for header in self.offloaded_headers):
+            return response
+
+        ae = request.META.get("HTTP_ACCEPT_ENCODING", "")
+        if brotli is None or not re_accepts_brotli.search(ae) or not self.is_json(response):
+            return super().process_response(request, response)
+
+        if not response.streaming and len(response.content) < 200:
+            return response
+        if response.has_header("Content-Encoding"):
+            return response
+
+        patch_vary_headers(response, ("Accept-Encoding",))
+
+        if response.streaming:
+            compressor = brotli.Compressor(quality=self.brotli_quality)
+            original_iterator = response.streaming_content
+            if response.is_async:
+                async def brotli_wrapper():
+                    async for chunk in original_iterator:
+                        data = compressor.process(chunk)
+                        if data:
+                            yield data
+                    yield compressor.finish()
+            else:
+                def brotli_wrapper():
+                    for chunk in original_iterator:
+                        data = compressor.process(chunk)
+                        if data:
+                            yield data
+                    yield compressor.finish()
+            response.streaming_content = brotli_wrapper()
+            del response.headers["Content-Length"]
+        else:
+            compressed_content = brotli.compress(response.content, quality=self.brotli_quality)
+            if len(compressed_content) >= len(response.content):
+                return response
+            response.content = compressed_content
+            response.headers["Content-Length"] = str(len(response.content))
+
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response.headers["ETag"] = "W/" + etag
+        response.headers["Content-Encoding"] = "br"
+
+        return response
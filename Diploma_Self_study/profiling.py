@@ -0,0 +1,260 @@
+"""
+Opt-in request profiling for production.
+
+ProfilingMiddleware profiles a PROFILING_SAMPLE_RATE fraction of requests
+and every request carrying a valid signed PROFILING_HEADER (tokens come
+from `python manage.py profiling_token`). Each profile records the
+executed SQL and either a cProfile run (PROFILING_MODE = 'cprofile', a
+.prof file for pstats/snakeviz/flameprof) or wall-clock stack samples
+(PROFILING_MODE = 'sample', folded stacks for flamegraph.pl/speedscope).
+Profiles go to PROFILING_DIR, which keeps only the newest
+PROFILING_MAX_PROFILES; admins list and download them through the API.
+"""
+import cProfile
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import ExitStack
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.core import signing
+from django.db import connections
+from django.http import FileResponse, Http404
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+SIGNING_SALT = 'lms.profiling'
+PROFILE_ID_RE = re.compile(r'^\d{8}T\d{12}-[0-9a-f]{8}$')
+DOWNLOADS = {
+    'prof': 'application/octet-stream',
+    'folded': 'text/plain',
+    'json': 'application/json',
+}
+# Python 3.12+ allows one active cProfile profiler per process (runcall raises ValueError otherwise)
+cprofile_lock = threading.Lock()
+
+
+def make_token():
+    return signing.TimestampSigner(salt=SIGNING_SALT).sign(uuid.uuid4().hex)
+
+
+def token_is_valid(token):
+    try:
+        signing.TimestampSigner(salt=SIGNING_SALT).unsign(token, max_age=settings.PROFILING_TOKEN_MAX_AGE)
+    except signing.BadSignature:  # Also raised for expired tokens
+        return False
+    return True
+
+
+class QueryRecorder:
+    """execute_wrapper that keeps the SQL, duration and alias of every query."""
+
+    def __init__(self, alias):
+        self.alias = alias
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                'alias': self.alias,
+                'sql': sql,
+                'many': many,
+                'ms': round((time.perf_counter() - started) * 1000, 3),
+            })
+
+
+class StackSampler:
+    """Samples the stack of one thread from a background thread and counts folded stacks."""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='profiling-sampler', daemon=True)
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f'{code.co_name} ({code.co_filename}:{frame.f_lineno})')
+                frame = frame.f_back
+            if names:
+                self.stacks[';'.join(reversed(names))] += 1
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stopped.set()
+        self.thread.join()
+
+    def folded(self):
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+
+def profile_path(profile_id, extension):
+    return os.path.join(settings.PROFILING_DIR, f'{profile_id}.{extension}')
+
+
+def save_profile(meta, profiler=None, sampler=None):
+    """Write the files of one profile, then drop the oldest profiles beyond the limit."""
+    os.makedirs(settings.PROFILING_DIR, exist_ok=True)
+    profile_id = meta['id']
+    if profiler is not None:
+        profiler.dump_stats(profile_path(profile_id, 'prof'))
+    if sampler is not None:
+        with open(profile_path(profile_id, 'folded'), 'w') as file:
+            file.write(sampler.folded())
+    # The metadata goes last: a profile is listed only once all its files exist
+    with open(profile_path(profile_id, 'json'), 'w') as file:
+        json.dump(meta, file)
+    prune_profiles()
+
+
+def list_profile_ids():
+    try:
+        names = os.listdir(settings.PROFILING_DIR)
+    except FileNotFoundError:
+        return []
+    # Ids start with the UTC time, so name order is age order
+    return sorted((name[:-5] for name in names if name.endswith('.json')), reverse=True)
+
+
+def prune_profiles():
+    for profile_id in list_profile_ids()[settings.PROFILING_MAX_PROFILES:]:
+        for extension in DOWNLOADS:
+            try:
+                os.remove(profile_path(profile_id, extension))
+            except FileNotFoundError:  # Removed by another process
+                pass
+
+
+def load_profile(profile_id):
+    if not PROFILE_ID_RE.match(profile_id):
+        raise Http404
+    try:
+        with open(profile_path(profile_id, 'json')) as file:
+            return json.load(file)
+    except FileNotFoundError:
+        raise Http404
+
+
+class ProfilingMiddleware:
+    """Profiles sampled or explicitly requested requests; adds X-Profile-Id to their responses."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def should_profile(self, request):
+        if not settings.PROFILING_ENABLED:
+            return False
+        token = request.headers.get(settings.PROFILING_HEADER)
+        if token:
+            return token_is_valid(token)
+        return random.random() < settings.PROFILING_SAMPLE_RATE
+
+    def __call__(self, request):
+        if not self.should_profile(request):
+            return self.get_response(request)
+
+        profile_id = f'{datetime.now(dt_timezone.utc):%Y%m%dT%H%M%S%f}-{uuid.uuid4().hex[:8]}'
+        recorders = [QueryRecorder(alias) for alias in connections]
+        profiler = sampler = None
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            if settings.PROFILING_MODE != 'sample':
+                if not cprofile_lock.acquire(blocking=False):
+                    # Another thread is being profiled: serve this request unprofiled
+                    return self.get_response(request)
+                stack.callback(cprofile_lock.release)
+            for recorder in recorders:
+                stack.enter_context(connections[recorder.alias].execute_wrapper(recorder))
+            if settings.PROFILING_MODE == 'sample':
+                sampler = stack.enter_context(
+                    StackSampler(threading.get_ident(), settings.PROFILING_SAMPLE_INTERVAL)
+                )
+                response = self.get_response(request)
+            else:
+                profiler = cProfile.Profile()
+                response = profiler.runcall(self.get_response, request)
+        duration = time.perf_counter() - started
+
+        user = getattr(request, 'user', None)
+        queries = [query for recorder in recorders for query in recorder.queries]
+        meta = {
+            'id': profile_id,
+            'method': request.method,
+            'path': request.get_full_path(),
+            'status': response.status_code,
+            'user': user.pk if user is not None and user.is_authenticated else None,
+            'ms': round(duration * 1000, 3),
+            'mode': 'sample' if sampler is not None else 'cprofile',
+            'query_count': len(queries),
+            'query_ms': round(sum(query['ms'] for query in queries), 3),
+            'queries': queries,
+        }
+        save_profile(meta, profiler, sampler)
+        response.headers['X-Profile-Id'] = profile_id
+        return response
+
+
+class ProfileListView(APIView):
+    """
+    GET: Stored request profiles, newest first, without their SQL.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        profiles = []
+        for profile_id in list_profile_ids():
+            try:
+                meta = load_profile(profile_id)
+            except Http404:  # Pruned in the meantime
+                continue
+            meta.pop('queries', None)
+            profiles.append(meta)
+        return Response(profiles)
+
+
+class ProfileDetailView(APIView):
+    """
+    GET: One profile with its SQL.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, profile_id):
+        return Response(load_profile(profile_id))
+
+
+class ProfileDownloadView(APIView):
+    """
+    GET: A profile file: ?kind=prof (pstats), folded (stack samples) or json.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, profile_id):
+        extension = request.query_params.get('kind', 'prof')
+        if extension not in DOWNLOADS:
+            return Response({"error": f"kind must be one of: {', '.join(DOWNLOADS)}."}, status=400)
+        load_profile(profile_id)  # Validates the id
+        try:
+            file = open(profile_path(profile_id, extension), 'rb')
+        except FileNotFoundError:
+            raise Http404
+        return FileResponse(file, as_attachment=True, filename=f'{profile_id}.{extension}',
+                            content_type=DOWNLOADS[extension])
@@ -0,0 +1,83 @@
+"""
+Pre-generated OpenAPI (Swagger 2.0) document of the API.
+
+Introspecting every view and serializer takes seconds, so the document is
+built once: by `python manage.py generate_openapi_schema` at deploy time
+(written to OPENAPI_SCHEMA_FILE) or, without that file, on the first
+request. It is then kept in the two-tier cache and served with an ETag,
+so clients revalidate it with a 304.
+"""
+import hashlib
+import os
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
+from drf_yasg import openapi
+from drf_yasg.codecs import OpenAPICodecJson
+from drf_yasg.generators import OpenAPISchemaGenerator
+from rest_framework.permissions import AllowAny
+from rest_framework.views import APIView
+
+from .cache import tiered
+
+CACHE_KEY = 'openapi:schema'
+
+API_INFO = openapi.Info(
+    title="LMS API",
+    default_version='v1',
+    description="API системы управления обучением: курсы, материалы, тесты, записи и платежи.",
+)
+
+
+def generate_schema():
+    """Introspect the URLconf; returns the JSON document as bytes."""
+    schema = OpenAPISchemaGenerator(API_INFO).get_schema(request=None, public=True)
+    return OpenAPICodecJson(validators=[]).encode(schema)
+
+
+def write_schema_file():
+    """Generate the document into OPENAPI_SCHEMA_FILE and drop cached copies; returns its size."""
+    body = generate_schema()
+    path = settings.OPENAPI_SCHEMA_FILE
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(f'{path}.tmp', 'wb') as file:
+        file.write(body)
+    os.replace(f'{path}.tmp', path)  # Readers never see a half-written file
+    tiered.delete(CACHE_KEY)
+    return len(body)
+
+
+def load_schema():
+    try:
+        with open(settings.OPENAPI_SCHEMA_FILE, 'rb') as file:
+            body = file.read()
+    except FileNotFoundError:
+        body = generate_schema()
+    return body, hashlib.sha256(body).hexdigest()
+
+
+def get_schema():
+    """(JSON bytes, ETag value) of the document."""
+    return tiered.get_or_set(CACHE_KEY, load_schema, settings.OPENAPI_SCHEMA_CACHE_TIMEOUT)
+
+
+class OpenAPISchemaView(APIView):
+    """
+    GET: The OpenAPI document of the API (JSON). Send If-None-Match with the
+    ETag of the copy you have to get 304 Not Modified.
+    """
+    authentication_classes = []
+    permission_classes = [AllowAny]
+    swagger_schema = None  # Not part of the document itself
+
+    def get(self, request):
+        body, etag = get_schema()
+        etag = quote_etag(etag)
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = HttpResponse(body, content_type='application/json')
+        response.headers['ETag'] = etag
+        patch_cache_control(response, public=True, no_cache=True)
+        return response
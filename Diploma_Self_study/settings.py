@@ -43,6 +43,7 @@ AUTH_USER_MODEL = 'users.User'
 REST_FRAMEWORK = {
     'DEFAULT_FILTER_BACKENDS': [
         'django_filters.rest_framework.DjangoFilterBackend',
+        'lms.filters.PermissionQuerysetFilter',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework_simplejwt.authentication.JWTAuthentication',
@@ -51,11 +52,59 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.AllowAny',
     ),
     'DEFAULT_SCHEMA_CLASS': 'rest_framework.schemas.coreapi.AutoSchema',
+    'DEFAULT_RENDERER_CLASSES': (
+        'lms.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'lms.renderers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
+    # Reverse proxies in front of the app: 0 keys throttles on REMOTE_ADDR, N on the N-th X-Forwarded-For
+    # address from the right. Unset, DRF would use the whole client-supplied header.
+    'NUM_PROXIES': int(os.getenv('NUM_PROXIES') or 0),
+    'DEFAULT_THROTTLE_RATES': {
+        'login': os.getenv('THROTTLE_LOGIN_RATE', '10/min'),
+        'signup': os.getenv('THROTTLE_SIGNUP_RATE', '5/hour'),
+        'submit_test': os.getenv('THROTTLE_SUBMIT_TEST_RATE', '30/min'),
+        'autosave': os.getenv('THROTTLE_AUTOSAVE_RATE', '120/min'),
+    },
 }
 
+SWAGGER_SETTINGS = {
+    'USE_SESSION_AUTH': False,
+    'SECURITY_DEFINITIONS': {
+        'Bearer': {'type': 'apiKey', 'name': 'Authorization', 'in': 'header'},
+    },
+}
+# Diploma_Self_study.schema: written by `manage.py generate_openapi_schema`, generated on demand without it
+OPENAPI_SCHEMA_FILE = os.getenv('OPENAPI_SCHEMA_FILE', os.path.join(BASE_DIR, 'openapi.json'))
+OPENAPI_SCHEMA_CACHE_TIMEOUT = 60 * 60 * 24
+
+# How long deletions are kept for /api/sync/, older watermarks get a full snapshot
+SYNC_TOMBSTONE_RETENTION_DAYS = int(os.getenv('SYNC_TOMBSTONE_RETENTION_DAYS', 30))
+# The sync watermark lags this many seconds behind the response: a transaction that stamped updated_at
+# earlier but commits after the read still falls into the next delta (clients upsert rows by id)
+SYNC_SAFETY_MARGIN = int(os.getenv('SYNC_SAFETY_MARGIN', 60))
+
+# Token buckets for users.throttling: 'redis' (shared by all workers) or 'memory' (per process)
+THROTTLE_BACKEND = os.getenv('THROTTLE_BACKEND', 'redis')
+
+# View tracking buffer for lms.activity: 'redis' (stream flushed by Celery beat) or 'memory' (per process)
+ACTIVITY_BACKEND = os.getenv('ACTIVITY_BACKEND', 'redis')
+ACTIVITY_STREAM_MAXLEN = 1_000_000  # Events kept in the stream if flushing stops
+ACTIVITY_BUFFER_SIZE = 10_000  # Ring buffer size of the memory backend
+ACTIVITY_FLUSH_BATCH = 5000
+ACTIVITY_FLUSH_INTERVAL = 60  # Seconds, memory backend
+ACTIVITY_RAW_RETENTION_DAYS = int(os.getenv('ACTIVITY_RAW_RETENTION_DAYS', 30))  # Hourly rollups are kept
+
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    "Diploma_Self_study.profiling.ProfilingMiddleware",
+    "Diploma_Self_study.middleware.CompressionMiddleware",
+    "django.middleware.http.ConditionalGetMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     'corsheaders.middleware.CorsMiddleware',
     "django.middleware.common.CommonMiddleware",
@@ -65,6 +114,16 @@ MIDDLEWARE = [
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
 
+# Diploma_Self_study.profiling: off unless enabled; then sampled or requested with a signed header
+PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', 'False').lower() in ('true', '1', 'yes')
+PROFILING_SAMPLE_RATE = float(os.getenv('PROFILING_SAMPLE_RATE', 0))  # Fraction of requests, 0.001 = 1 in 1000
+PROFILING_HEADER = 'X-Profile'
+PROFILING_TOKEN_MAX_AGE = 60 * 60 * 24  # Seconds a token from `manage.py profiling_token` stays valid
+PROFILING_MODE = os.getenv('PROFILING_MODE', 'cprofile')  # 'cprofile' or 'sample' (stack sampling)
+PROFILING_SAMPLE_INTERVAL = 0.005  # Seconds between stack samples
+PROFILING_DIR = os.getenv('PROFILING_DIR', os.path.join(BASE_DIR, 'profiles'))
+PROFILING_MAX_PROFILES = 200
+
 ROOT_URLCONF = "Diploma_Self_study.urls"
 
 TEMPLATES = [
@@ -99,17 +158,37 @@ if 'test' in sys.argv:
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": ":memory:",
     }
+    THROTTLE_BACKEND = 'memory'
+    ACTIVITY_BACKEND = 'memory'
+
 
+REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
 
 CACHES = {
     'default': {
         'BACKEND': 'django_redis.cache.RedisCache',
-        'LOCATION': os.getenv('REDIS_URL', 'redis://localhost:6379/0'),
+        'LOCATION': REDIS_URL,
         'OPTIONS': {
             'CLIENT_CLASS': 'django_redis.client.DefaultClient',
         }
     }
 }
+if 'test' in sys.argv:
+    CACHES['default'] = {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+    # Without Redis every event, index and leaderboard update logs its fallback with a traceback
+    LOGGING = {
+        'version': 1,
+        'disable_existing_loggers': False,
+        'loggers': {name: {'level': 'ERROR'} for name in ('lms', 'users', 'Diploma_Self_study')},
+    }
+
+# Diploma_Self_study.cache: per-process LRU in front of the default cache
+TIERED_CACHE_LOCAL_SIZE = 1000  # Entries per process
+TIERED_CACHE_LOCAL_TTL = 30  # Seconds; upper bound on staleness if an invalidation message is lost
+TIERED_CACHE_LOCK_WAIT = 2  # Seconds a miss waits for another worker's recompute
+TIERED_CACHE_STATS_INTERVAL = 60  # Seconds between pushes of hit/miss counters to Redis
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -129,6 +208,9 @@ AUTH_PASSWORD_VALIDATORS = [
                 "password_validation.NumericPasswordValidator",
     },
 ]
+if 'test' in sys.argv:
+    # PBKDF2 would make every created user cost a few hundred milliseconds
+    PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
 
 
 LANGUAGE_CODE = "en-us"
@@ -146,6 +228,12 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 
 MEDIA_URL = "/media/"
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
+# Who sends media bytes after lms.media has checked access:
+# 'x-accel' (nginx, internal location MEDIA_ACCEL_PREFIX aliased to MEDIA_ROOT), 'x-sendfile' (Apache/lighttpd)
+# or 'django' (FileResponse, sendfile() through wsgi.file_wrapper)
+MEDIA_DELIVERY = os.getenv('MEDIA_DELIVERY', 'django')
+MEDIA_ACCEL_PREFIX = os.getenv('MEDIA_ACCEL_PREFIX', '/protected-media/')
+MEDIA_MAX_AGE = 60 * 60
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
@@ -155,4 +243,94 @@ CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",
     "http://127.0.0.1:3000",
 ]
-CORS_ALLOW_CREDENTIALS = True
\ No newline at end of file
+CORS_ALLOW_CREDENTIALS = True
+
+# Celery
+CELERY_BROKER_URL = os.getenv('CELERY_BROKER_URL', REDIS_URL)
+CELERY_RESULT_BACKEND = os.getenv('CELERY_RESULT_BACKEND', REDIS_URL)
+CELERY_TIMEZONE = TIME_ZONE
+CELERY_BEAT_SCHEDULER = 'django_celery_beat.schedulers:DatabaseScheduler'
+CELERY_BEAT_SCHEDULE = {
+    'compact-test-results': {
+        'task': 'lms.tasks.compact_test_results',
+        'schedule': crontab(hour=3, minute=0),
+    },
+    'ensure-test-result-partitions': {
+        'task': 'lms.tasks.ensure_test_result_partitions',
+        'schedule': crontab(day_of_month=1, hour=2, minute=0),
+    },
+    'prune-tombstones': {
+        'task': 'lms.tasks.prune_tombstones',
+        'schedule': crontab(hour=4, minute=0),
+    },
+    'build-course-recommendations': {
+        'task': 'lms.tasks.build_course_recommendations',
+        'schedule': crontab(hour=5, minute=0),
+    },
+    'finalize-expired-attempts': {
+        'task': 'lms.tasks.finalize_expired_attempts',
+        'schedule': crontab(minute='*/5'),
+    },
+    'flush-activity': {
+        'task': 'lms.tasks.flush_activity',
+        'schedule': 30.0,
+    },
+    'prune-activity-events': {
+        'task': 'lms.tasks.prune_activity_events',
+        'schedule': crontab(hour=4, minute=30),
+    },
+    'reconcile-pending-payments': {
+        'task': 'users.tasks.reconcile_pending_payments',
+        'schedule': crontab(minute='*/15'),
+    },
+}
+if 'test' in sys.argv:
+    CELERY_TASK_ALWAYS_EAGER = True
+
+# E-mail (lms.notifications); set EMAIL_BACKEND=django.core.mail.backends.smtp.EmailBackend in production
+EMAIL_BACKEND = os.getenv('EMAIL_BACKEND', 'django.core.mail.backends.console.EmailBackend')
+EMAIL_HOST = os.getenv('EMAIL_HOST', 'localhost')
+EMAIL_PORT = int(os.getenv('EMAIL_PORT', 25))
+EMAIL_HOST_USER = os.getenv('EMAIL_HOST_USER', '')
+EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD', '')
+EMAIL_USE_TLS = os.getenv('EMAIL_USE_TLS', 'False').lower() in ('true', '1', 'yes')
+EMAIL_TIMEOUT = 30
+DEFAULT_FROM_EMAIL = os.getenv('DEFAULT_FROM_EMAIL', 'webmaster@localhost')
+if 'test' in sys.argv:
+    EMAIL_BACKEND = 'django.core.mail.backends.locmem.EmailBackend'
+NOTIFICATION_CHUNK_SIZE = 500  # Recipients per task, all sent over one SMTP connection
+
+# Test results older than this are folded into TestResultSummary and moved to TestResultArchive
+TEST_RESULT_RETENTION_DAYS = int(os.getenv('TEST_RESULT_RETENTION_DAYS', 180))
+TEST_RESULT_COMPACTION_BATCH = 5000
+
+# Stripe. STRIPE_API_BASE points the client at a local stand-in such as stripe-mock (http://localhost:12111)
+STRIPE_SECRET_KEY = os.getenv('STRIPE_SECRET_KEY')
+STRIPE_WEBHOOK_SECRET = os.getenv('STRIPE_WEBHOOK_SECRET', '')
+STRIPE_API_BASE = os.getenv('STRIPE_API_BASE')
+STRIPE_CURRENCY = os.getenv('STRIPE_CURRENCY', 'rub')
+STRIPE_SUCCESS_URL = os.getenv('STRIPE_SUCCESS_URL', 'http://localhost:3000/payments/success')
+STRIPE_CANCEL_URL = os.getenv('STRIPE_CANCEL_URL', 'http://localhost:3000/payments/cancel')
+# Pending payments older than this are checked against Stripe in case the webhook was lost
+STRIPE_RECONCILE_AFTER_MINUTES = 30
+STRIPE_RECONCILE_BATCH = 100
+stripe.api_key = STRIPE_SECRET_KEY
+if STRIPE_API_BASE:
+    stripe.api_base = STRIPE_API_BASE
+
+# Bulk user import (users.importing): rows per bulk_create, password hashing processes of the import task.
+# More than 1 needs a Celery pool whose workers may fork (solo, threads): prefork children cannot.
+USER_IMPORT_BATCH_SIZE = 1000
+USER_IMPORT_WORKERS = int(os.getenv('USER_IMPORT_WORKERS', 1))
+
+# Test attempts (lms.attempts): time limit, delay of the expiry timer, how long Redis keeps the answers after it
+TEST_ATTEMPT_DURATION_MINUTES = int(os.getenv('TEST_ATTEMPT_DURATION_MINUTES', 60))
+TEST_ATTEMPT_GRACE_SECONDS = 5
+TEST_ATTEMPT_KEY_TTL = 60 * 60 * 24
+
+# Results scored per batch by lms.grading.regrade
+REGRADE_BATCH_SIZE = 5000
+
+# Co-enrollment recommendations: neighbours kept per course, minimum shared students per pair
+RECOMMENDATIONS_TOP_K = 10
+RECOMMENDATIONS_MIN_SUPPORT = 2
@@ -1,9 +1,11 @@
 from django.conf import settings
-from django.conf.urls.static import static
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from rest_framework_simplejwt.views import TokenRefreshView
 
+from lms.media import ProtectedMediaView
+from .profiling import ProfileDetailView, ProfileDownloadView, ProfileListView
+from .schema import OpenAPISchemaView
 from users.views import CustomTokenObtainPairView
 from django.http import HttpResponse
 
@@ -21,5 +23,14 @@ urlpatterns = [
     path('api/users/', include('users.urls')),
     path('api/token/', CustomTokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('api/schema/', OpenAPISchemaView.as_view(), name='openapi-schema'),
+    # Request profiles (Diploma_Self_study.profiling); user profiles live under api/users/profiles/
+    path('api/request-profiles/', ProfileListView.as_view(), name='request-profile-list'),
+    path('api/request-profiles/<str:profile_id>/', ProfileDetailView.as_view(), name='request-profile-detail'),
+    path('api/request-profiles/<str:profile_id>/download/', ProfileDownloadView.as_view(),
+         name='request-profile-download'),
+]
+# Media goes through an access check; the file itself is sent by nginx/Apache or sendfile()
+urlpatterns += [
+    re_path(rf'^{settings.MEDIA_URL.lstrip("/")}(?P<path>.+)$', ProtectedMediaView.as_view(), name='media'),
 ]
-urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -1,11 +1,14 @@
 import React, { useState, useEffect } from 'react';
 import { useNavigate } from 'react-router-dom';
 import axios from 'axios';
+import useSuggestions from '../utils/useSuggestions';
 
 const CourseList = () => {
   const [courses, setCourses] = useState([]);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
+  const [query, setQuery] = useState('');
+  const suggestions = useSuggestions(query, 'courses');
   const navigate = useNavigate();
 
   // Helper function to truncate text
@@ -107,6 +110,34 @@ const CourseList = () => {
           Get acquainted with our courses below.
         </p>
 
+        {/* Search: titles come from the typeahead endpoint, not from the loaded list */}
+        <div style={{ maxWidth: '500px', margin: '0 auto 30px' }}>
+          <input
+            type="search"
+            value={query}
+            onChange={(e) => setQuery(e.target.value)}
+            placeholder="Поиск курса"
+            style={{ width: '100%', padding: '10px', borderRadius: '5px', border: '1px solid #ccc' }}
+          />
+          {query.trim() && (
+            <ul style={{ listStyle: 'none', margin: 0, padding: 0, background: 'white', borderRadius: '5px' }}>
+              {suggestions.length > 0 ? (
+                suggestions.map((course) => (
+                  <li
+                    key={course.id}
+                    onClick={() => navigate(`/courses/${course.id}`)}
+                    style={{ padding: '10px', cursor: 'pointer', borderBottom: '1px solid #eee', color: '#333' }}
+                  >
+                    {course.title}
+                  </li>
+                ))
+              ) : (
+                <li style={{ padding: '10px', color: '#999' }}>Ничего не найдено</li>
+              )}
+            </ul>
+          )}
+        </div>
+
         {/* Error Message */}
         {error && (
           <div style={{
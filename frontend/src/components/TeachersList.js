@@ -1,30 +1,37 @@
 import React, { useState, useEffect } from 'react';
 import { useNavigate } from 'react-router-dom';
 import { getTeachers } from '../services/api';
+import useSuggestions from '../utils/useSuggestions';
 
 const TeachersList = () => {
   const [teachers, setTeachers] = useState([]);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
+  const [nextPage, setNextPage] = useState(null);
+  const [query, setQuery] = useState('');
+  const suggestions = useSuggestions(query, 'teachers');
   const navigate = useNavigate();
 
   // Helper function (must be outside JSX)
   const getInitials = (name) =>
     name.split(' ').map(word => word[0]).join('').toUpperCase().slice(0, 2);
 
+  // The directory is paginated: each page is appended to the list
+  const fetchTeachers = async (page = 1) => {
+    try {
+      const response = await getTeachers(page);
+      setTeachers((prev) => (page === 1 ? response.data.results : [...prev, ...response.data.results]));
+      setNextPage(response.data.next ? page + 1 : null);
+      setError(null);
+    } catch (err) {
+      console.error('Error fetching teachers:', err);
+      setError('Failed to load teachers. Please try again later.');
+    } finally {
+      setLoading(false);
+    }
+  };
+
   useEffect(() => {
-    const fetchTeachers = async () => {
-      try {
-        const response = await getTeachers();
-        setTeachers(response.data);
-        setError(null);
-      } catch (err) {
-        console.error('Error fetching teachers:', err);
-        setError('Failed to load teachers. Please try again later.');
-      } finally {
-        setLoading(false);
-      }
-    };
     fetchTeachers();
   }, []);
 
@@ -87,6 +94,30 @@ const TeachersList = () => {
         <div style={{ maxWidth: '1200px', margin: '0 auto' }}>
           <h1 style={{ color: 'green', textAlign: 'center', marginBottom: '10px' }}>Наши авторы</h1>
 
+          {/* Search: names come from the typeahead endpoint, the pages below are not scanned */}
+          <div style={{ maxWidth: '500px', margin: '0 auto 20px' }}>
+            <input
+              type="search"
+              value={query}
+              onChange={(e) => setQuery(e.target.value)}
+              placeholder="Поиск автора"
+              style={{ width: '100%', padding: '10px', borderRadius: '6px', border: '1px solid #ccc' }}
+            />
+            {query.trim() && (
+              <ul style={{ listStyle: 'none', margin: 0, padding: 0, background: 'white', borderRadius: '6px' }}>
+                {suggestions.length > 0 ? (
+                  suggestions.map((teacher) => (
+                    <li key={teacher.id} style={{ padding: '10px', borderBottom: '1px solid #eee' }}>
+                      {teacher.name}
+                    </li>
+                  ))
+                ) : (
+                  <li style={{ padding: '10px', color: '#999' }}>Никого не найдено</li>
+                )}
+              </ul>
+            )}
+          </div>
+
           <div className="teachers-grid">
             {teachers.map((teacher) => (
               <div key={teacher.id} className="teacher-card">
@@ -124,6 +155,14 @@ const TeachersList = () => {
               </div>
             ))}
           </div>
+
+          {nextPage && (
+            <div style={{ display: 'flex', justifyContent: 'center', marginTop: '20px' }}>
+              <button type="button" onClick={() => fetchTeachers(nextPage)}>
+                Показать ещё
+              </button>
+            </div>
+          )}
         </div>
       )}
     </div>
@@ -39,9 +39,18 @@ export const getMaterialDetails = (materialId) => api.get(`/materials/${material
 export const getTests = (courseId) => api.get(`/courses/${courseId}/tests/`);
 export const getTestDetails = (testId) => api.get(`/tests/${testId}/`);
 export const submitTestResult = (data) => api.post('/test-results/', data);
-
-
-export const getTeachers = () => api.get('/users/teachers/');
+// Test attempts: start (or resume), autosave single answers, submit
+export const startTestAttempt = (testId) => api.post(`/tests/${testId}/attempts/`);
+export const getTestAttempt = (attemptId) => api.get(`/attempts/${attemptId}/`);
+export const saveAttemptAnswers = (attemptId, answers) => api.patch(`/attempts/${attemptId}/answers/`, { answers });
+export const submitTestAttempt = (attemptId) => api.post(`/attempts/${attemptId}/submit/`);
+// Incremental sync: pass the watermark from the previous response, omit it for a full snapshot
+export const syncCourseData = (since) => api.get('/sync/', { params: since ? { since } : {} });
+
+
+export const getTeachers = (page = 1) => api.get('/users/teachers/', { params: { page } });
+// Typeahead: type is 'courses' or 'teachers', both when omitted
+export const getSuggestions = (q, type) => api.get('/search/suggest/', { params: type ? { q, type } : { q } });
 
 export const addMaterial = (courseId, data) =>
   api.post(`/courses/${courseId}/add-material/`, data, {
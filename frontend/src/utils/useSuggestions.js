@@ -0,0 +1,34 @@
+import { useEffect, useState } from 'react';
+import { getSuggestions } from '../services/api';
+
+// Typeahead: the server matches word prefixes, so the full list is never downloaded for a search.
+// type is 'courses' or 'teachers'; requests wait until typing pauses for `delay` ms.
+const useSuggestions = (query, type, delay = 250) => {
+  const [suggestions, setSuggestions] = useState([]);
+
+  useEffect(() => {
+    const q = query.trim();
+    if (!q) {
+      setSuggestions([]);
+      return undefined;
+    }
+    let cancelled = false;  // A slower earlier response must not replace the current one
+    const timer = setTimeout(async () => {
+      try {
+        const response = await getSuggestions(q, type);
+        if (!cancelled) setSuggestions(response.data[type] || []);
+      } catch (err) {
+        console.error('Error fetching suggestions:', err);
+        if (!cancelled) setSuggestions([]);
+      }
+    }, delay);
+    return () => {
+      cancelled = true;
+      clearTimeout(timer);
+    };
+  }, [query, type, delay]);
+
+  return suggestions;
+};
+
+export default useSuggestions;
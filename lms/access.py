@@ -0,0 +1,104 @@
+"""
+Course entitlements: CourseAccess holds one row per (user, course) with
+the reasons the user may open the course. Rows are refreshed by signals
+from enrollments, subscriptions, completed payments and course ownership,
+so permission checks are a single indexed lookup or a cached set lookup
+(two-tier: the set is usually found in the process, without a Redis call).
+"""
+from functools import reduce
+from operator import or_
+
+from django.db import transaction
+from django.db.models import Q
+
+from Diploma_Self_study.cache import tiered
+from users.models import Payment, Subscription
+from .models import Course, CourseAccess, Enrollment
+
+CACHE_KEY = 'course-access:{}'
+CACHE_TIMEOUT = 60 * 10
+
+SOURCE_FIELDS = ['via_enrollment', 'via_subscription', 'via_payment', 'via_ownership']
+
+
+def sources():
+    """Every entitlement source as (queryset, user field, course field)."""
+    return {
+        'via_enrollment': (Enrollment.objects.all(), 'user_id', 'course_id'),
+        'via_subscription': (Subscription.objects.all(), 'user_sub_id', 'course_id'),
+        'via_payment': (
+            Payment.objects.filter(status='completed', user__isnull=False, paid_course__isnull=False),
+            'user_id', 'paid_course_id',
+        ),
+        'via_ownership': (Course.objects.filter(owner__isnull=False), 'owner_id', 'id'),
+    }
+
+
+def refresh(pairs):
+    """Recompute the CourseAccess rows of the given (user_id, course_id) pairs."""
+    flags = {pair: dict.fromkeys(SOURCE_FIELDS, False) for pair in set(pairs) if None not in pair}
+    if not flags:
+        return
+    user_ids = {user_id for user_id, _ in flags}
+    course_ids = {course_id for _, course_id in flags}
+    for field, (queryset, user_field, course_field) in sources().items():
+        rows = queryset.filter(**{f'{user_field}__in': user_ids, f'{course_field}__in': course_ids})
+        for pair in rows.values_list(user_field, course_field):
+            if pair in flags:
+                flags[pair][field] = True
+
+    granted = [
+        CourseAccess(user_id=user_id, course_id=course_id, **reasons)
+        for (user_id, course_id), reasons in flags.items() if any(reasons.values())
+    ]
+    revoked = [pair for pair, reasons in flags.items() if not any(reasons.values())]
+    with transaction.atomic():
+        if revoked:
+            CourseAccess.objects.filter(
+                reduce(or_, (Q(user_id=user_id, course_id=course_id) for user_id, course_id in revoked))
+            ).delete()
+        if granted:
+            CourseAccess.objects.bulk_create(
+                granted, update_conflicts=True, unique_fields=['user', 'course'], update_fields=SOURCE_FIELDS,
+            )
+    tiered.delete(*[CACHE_KEY.format(user_id) for user_id in user_ids])
+
+
+def refresh_on_commit(pairs):
+    """Refresh once the surrounding transaction has committed the source rows."""
+    pairs = list(pairs)
+    transaction.on_commit(lambda: refresh(pairs))
+
+
+def rebuild():
+    """Recreate the whole table from the sources; returns the number of rows."""
+    flags = {}
+    for field, (queryset, user_field, course_field) in sources().items():
+        for pair in queryset.values_list(user_field, course_field).iterator(chunk_size=10000):
+            flags.setdefault(pair, set()).add(field)
+    with transaction.atomic():
+        user_ids = set(CourseAccess.objects.values_list('user_id', flat=True).distinct())
+        CourseAccess.objects.all().delete()
+        CourseAccess.objects.bulk_create(
+            [
+                CourseAccess(user_id=user_id, course_id=course_id, **{field: True for field in reasons})
+                for (user_id, course_id), reasons in flags.items()
+            ],
+            batch_size=5000,
+        )
+    user_ids.update(user_id for user_id, _ in flags)
+    tiered.delete(*[CACHE_KEY.format(user_id) for user_id in user_ids])
+    return len(flags)
+
+
+def accessible_course_ids(user_id):
+    """Ids of the courses the user may open, cached until their entitlements change."""
+    return tiered.get_or_set(
+        CACHE_KEY.format(user_id),
+        lambda: frozenset(CourseAccess.objects.filter(user_id=user_id).values_list('course_id', flat=True)),
+        CACHE_TIMEOUT,
+    )
+
+
+def has_access(user, course_id):
+    return user.is_authenticated and course_id in accessible_course_ids(user.pk)
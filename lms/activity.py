@@ -0,0 +1,212 @@
+"""
+Write-behind tracking of course and material views.
+
+Views are appended to a buffer instead of being inserted one by one:
+a Redis stream shared by all workers (flushed by the flush_activity beat
+task) or, with ACTIVITY_BACKEND = 'memory', a per-process ring buffer that
+the process flushes itself once it is full or old enough. A flush writes
+the batch with COPY on Postgres (bulk_create elsewhere) and recomputes the
+CourseActivityHourly rows of the hours it touched.
+"""
+import csv
+import io
+import logging
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Q
+from django.db.models.functions import TruncHour
+from django_redis import get_redis_connection
+from redis.exceptions import RedisError, ResponseError
+
+from .models import ActivityEvent, Course, CourseActivityHourly
+
+logger = logging.getLogger(__name__)
+
+STREAM_KEY = 'lms:activity'
+GROUP = 'activity-flush'
+CONSUMER = 'flusher'  # One name for every flush, so entries of a crashed flush are delivered again
+
+
+class RedisActivityBuffer:
+    """Events in a capped Redis stream, read through a consumer group."""
+
+    def __init__(self):
+        self.group_ready = False
+
+    def append(self, event):
+        get_redis_connection('default').xadd(
+            STREAM_KEY, {key: '' if value is None else value for key, value in event.items()},
+            maxlen=settings.ACTIVITY_STREAM_MAXLEN, approximate=True,
+        )
+        return False  # Flushed by the beat task
+
+    def read(self, count):
+        redis = get_redis_connection('default')
+        if not self.group_ready:
+            try:
+                redis.xgroup_create(STREAM_KEY, GROUP, id='0', mkstream=True)
+            except ResponseError:  # BUSYGROUP: created earlier
+                pass
+            self.group_ready = True
+        # Entries read but not acknowledged by an interrupted flush come first, then new ones
+        for start in ('0', '>'):
+            reply = redis.xreadgroup(GROUP, CONSUMER, {STREAM_KEY: start}, count=count)
+            entries = reply[0][1] if reply else []
+            if entries:
+                break
+        ids = [entry_id for entry_id, _ in entries]
+        events = [
+            {key.decode(): value.decode() or None for key, value in fields.items()}
+            for _, fields in entries
+        ]
+        return ids, events
+
+    def ack(self, ids):
+        if ids:
+            pipe = get_redis_connection('default').pipeline()
+            pipe.xack(STREAM_KEY, GROUP, *ids)
+            pipe.xdel(STREAM_KEY, *ids)
+            pipe.execute()
+
+
+class MemoryActivityBuffer:
+    """Per-process ring buffer, used in tests and local development; oldest events drop when full."""
+
+    def __init__(self):
+        self.events = deque(maxlen=settings.ACTIVITY_BUFFER_SIZE)
+        self.lock = threading.Lock()
+        self.flushed_at = time.monotonic()
+
+    def append(self, event):
+        with self.lock:
+            self.events.append(event)
+            return (len(self.events) >= settings.ACTIVITY_FLUSH_BATCH
+                    or time.monotonic() - self.flushed_at >= settings.ACTIVITY_FLUSH_INTERVAL)
+
+    def read(self, count):
+        with self.lock:
+            events = [self.events.popleft() for _ in range(min(count, len(self.events)))]
+            self.flushed_at = time.monotonic()
+        return [], events
+
+    def ack(self, ids):
+        pass
+
+
+ACTIVITY_BUFFER_BACKENDS = {
+    'redis': RedisActivityBuffer,
+    'memory': MemoryActivityBuffer,
+}
+_buffer = None
+
+
+def get_buffer():
+    global _buffer
+    if _buffer is None:
+        _buffer = ACTIVITY_BUFFER_BACKENDS[settings.ACTIVITY_BACKEND]()
+    return _buffer
+
+
+def record(kind, user, course_id, material_id=None):
+    """Buffer a view event; never fails the request that caused it."""
+    event = {
+        'kind': kind,
+        'user_id': user.pk if user.is_authenticated else None,
+        'course_id': course_id,
+        'material_id': material_id,
+        'ts': time.time(),
+    }
+    try:
+        flush_due = get_buffer().append(event)
+    except (RedisError, NotImplementedError):  # NotImplementedError: cache is not Redis
+        logger.warning("Could not buffer %s event", kind, exc_info=True)
+        return
+    if flush_due:
+        flush()
+
+
+def to_model(event):
+    # Values read back from the stream are strings
+    ids = {field: int(event[field]) if event.get(field) else None for field in ('user_id', 'course_id', 'material_id')}
+    return ActivityEvent(
+        kind=event['kind'], occurred_at=datetime.fromtimestamp(float(event['ts']), tz=dt_timezone.utc), **ids,
+    )
+
+
+def write_events(events):
+    """Insert a batch of ActivityEvents: COPY on Postgres, bulk_create elsewhere."""
+    if connection.vendor != 'postgresql':
+        ActivityEvent.objects.bulk_create(events, batch_size=settings.ACTIVITY_FLUSH_BATCH)
+        return
+    data = io.StringIO()
+    writer = csv.writer(data)
+    for event in events:
+        # An unquoted empty field is NULL in COPY's csv format
+        writer.writerow([
+            event.kind, event.user_id or '', event.course_id or '', event.material_id or '',
+            event.occurred_at.isoformat(),
+        ])
+    data.seek(0)
+    with connection.cursor() as cursor:
+        cursor.copy_expert(
+            f'COPY {ActivityEvent._meta.db_table} (kind, user_id, course_id, material_id, occurred_at) '
+            f'FROM STDIN WITH (FORMAT csv)',
+            data,
+        )
+
+
+def rollup(events):
+    """Recompute the hourly rows of the courses and hours present in the batch."""
+    buckets = {
+        (event.course_id, event.occurred_at.replace(minute=0, second=0, microsecond=0))
+        for event in events if event.course_id
+    }
+    if not buckets:
+        return
+    course_ids = set(Course.objects.filter(pk__in={course_id for course_id, _ in buckets}).values_list('pk', flat=True))
+    hours = [hour for _, hour in buckets]
+    rows = (
+        ActivityEvent.objects
+        .filter(course_id__in=course_ids, occurred_at__gte=min(hours), occurred_at__lt=max(hours) + timedelta(hours=1))
+        .annotate(hour=TruncHour('occurred_at', tzinfo=dt_timezone.utc))
+        .values('course_id', 'hour')
+        .annotate(
+            course_views=Count('id', filter=Q(kind='course_view')),
+            material_views=Count('id', filter=Q(kind='material_view')),
+            users=Count('user_id', distinct=True),
+        )
+    )
+    CourseActivityHourly.objects.bulk_create(
+        [
+            CourseActivityHourly(
+                course_id=row['course_id'], hour=row['hour'], course_views=row['course_views'],
+                material_views=row['material_views'], users=row['users'],
+            )
+            for row in rows if (row['course_id'], row['hour']) in buckets
+        ],
+        update_conflicts=True,
+        unique_fields=['course', 'hour'],
+        update_fields=['course_views', 'material_views', 'users'],
+    )
+
+
+def flush():
+    """Move buffered events to the database; returns how many were written."""
+    buffer = get_buffer()
+    written = 0
+    while True:
+        ids, events = buffer.read(settings.ACTIVITY_FLUSH_BATCH)
+        if not events:
+            return written
+        events = [to_model(event) for event in events]
+        with transaction.atomic():
+            write_events(events)
+            rollup(events)
+        # Acknowledged after the commit: a crash in between replays the batch rather than losing it
+        buffer.ack(ids)
+        written += len(events)
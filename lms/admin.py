@@ -1,34 +1,65 @@
 from django.contrib import admin
-from .models import Course, Material, Test, TestResult
+from .admin_utils import EstimatedCountPaginator, OwnerEmailFilter, CourseIdFilter, UserEmailFilter, TestIdFilter
+from .models import Course, Material, Test, TestResult, TestResultSummary
+
+# Big tables: estimated counts, no second full COUNT(*) for "Show all",
+# text-box filters instead of dropdowns over every user/course, and
+# prefix ('^') search that can use the UPPER(...) text_pattern_ops indexes.
 
 @admin.register(Course)
 class CourseAdmin(admin.ModelAdmin):
     list_display = ('id', 'title', 'price', 'owner', 'created_at')  # Columns shown in the list view
-    search_fields = ('title', 'description')  # Searchable fields
-    list_filter = ('owner', 'created_at')  # Filters on the right sidebar
+    search_fields = ('^title',)  # Prefix search by title (indexed)
+    list_filter = (OwnerEmailFilter, 'created_at')  # Filters on the right sidebar
+    list_select_related = ('owner',)
+    autocomplete_fields = ('owner',)
     readonly_fields = ('created_at', 'updated_at')  # Prevent editing timestamps
     ordering = ('-created_at',)  # Sort by newest first
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 @admin.register(Material)
 class MaterialAdmin(admin.ModelAdmin):
     list_display = ('id', 'title', 'price', 'course', 'owner', 'created_at')  # Includes course for context
-    search_fields = ('title', 'content')  # Search in title/content
-    list_filter = ('course', 'owner', 'created_at')  # Filter by course/owner
+    search_fields = ('^title',)  # Prefix search by title (indexed)
+    list_filter = (CourseIdFilter, OwnerEmailFilter, 'created_at')  # Filter by course/owner
+    list_select_related = ('course', 'owner')
+    autocomplete_fields = ('course', 'owner')
     readonly_fields = ('created_at',)  # Prevent editing created_at
     ordering = ('course', 'id')  # Group by course, then ID
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 @admin.register(Test)
 class TestAdmin(admin.ModelAdmin):
     list_display = ('id', 'material', 'owner', 'created_at')  # Shows linked material
-    search_fields = ('material__title',)  # Search via material title (uses related field lookup)
-    list_filter = ('owner', 'created_at')  # Filter by owner/date
+    search_fields = ('^material__title',)  # Prefix search via material title
+    list_filter = (OwnerEmailFilter, 'created_at')  # Filter by owner/date
+    list_select_related = ('material', 'owner')
+    autocomplete_fields = ('material', 'owner')
     readonly_fields = ('created_at',)  # Prevent editing created_at
     ordering = ('-created_at',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 @admin.register(TestResult)
 class TestResultAdmin(admin.ModelAdmin):
     list_display = ('id', 'user', 'test', 'score', 'passed', 'completed_at')  # Key result info
-    search_fields = ('user__username', 'test__material__title')  # Search by user or material
-    list_filter = ('passed', 'completed_at')  # Filter by pass status/date
+    search_fields = ('^user__email', '^test__material__title')  # Prefix search by user or material
+    list_filter = (UserEmailFilter, TestIdFilter, 'passed', 'completed_at')  # Filter by user/test/pass status/date
+    list_select_related = ('user', 'test__material')
+    raw_id_fields = ('user', 'test')
     readonly_fields = ('completed_at',)  # Prevent editing completed_at
-    ordering = ('-completed_at',)
+    ordering = ('-completed_at',)  # Uses the completed_at index
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+@admin.register(TestResultSummary)
+class TestResultSummaryAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'test', 'attempts', 'best_score', 'passed', 'last_completed_at')
+    raw_id_fields = ('user', 'test')  # Avoid dropdowns over every user/test
+    list_select_related = ('user', 'test__material')
+    readonly_fields = ('attempts', 'best_score', 'passed', 'last_completed_at')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
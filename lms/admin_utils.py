@@ -0,0 +1,84 @@
+from django.contrib import admin
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import QuerySet
+from django.utils.functional import cached_property
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that takes the row count from the Postgres planner estimate
+    for large result sets instead of running an exact COUNT(*).
+    """
+    exact_count_limit = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if isinstance(queryset, QuerySet) and connections[queryset.db].vendor == 'postgresql':
+            sql, params = queryset.query.sql_with_params()
+            with connections[queryset.db].cursor() as cursor:
+                cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+                estimate = int(cursor.fetchone()[0][0]['Plan']['Plan Rows'])
+            if estimate > self.exact_count_limit:
+                return estimate
+        return super().count
+
+
+class InputFilter(admin.SimpleListFilter):
+    """
+    List filter with a text box instead of a dropdown of every related object.
+    Subclasses set title, parameter_name and the ORM lookup to match the value with.
+    """
+    template = 'admin/input_filter.html'
+    lookup = None
+
+    def lookups(self, request, model_admin):
+        # The choices are typed in, nothing to list
+        return ()
+
+    def has_output(self):
+        return True
+
+    def queryset(self, request, queryset):
+        value = self.value()
+        if value:
+            try:
+                return queryset.filter(**{self.lookup: value.strip()})
+            except (ValueError, ValidationError) as e:
+                raise IncorrectLookupParameters(e)
+        return queryset
+
+    def choices(self, changelist):
+        choice = next(super().choices(changelist))
+        # Keep the other filters, search and ordering when the box is submitted
+        choice['hidden_params'] = [
+            (key, value) for key, value in changelist.params.items() if key != self.parameter_name
+        ]
+        yield choice
+
+
+class OwnerEmailFilter(InputFilter):
+    title = 'автору (email)'
+    parameter_name = 'owner_email'
+    lookup = 'owner__email'
+
+
+class CourseIdFilter(InputFilter):
+    title = 'курсу (ID)'
+    parameter_name = 'course_id'
+    lookup = 'course_id'
+
+
+class UserEmailFilter(InputFilter):
+    title = 'пользователю (email)'
+    parameter_name = 'user_email'
+    lookup = 'user__email'
+
+
+class TestIdFilter(InputFilter):
+    title = 'тесту (ID)'
+    parameter_name = 'test_id'
+    lookup = 'test_id'
@@ -0,0 +1,147 @@
+"""
+Test attempts with server-side deadlines. While an attempt is running its
+answers live in a Redis hash (one HSET per autosave, no database access);
+submit or the expiry timer turns them into a single TestResult.
+"""
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from django_redis import get_redis_connection
+
+from .grading import PASS_SCORE, answer_slots, calculate_score, compiled_test
+from .models import TestAttempt, TestResult
+from .notifications import notify
+
+META_KEY = 'attempt:{}:meta'
+ANSWERS_KEY = 'attempt:{}:answers'
+
+# KEYS[1] - meta hash, KEYS[2] - answers hash; ARGV[1] - user id, then question/answer pairs.
+# The meta hash holds a 'slot:<key>' field for every key an answer may be stored under
+# (attempts started before slots were recorded have no 'questions' field and skip the check).
+# Returns the number of saved answers or a negative error code.
+SAVE_SCRIPT = """
+local meta = redis.call('HMGET', KEYS[1], 'user', 'deadline', 'questions')
+if not meta[1] then
+    return -1
+end
+if meta[1] ~= ARGV[1] then
+    return -2
+end
+if tonumber(redis.call('TIME')[1]) >= tonumber(meta[2]) then
+    return -3
+end
+if meta[3] then
+    for i = 2, #ARGV, 2 do
+        if redis.call('HEXISTS', KEYS[1], 'slot:' .. ARGV[i]) == 0 then
+            return -4
+        end
+    end
+end
+redis.call('HSET', KEYS[2], unpack(ARGV, 2))
+redis.call('EXPIRE', KEYS[2], redis.call('TTL', KEYS[1]))
+return (#ARGV - 1) / 2
+"""
+
+SAVE_ERRORS = {
+    -1: 'not_found',  # Unknown attempt or already finalized
+    -2: 'forbidden',
+    -3: 'expired',
+    -4: 'unknown_question',
+}
+
+
+def get_connection():
+    return get_redis_connection('default')
+
+
+def start(user, test):
+    """Return the running attempt of the user for the test or start a new one."""
+    attempt = TestAttempt.objects.filter(user=user, test=test, status='active').first()
+    if attempt is not None and attempt.deadline > timezone.now():
+        return attempt, False
+    if attempt is not None:
+        finalize(attempt.pk, status='expired')
+
+    try:
+        # The row is rolled back if Redis fails, an active attempt always has its meta hash
+        with transaction.atomic():
+            attempt = TestAttempt.objects.create(
+                user=user, test=test,
+                deadline=timezone.now() + timedelta(minutes=settings.TEST_ATTEMPT_DURATION_MINUTES),
+            )
+            slots = answer_slots(test.questions or [])
+            ttl = int((attempt.deadline - timezone.now()).total_seconds()) + settings.TEST_ATTEMPT_KEY_TTL
+            pipe = get_connection().pipeline()
+            pipe.hset(META_KEY.format(attempt.pk), mapping={
+                'user': str(user.pk), 'test': str(test.pk), 'deadline': int(attempt.deadline.timestamp()),
+                'questions': len(slots), **{f'slot:{key}': 1 for keys in slots for key in keys},
+            })
+            pipe.expire(META_KEY.format(attempt.pk), ttl)
+            pipe.delete(ANSWERS_KEY.format(attempt.pk))
+            pipe.execute()
+    except IntegrityError:
+        # unique_active_test_attempt: a concurrent request (a double click) started it first
+        return TestAttempt.objects.get(user=user, test=test, status='active'), False
+
+    from .tasks import finalize_expired_attempt  # Avoid circular imports
+    transaction.on_commit(lambda: finalize_expired_attempt.apply_async(
+        (attempt.pk,), eta=attempt.deadline + timedelta(seconds=settings.TEST_ATTEMPT_GRACE_SECONDS),
+    ))
+    return attempt, True
+
+
+def save_answers(attempt_id, user_id, answers):
+    """Store answers ({question key: answer}); returns the count saved or an error name."""
+    args = [str(user_id)]
+    for question, answer in answers.items():
+        args += [str(question), json.dumps(answer)]
+    saved = get_connection().eval(SAVE_SCRIPT, 2, META_KEY.format(attempt_id), ANSWERS_KEY.format(attempt_id), *args)
+    return SAVE_ERRORS[saved] if saved < 0 else saved
+
+
+def state(attempt_id):
+    """Meta data and saved answers of a running attempt, None once it is finalized."""
+    pipe = get_connection().pipeline()
+    pipe.hgetall(META_KEY.format(attempt_id))
+    pipe.hgetall(ANSWERS_KEY.format(attempt_id))
+    meta, answers = pipe.execute()
+    if not meta:
+        return None
+    return {
+        'user': meta[b'user'].decode(),
+        'test': int(meta[b'test']),
+        'deadline': int(meta[b'deadline']),
+        'answers': {key.decode(): json.loads(value) for key, value in answers.items()},
+    }
+
+
+def finalize(attempt_id, status='submitted'):
+    """
+    Grade the saved answers into one TestResult. Safe to call twice: an
+    attempt that is no longer active keeps its first result.
+    """
+    with transaction.atomic():
+        attempt = TestAttempt.objects.select_for_update().select_related('test').filter(pk=attempt_id).first()
+        if attempt is None or attempt.status != 'active':
+            return attempt
+        saved = state(attempt.pk)
+        answers = saved['answers'] if saved else {}
+        score = calculate_score(attempt.test.questions, answers)
+        attempt.result = TestResult.objects.create(
+            user_id=attempt.user_id, test=attempt.test, answers=answers, score=score, passed=score >= PASS_SCORE,
+        )
+        attempt.status = 'expired' if status == 'expired' or timezone.now() >= attempt.deadline else status
+        attempt.save(update_fields=['result', 'status'])
+        notify('test_graded', {
+            'material': compiled_test(attempt.test_id)['material'],
+            'score': score, 'passed': attempt.result.passed,
+        }, user_ids=[attempt.user_id])
+        # robust: the result is committed, keys left behind by a Redis failure expire with their TTL
+        transaction.on_commit(
+            lambda: get_connection().delete(META_KEY.format(attempt.pk), ANSWERS_KEY.format(attempt.pk)),
+            robust=True,
+        )
+    return attempt
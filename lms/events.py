@@ -0,0 +1,80 @@
+import asyncio
+import json
+import logging
+
+import redis.asyncio as aioredis
+from django.conf import settings
+from django.db import transaction
+from django_redis import get_redis_connection
+from redis.exceptions import RedisError
+
+logger = logging.getLogger(__name__)
+
+EVENTS_CHANNEL = 'lms:events'
+
+
+def publish_event(event_type, data, user_id=None, course_id=None):
+    """
+    Publish an event for one user or for everyone enrolled in a course,
+    once the current transaction commits.
+    """
+    message = json.dumps({'type': event_type, 'data': data, 'user': user_id, 'course': course_id})
+
+    def send():
+        try:
+            get_redis_connection('default').publish(EVENTS_CHANNEL, message)
+        except (RedisError, NotImplementedError):  # NotImplementedError: cache is not Redis (tests)
+            logger.warning("Could not publish %s event", event_type, exc_info=True)
+
+    transaction.on_commit(send)
+
+
+class EventBroker:
+    """
+    Per-process fan-out of the events channel: one Redis subscription per
+    worker, events are routed to the local queues of connected clients.
+    """
+    queue_size = 100
+
+    def __init__(self):
+        self.listeners = {}  # queue -> (user_id, set of enrolled course ids)
+        self.reader = None
+
+    def subscribe(self, user_id, course_ids):
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self.listeners[queue] = (user_id, set(course_ids))
+        if self.reader is None or self.reader.done():
+            self.reader = asyncio.get_running_loop().create_task(self.read())
+        return queue
+
+    def unsubscribe(self, queue):
+        self.listeners.pop(queue, None)
+
+    async def read(self):
+        while True:
+            try:
+                async with aioredis.from_url(settings.REDIS_URL) as client, client.pubsub() as pubsub:
+                    await pubsub.subscribe(EVENTS_CHANNEL)
+                    async for message in pubsub.listen():
+                        if message['type'] == 'message':
+                            self.dispatch(json.loads(message['data']))
+            except RedisError:
+                logger.warning("Events subscription lost, reconnecting", exc_info=True)
+                await asyncio.sleep(1)
+
+    def dispatch(self, event):
+        for queue, (user_id, course_ids) in self.listeners.items():
+            if event['user'] is not None:
+                if event['user'] != user_id:
+                    continue
+                if event['type'] == 'enrollment_confirmed':
+                    course_ids.add(event['course'])
+            elif event['course'] not in course_ids:
+                continue
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                logger.warning("Dropping %s event for slow client of user %s", event['type'], user_id)
+
+
+broker = EventBroker()
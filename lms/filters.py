@@ -0,0 +1,17 @@
+from rest_framework.filters import BaseFilterBackend
+
+
+class PermissionQuerysetFilter(BaseFilterBackend):
+    """
+    Applies object-level permission rules to list endpoints in SQL.
+    DRF never calls has_object_permission for lists, so permissions that can
+    express their rule as a queryset filter provide filter_queryset().
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        if getattr(view, 'action', None) != 'list':
+            return queryset
+        for permission in view.get_permissions():
+            if hasattr(permission, 'filter_queryset'):
+                queryset = permission.filter_queryset(request, queryset, view)
+        return queryset
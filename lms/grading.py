@@ -0,0 +1,194 @@
+"""
+Test grading. Answers are matched against Test.questions
+([{"id": 1, "question": "...", "answers": ["A", "B"], "correct": "A"}, ...]);
+the frontend keys answers by question id, older results by "question1", ...
+or by the question index.
+
+Scoring is vectorized: a batch of submissions becomes an integer matrix
+of chosen options (one row per result, one column per question) that is
+compared with the answer key in one numpy operation. Submissions use the
+compiled test (questions, course and answer key) from the two-tier cache,
+so a grading request does not read the test from the database.
+"""
+import json
+import zlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from Diploma_Self_study.cache import tiered
+from .models import Test, TestResult, TestResultArchive, TestResultSummary
+
+PASS_SCORE = 70  # Процент правильных ответов для зачёта
+
+MISSING = -1  # No answer given
+UNKNOWN = -2  # Answer that is not among the options
+NO_KEY = -3  # Question without a correct answer, never matches
+
+# Bump the version when the cached dict changes shape: entries of the previous deploy are then ignored
+COMPILED_TEST_KEY = 'test:{}:compiled:v2'
+COMPILED_TEST_TIMEOUT = 60 * 60
+
+
+def answer_slots(questions):
+    """Keys under which the answer to each question can be stored."""
+    slots = []
+    for index, question in enumerate(questions):
+        keys = [f'question{index + 1}']
+        if 'id' in question:
+            keys.insert(0, str(question['id']))
+        else:
+            keys.append(str(index))
+        slots.append(keys)
+    return slots
+
+
+def answer_key(questions):
+    """Option codes per question and the code of the correct option."""
+    options = []
+    key = np.full(len(questions), NO_KEY, dtype=np.int32)
+    for index, question in enumerate(questions):
+        codes = {str(answer): code for code, answer in enumerate(question.get('answers') or [])}
+        correct = question.get('correct')
+        if correct is not None:
+            key[index] = codes.setdefault(str(correct), len(codes))
+        options.append(codes)
+    return options, key
+
+
+def compile_questions(questions):
+    """Answer key and answer slots, reusable for any number of submissions."""
+    options, key = answer_key(questions)
+    return options, key, answer_slots(questions)
+
+
+def grade_batch(questions, submissions, compiled=None):
+    """Scores (0-100) for a list of answer dicts against the questions."""
+    if not questions:
+        return np.zeros(len(submissions))
+    options, key, slots = compiled or compile_questions(questions)
+    chosen = np.full((len(submissions), len(questions)), MISSING, dtype=np.int32)
+    for row, answers in enumerate(submissions):
+        if not isinstance(answers, dict):
+            continue
+        for column, keys in enumerate(slots):
+            for name in keys:
+                if name in answers:
+                    chosen[row, column] = options[column].get(str(answers[name]), UNKNOWN)
+                    break
+    correct = (chosen == key).sum(axis=1)
+    return np.round(correct * 100.0 / len(questions), 2)
+
+
+def calculate_score(questions, answers, compiled=None):
+    return float(grade_batch(questions, [answers], compiled)[0])
+
+
+def compiled_test(test_id):
+    """Questions, course id, material title and compiled answer key of a test; None if it does not exist."""
+    def compute():
+        test = Test.objects.filter(pk=test_id).values('questions', 'material__course_id', 'material__title').first()
+        if test is None:
+            return None
+        questions = test['questions'] or []
+        return {
+            'id': test_id,
+            'course_id': test['material__course_id'],
+            'material': test['material__title'],
+            'questions': questions,
+            'compiled': compile_questions(questions),
+        }
+    return tiered.get_or_set(COMPILED_TEST_KEY.format(test_id), compute, COMPILED_TEST_TIMEOUT)
+
+
+def invalidate_compiled_tests(test_ids):
+    tiered.delete(*[COMPILED_TEST_KEY.format(test_id) for test_id in test_ids])
+
+
+def regrade(test, batch_size=5000, workers=1):
+    """
+    Re-score every stored result of the test against its current answer key.
+    Results are streamed with .iterator() and scored in batches, on a process
+    pool when workers > 1; only rows whose score or pass flag changed are
+    written back with bulk_update. Returns (checked, updated).
+    """
+    questions = test.questions or []
+    rows = TestResult.objects.filter(test=test).only('id', 'answers', 'score', 'passed').iterator(chunk_size=batch_size)
+    checked = updated = 0
+
+    def write(batch, scores):
+        changed = []
+        for result, score in zip(batch, scores.tolist()):
+            passed = score >= PASS_SCORE
+            if result.score != score or result.passed != passed:
+                result.score, result.passed = score, passed
+                changed.append(result)
+        TestResult.objects.bulk_update(changed, ['score', 'passed'], batch_size=batch_size)
+        return len(changed)
+
+    def batches():
+        batch = []
+        for result in rows:
+            batch.append(result)
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    if workers <= 1:
+        for batch in batches():
+            updated += write(batch, grade_batch(questions, [result.answers for result in batch]))
+            checked += len(batch)
+        return checked, updated
+
+    # Workers only score; reading and writing stay in this process and its DB connection.
+    # At most 2 * workers batches are in flight, so memory does not grow with the table.
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for batch in batches():
+            pending.append((batch, pool.submit(grade_batch, questions, [result.answers for result in batch])))
+            if len(pending) >= 2 * workers:
+                done, future = pending.popleft()
+                updated += write(done, future.result())
+                checked += len(done)
+        while pending:
+            done, future = pending.popleft()
+            updated += write(done, future.result())
+            checked += len(done)
+    return checked, updated
+
+
+def regrade_summaries(test):
+    """
+    Re-score the compacted results of the test from their TestResultArchive
+    blobs and correct best_score and passed of its TestResultSummary rows, so
+    leaderboards rebuilt after a re-grade rank older users by the new key too.
+    Archives are not indexed by test, so every archive is read once per call.
+    Returns the number of summaries updated.
+    """
+    summaries = {summary.user_id: summary for summary in TestResultSummary.objects.filter(test=test)}
+    if not summaries:
+        return 0
+    questions = test.questions or []
+    best = {}
+    for data in TestResultArchive.objects.values_list('data', flat=True).iterator(chunk_size=10):
+        rows = [
+            row for row in map(json.loads, zlib.decompress(data).splitlines())
+            if row['test_id'] == test.pk and row['user_id'] in summaries
+        ]
+        if not rows:
+            continue
+        for row, score in zip(rows, grade_batch(questions, [row['answers'] for row in rows]).tolist()):
+            best[row['user_id']] = max(best.get(row['user_id'], score), score)
+
+    changed = []
+    for user_id, score in best.items():
+        summary = summaries[user_id]
+        passed = score >= PASS_SCORE
+        if summary.best_score != score or summary.passed != passed:
+            summary.best_score, summary.passed = score, passed
+            changed.append(summary)
+    TestResultSummary.objects.bulk_update(changed, ['best_score', 'passed'])
+    return len(changed)
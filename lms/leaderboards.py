@@ -0,0 +1,129 @@
+"""Per-test and per-course leaderboards kept in Redis sorted sets."""
+import logging
+
+from django.db.models import Max
+from django_redis import get_redis_connection
+from redis.exceptions import RedisError
+
+from .models import TestResult, TestResultSummary, Test
+
+logger = logging.getLogger(__name__)
+
+TEST_KEY = 'leaderboard:test:{}'
+COURSE_KEY = 'leaderboard:course:{}'
+
+# A course score is the sum of the user's best scores on the course tests,
+# so it grows by the improvement of the test best score.
+# KEYS[1] - test set, KEYS[2] - course set (optional); ARGV[1] - user id, ARGV[2] - score
+RECORD_SCRIPT = """
+local old = tonumber(redis.call('ZSCORE', KEYS[1], ARGV[1]))
+local new = tonumber(ARGV[2])
+if old and old >= new then
+    return 0
+end
+redis.call('ZADD', KEYS[1], new, ARGV[1])
+if KEYS[2] then
+    redis.call('ZINCRBY', KEYS[2], new - (old or 0), ARGV[1])
+end
+return 1
+"""
+
+
+def get_connection():
+    return get_redis_connection('default')
+
+
+def record_score(user_id, test_id, course_id, score):
+    """Update the leaderboards with a new result if it beats the user's best."""
+    keys = [TEST_KEY.format(test_id)]
+    if course_id is not None:
+        keys.append(COURSE_KEY.format(course_id))
+    try:
+        get_connection().eval(RECORD_SCRIPT, len(keys), *keys, user_id, score)
+    except (RedisError, NotImplementedError):  # NotImplementedError: cache is not Redis (tests)
+        logger.warning("Could not update leaderboards for test %s", test_id, exc_info=True)
+
+
+def standings(key, user_id, limit):
+    """Top `limit` entries plus the user's rank and percentile, O(log N) each."""
+    connection = get_connection()
+    pipe = connection.pipeline(transaction=False)
+    pipe.zrevrange(key, 0, limit - 1, withscores=True)
+    pipe.zrevrank(key, user_id)
+    pipe.zscore(key, user_id)
+    pipe.zcard(key)
+    top, rank, score, total = pipe.execute()
+
+    me = None
+    if rank is not None:
+        me = {
+            'rank': rank + 1,
+            'score': score,
+            # Share of the other participants ranked below the user
+            'percentile': round(100 * (total - rank - 1) / max(total - 1, 1), 1),
+        }
+    return {
+        'total': total,
+        'top': [
+            {'rank': position, 'user': int(member), 'score': member_score}
+            for position, (member, member_score) in enumerate(top, start=1)
+        ],
+        'me': me,
+    }
+
+
+def rebuild(test_ids=None):
+    """
+    Recreate leaderboards from live results and compacted summaries: all of
+    them, or only the boards of the given tests and of their courses.
+    """
+    test_courses = Test.objects.values_list('id', 'material__course_id')
+    live = TestResult.objects.filter(user__isnull=False)
+    compacted = TestResultSummary.objects.all()
+    if test_ids is not None:
+        course_ids = set(Test.objects.filter(pk__in=test_ids).values_list('material__course_id', flat=True))
+        # A course score sums the best scores of every test of the course
+        test_courses = test_courses.filter(material__course_id__in=course_ids)
+        live = live.filter(test__material__course_id__in=course_ids)
+        compacted = compacted.filter(test__material__course_id__in=course_ids)
+    test_courses = dict(test_courses)
+
+    best = {}
+    live = live.values('user_id', 'test_id').annotate(best=Max('score'))
+    compacted = compacted.values_list('user_id', 'test_id', 'best_score')
+    for user_id, test_id, score in [(row['user_id'], row['test_id'], row['best']) for row in live] + list(compacted):
+        key = (user_id, test_id)
+        best[key] = max(best.get(key, score), score)
+
+    tests, courses = {}, {}
+    for (user_id, test_id), score in best.items():
+        tests.setdefault(test_id, {})[user_id] = score
+        course_id = test_courses.get(test_id)
+        if course_id is not None:
+            course = courses.setdefault(course_id, {})
+            course[user_id] = course.get(user_id, 0) + score
+
+    connection = get_connection()
+    if test_ids is None:
+        stale = set(connection.scan_iter(match='leaderboard:*'))
+    else:
+        # Boards left without results are deleted below, the other tests of the courses keep theirs
+        tests = {test_id: tests.get(test_id, {}) for test_id in test_ids}
+        courses = {course_id: courses.get(course_id, {}) for course_id in course_ids if course_id is not None}
+        stale = set()
+    pipe = connection.pipeline()
+    for key_format, boards in [(TEST_KEY, tests), (COURSE_KEY, courses)]:
+        for object_id, scores in boards.items():
+            key = key_format.format(object_id)
+            if not scores:
+                pipe.delete(key)
+                continue
+            # Build under a temporary key and swap it in, so readers never see a half-built board
+            pipe.delete(key + ':rebuild')
+            pipe.zadd(key + ':rebuild', scores)
+            pipe.rename(key + ':rebuild', key)
+            stale.discard(key.encode())
+    if stale:
+        pipe.delete(*stale)
+    pipe.execute()
+    return len(tests), len(courses)
@@ -0,0 +1,94 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+
+from lms.models import Course, Material, Test, TestResult
+from lms.renderers import ORJSONRenderer
+from lms.serializers import (
+    CourseSerializer, CourseValuesSerializer, TestResultSerializer, TestResultValuesSerializer,
+)
+
+User = get_user_model()
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "Compare ModelSerializer + JSONRenderer with ValuesSerializer + ORJSONRenderer on generated data"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--courses', type=int, default=200)
+        parser.add_argument('--materials', type=int, default=10, help="Materials per course")
+        parser.add_argument('--results', type=int, default=5000)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        # Everything is generated inside a transaction that is always rolled back
+        try:
+            with transaction.atomic():
+                self.populate(options)
+                self.compare(
+                    "courses",
+                    lambda: JSONRenderer().render(
+                        CourseSerializer(Course.objects.prefetch_related('materials'), many=True).data),
+                    lambda: ORJSONRenderer().render(CourseValuesSerializer(Course.objects.all()).data),
+                    options['repeat'],
+                )
+                self.compare(
+                    "test results",
+                    lambda: JSONRenderer().render(TestResultSerializer(TestResult.objects.all(), many=True).data),
+                    lambda: ORJSONRenderer().render(TestResultValuesSerializer(TestResult.objects.all()).data),
+                    options['repeat'],
+                )
+                raise Rollback
+        except Rollback:
+            pass
+
+    def populate(self, options):
+        owner = User.objects.create_user(
+            username='benchmark-teacher@example.com', email='benchmark-teacher@example.com', role='teacher')
+        student = User.objects.create_user(
+            username='benchmark-student@example.com', email='benchmark-student@example.com')
+        courses = Course.objects.bulk_create(
+            Course(title=f"Course {i}", description="Описание " * 20, price=100, owner=owner)
+            for i in range(options['courses'])
+        )
+        materials = Material.objects.bulk_create(
+            Material(title=f"Material {i}", content="Текст " * 50, course=course, owner=owner,
+                     illustration=f"lms/illustrations/{i}.png")
+            for course in courses
+            for i in range(options['materials'])
+        )
+        questions = [{"question": f"Q{i}?", "answers": ["A", "B", "C"], "correct": "A"} for i in range(10)]
+        test = Test.objects.create(material=materials[0], questions=questions, owner=owner)
+        answers = {f"question{i + 1}": "A" for i in range(10)}
+        TestResult.objects.bulk_create(
+            TestResult(user=student, test=test, answers=answers, score=100, passed=True)
+            for _ in range(options['results'])
+        )
+
+    def compare(self, label, baseline, fast, repeat):
+        if baseline() != fast():
+            self.stdout.write(self.style.WARNING(f"{label}: outputs differ"))
+        baseline_time = self.measure(baseline, repeat)
+        fast_time = self.measure(fast, repeat)
+        self.stdout.write(
+            f"{label}: ModelSerializer {baseline_time * 1000:.1f} ms, "
+            f"ValuesSerializer {fast_time * 1000:.1f} ms, "
+            f"speedup x{baseline_time / fast_time:.1f}"
+        )
+
+    @staticmethod
+    def measure(func, repeat):
+        best = None
+        for _ in range(repeat):
+            start = time.process_time()
+            func()
+            elapsed = time.process_time() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best
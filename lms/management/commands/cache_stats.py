@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from Diploma_Self_study.cache import tiered
+
+
+class Command(BaseCommand):
+    help = "Show hit/miss counters of the two-tier cache summed over all processes"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help="Reset the counters after printing them")
+
+    def handle(self, *args, **options):
+        for name, value in sorted(tiered.stats().items()):
+            self.stdout.write(f"{name}: {value}")
+        if options['reset']:
+            tiered.reset_stats()
+            self.stdout.write(self.style.SUCCESS("Counters reset"))
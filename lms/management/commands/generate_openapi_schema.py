@@ -0,0 +1,12 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from Diploma_Self_study.schema import write_schema_file
+
+
+class Command(BaseCommand):
+    help = "Generate the OpenAPI document served at /api/schema/ (run on every deploy)"
+
+    def handle(self, *args, **options):
+        size = write_schema_file()
+        self.stdout.write(self.style.SUCCESS(f"Wrote {size} bytes to {settings.OPENAPI_SCHEMA_FILE}"))
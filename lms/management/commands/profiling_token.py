@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+
+from Diploma_Self_study.profiling import make_token
+
+
+class Command(BaseCommand):
+    help = "Print a signed token for the X-Profile header that makes a request get profiled"
+
+    def handle(self, *args, **options):
+        self.stdout.write(make_token())
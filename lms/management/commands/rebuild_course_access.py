@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from lms import access
+
+
+class Command(BaseCommand):
+    help = "Rebuild the CourseAccess entitlements from enrollments, subscriptions, payments and course owners"
+
+    def handle(self, *args, **options):
+        rows = access.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rows} course access rows"))
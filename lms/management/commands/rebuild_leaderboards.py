@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from lms import leaderboards
+
+
+class Command(BaseCommand):
+    help = "Rebuild the Redis test and course leaderboards from TestResult and TestResultSummary"
+
+    def handle(self, *args, **options):
+        tests, courses = leaderboards.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {tests} test and {courses} course leaderboards"))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from lms import search
+
+
+class Command(BaseCommand):
+    help = "Rebuild the Redis typeahead indexes of course titles and teacher names"
+
+    def handle(self, *args, **options):
+        counts = search.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            ', '.join(f"{count} {name}" for name, count in counts.items()) + " indexed"
+        ))
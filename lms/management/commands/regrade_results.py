@@ -0,0 +1,37 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from lms.grading import regrade, regrade_summaries
+from lms.models import Test
+from lms.tasks import rebuild_leaderboards
+
+
+class Command(BaseCommand):
+    help = "Re-score stored TestResults against the current answer keys of the given tests"
+
+    def add_arguments(self, parser):
+        parser.add_argument('test_ids', nargs='+', type=int)
+        parser.add_argument('--batch-size', type=int, default=settings.REGRADE_BATCH_SIZE)
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help="Scoring processes; 1 scores in this process")
+
+    def handle(self, *args, **options):
+        tests = Test.objects.in_bulk(options['test_ids'])
+        missing = set(options['test_ids']) - set(tests)
+        if missing:
+            raise CommandError(f"Tests not found: {', '.join(map(str, sorted(missing)))}")
+
+        total_updated, changed = 0, []
+        for test_id in options['test_ids']:
+            checked, updated = regrade(tests[test_id], batch_size=options['batch_size'], workers=options['workers'])
+            summaries = regrade_summaries(tests[test_id])
+            total_updated += updated + summaries
+            if updated or summaries:
+                changed.append(test_id)
+            self.stdout.write(f"Test {test_id}: {checked} results checked, {updated} updated, "
+                              f"{summaries} archived summaries updated")
+        if total_updated:
+            rebuild_leaderboards(changed)
+        self.stdout.write(self.style.SUCCESS(f"Re-graded, {total_updated} results changed"))
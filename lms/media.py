@@ -0,0 +1,161 @@
+"""
+Delivery of MEDIA_ROOT files. The view only decides who may read a file;
+the bytes are sent by the front web server (MEDIA_DELIVERY = 'x-accel' for
+nginx, 'x-sendfile' for Apache/lighttpd) or, without one, by FileResponse,
+which the WSGI server turns into sendfile() through wsgi.file_wrapper.
+"""
+import mimetypes
+import os
+import posixpath
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import patch_cache_control
+from django.utils.http import http_date
+from rest_framework.exceptions import NotAuthenticated, PermissionDenied
+from rest_framework.permissions import AllowAny
+from rest_framework.views import APIView
+
+from users.authentication import QueryParamJWTAuthentication
+from .models import Material
+from .permissions import IsStudentOrSubscribed, PaymentRequired, Paywall
+
+# Directories (upload_to) anybody may read: course previews and avatars are shown on public pages
+PUBLIC_PREFIXES = ('lms/images/', 'users/avatars/')
+PROTECTED_PREFIXES = ('lms/illustrations/',)
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def authorize(request, path):
+    """Raise unless the user may read the file; returns True for public files."""
+    if path.startswith(PUBLIC_PREFIXES):
+        return True
+    if not path.startswith(PROTECTED_PREFIXES):
+        raise Http404
+    # Cloned courses share illustration files, so several materials may reference the path
+    materials = list(Material.objects.filter(illustration=path).only('id', 'price', 'course_id', 'owner_id'))
+    if not materials:
+        raise Http404
+    if not request.user.is_authenticated:
+        raise NotAuthenticated()
+    # Same rules as GET /api/materials/{id}/ (course access, then payment), passed by any of the materials
+    accessible = [
+        material for material in materials
+        if IsStudentOrSubscribed().has_object_permission(request, None, material)
+    ]
+    if not accessible:
+        raise PermissionDenied()
+    paywall = Paywall.for_request(request)
+    if all(paywall.is_locked(material.pk, material.course_id, material.price, material.owner_id)
+           for material in accessible):
+        raise PaymentRequired()
+    return False
+
+
+class RangeFile:
+    """Read-only view of `length` bytes of a file, for bounded Range requests."""
+
+    def __init__(self, file, start, length):
+        file.seek(start)
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def parse_range(header, size):
+    """(start, end) of a single satisfiable byte range, None to send the whole file."""
+    match = RANGE_RE.match(header or '')
+    if not match or not any(match.groups()):
+        return None
+    first, last = match.groups()
+    if not first:  # bytes=-N: the last N bytes
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start, end = int(first), min(int(last), size - 1) if last else size - 1
+    if start > end or start >= size:
+        raise ValueError
+    return start, end
+
+
+def file_response(request, full_path, size):
+    try:
+        byte_range = parse_range(request.headers.get('Range'), size)
+    except ValueError:
+        response = HttpResponse(status=416)
+        response.headers['Content-Range'] = f'bytes */{size}'
+        return response
+
+    file = open(full_path, 'rb')
+    if byte_range is None:
+        response = FileResponse(file)
+    else:
+        start, end = byte_range
+        if end == size - 1:
+            # Open-ended range (video seeking): the file itself, positioned at start, keeps sendfile()
+            file.seek(start)
+            response = FileResponse(file, status=206)
+        else:
+            response = FileResponse(RangeFile(file, start, end - start + 1), status=206)
+        response.headers['Content-Length'] = str(end - start + 1)
+        response.headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response.headers['Accept-Ranges'] = 'bytes'
+    return response
+
+
+def offloaded_response(path, full_path):
+    response = HttpResponse()
+    # Let the web server set the type from the file, not Django's text/html default
+    del response.headers['Content-Type']
+    if settings.MEDIA_DELIVERY == 'x-accel':
+        response.headers['X-Accel-Redirect'] = settings.MEDIA_ACCEL_PREFIX + quote(path)
+    else:
+        response.headers['X-Sendfile'] = full_path
+    return response
+
+
+class ProtectedMediaView(APIView):
+    """
+    GET: A file from MEDIA_ROOT. Course previews and avatars are public, material
+    illustrations need the same access as the material (?token= works for <img src>).
+    """
+    authentication_classes = [QueryParamJWTAuthentication]
+    permission_classes = [AllowAny]
+
+    def get(self, request, path):
+        path = posixpath.normpath(path).lstrip('/')
+        try:
+            full_path = safe_join(settings.MEDIA_ROOT, path)
+        except SuspiciousFileOperation:
+            raise Http404
+        public = authorize(request, path)
+        try:
+            stat = os.stat(full_path)
+        except OSError:
+            raise Http404
+
+        if settings.MEDIA_DELIVERY in ('x-accel', 'x-sendfile'):
+            response = offloaded_response(path, full_path)
+        else:
+            response = file_response(request, full_path, stat.st_size)
+            content_type, encoding = mimetypes.guess_type(full_path)
+            response.headers['Content-Type'] = content_type or 'application/octet-stream'
+        response.headers['Last-Modified'] = http_date(stat.st_mtime)
+        if public:
+            patch_cache_control(response, public=True, max_age=settings.MEDIA_MAX_AGE)
+        else:
+            patch_cache_control(response, private=True, max_age=settings.MEDIA_MAX_AGE)
+        return response
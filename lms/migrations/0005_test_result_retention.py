@@ -0,0 +1,54 @@
+# Generated by Django 5.2.7 on 2026-10-19 02:28
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lms', '0004_updated_at_tombstone'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TestResultArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('first_completed_at', models.DateTimeField(db_index=True)),
+                ('last_completed_at', models.DateTimeField()),
+                ('results_count', models.PositiveIntegerField()),
+                ('data', models.BinaryField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Архив результатов',
+                'verbose_name_plural': 'Архивы результатов',
+                'ordering': ['-first_completed_at'],
+            },
+        ),
+        migrations.AlterField(
+            model_name='testresult',
+            name='completed_at',
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+        migrations.CreateModel(
+            name='TestResultSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('best_score', models.FloatField(default=0)),
+                ('passed', models.BooleanField(default=False)),
+                ('last_completed_at', models.DateTimeField()),
+                ('test', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='summaries', to='lms.test')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='test_summaries', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Итог по тесту',
+                'verbose_name_plural': 'Итоги по тестам',
+                'unique_together': {('user', 'test')},
+            },
+        ),
+    ]
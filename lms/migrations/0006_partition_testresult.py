@@ -0,0 +1,90 @@
+# Generated by Django 5.2.7 on 2026-10-19 02:35
+
+from datetime import date
+
+from django.db import migrations
+
+from lms.partitions import TABLE, add_months, create_partitions, is_partitioned
+
+CONVERT_SQL = [
+    # Free the primary key name as well, the new one takes it
+    f"ALTER INDEX {TABLE}_pkey RENAME TO {TABLE}_unpartitioned_pkey",
+    f"ALTER TABLE {TABLE} RENAME TO {TABLE}_unpartitioned",
+    f"CREATE TABLE {TABLE} (LIKE {TABLE}_unpartitioned INCLUDING DEFAULTS) PARTITION BY RANGE (completed_at)",
+    # Identity columns are not supported on partitioned tables before Postgres 17
+    f"CREATE SEQUENCE {TABLE}_partitioned_id_seq OWNED BY {TABLE}.id",
+    f"ALTER TABLE {TABLE} ALTER COLUMN id SET DEFAULT nextval('{TABLE}_partitioned_id_seq')",
+    # The partition key has to be part of the primary key
+    f"ALTER TABLE {TABLE} ADD PRIMARY KEY (id, completed_at)",
+    f"ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_user_id_fk FOREIGN KEY (user_id) "
+    f"REFERENCES users_user (id) DEFERRABLE INITIALLY DEFERRED",
+    f"ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_test_id_fk FOREIGN KEY (test_id) "
+    f"REFERENCES lms_test (id) DEFERRABLE INITIALLY DEFERRED",
+    f"CREATE INDEX {TABLE}_user_id_idx ON {TABLE} (user_id)",
+    f"CREATE INDEX {TABLE}_test_id_idx ON {TABLE} (test_id)",
+    f"CREATE INDEX {TABLE}_completed_at_idx ON {TABLE} (completed_at)",
+    f"CREATE TABLE {TABLE}_default PARTITION OF {TABLE} DEFAULT",
+]
+
+COPY_SQL = [
+    f"INSERT INTO {TABLE} SELECT * FROM {TABLE}_unpartitioned",
+    f"SELECT setval('{TABLE}_partitioned_id_seq', COALESCE((SELECT MAX(id) FROM {TABLE}), 0) + 1, false)",
+    f"DROP TABLE {TABLE}_unpartitioned",
+]
+
+# Moves the partitioned table and its index names out of the way of the plain table Django recreates
+DETACH_SQL = [
+    f"ALTER TABLE {TABLE} RENAME TO {TABLE}_partitioned",
+    f"ALTER INDEX {TABLE}_pkey RENAME TO {TABLE}_partitioned_pkey",
+    f"ALTER INDEX {TABLE}_user_id_idx RENAME TO {TABLE}_partitioned_user_id_idx",
+    f"ALTER INDEX {TABLE}_test_id_idx RENAME TO {TABLE}_partitioned_test_id_idx",
+    f"ALTER INDEX {TABLE}_completed_at_idx RENAME TO {TABLE}_partitioned_completed_at_idx",
+]
+
+
+def partition_test_results(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != 'postgresql':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT MIN(completed_at) FROM {TABLE}")
+        oldest = cursor.fetchone()[0]
+        for statement in CONVERT_SQL:
+            cursor.execute(statement)
+    today = date.today()
+    create_partitions(connection, oldest.date() if oldest else today, add_months(today, 3))
+    with connection.cursor() as cursor:
+        for statement in COPY_SQL:
+            cursor.execute(statement)
+
+
+def unpartition_test_results(apps, schema_editor):
+    connection = schema_editor.connection
+    if not is_partitioned(connection):
+        return
+    TestResult = apps.get_model('lms', 'TestResult')
+    columns = ', '.join(field.column for field in TestResult._meta.local_concrete_fields)
+    with connection.cursor() as cursor:
+        for statement in DETACH_SQL:
+            cursor.execute(statement)
+    # Constraints and indexes come back under Django's own names at the end of the migration
+    schema_editor.create_model(TestResult)
+    with connection.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {TABLE} ({columns}) SELECT {columns} FROM {TABLE}_partitioned")
+        cursor.execute(
+            f"SELECT setval(pg_get_serial_sequence('{TABLE}', 'id'), COALESCE(MAX(id), 0) + 1, false) FROM {TABLE}"
+        )
+        # The partitions and the id sequence go with it
+        cursor.execute(f"DROP TABLE {TABLE}_partitioned")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lms', '0005_test_result_retention'),
+    ]
+
+    operations = [
+        # The partitioned table is a drop-in replacement, Django's model state does not change
+        migrations.RunPython(partition_test_results, unpartition_test_results),
+    ]
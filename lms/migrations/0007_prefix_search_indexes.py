@@ -0,0 +1,36 @@
+# Generated by Django 5.2.7 on 2026-10-19 02:41
+
+from django.db import migrations
+
+# Admin '^field' search compiles to UPPER(field::text) LIKE UPPER('value%') on Postgres
+INDEXES = [
+    ('lms_course_title_upper_prefix', 'lms_course', 'title'),
+    ('lms_material_title_upper_prefix', 'lms_material', 'title'),
+]
+
+
+def create_prefix_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, table, column in INDEXES:
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {name} ON {table} (UPPER({column}::text) text_pattern_ops)'
+        )
+
+
+def drop_prefix_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, table, column in INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lms', '0006_partition_testresult'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_prefix_indexes, drop_prefix_indexes),
+    ]
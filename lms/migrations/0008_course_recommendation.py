@@ -0,0 +1,30 @@
+# Generated by Django 5.2.7 on 2026-10-19 02:34
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lms', '0007_prefix_search_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CourseRecommendation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recommendations', to='lms.course')),
+                ('recommended', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='lms.course')),
+            ],
+            options={
+                'verbose_name': 'Рекомендация курса',
+                'verbose_name_plural': 'Рекомендации курсов',
+                'ordering': ['course', 'rank'],
+                'indexes': [models.Index(fields=['course', 'rank'], name='lms_courser_course__651885_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 5.2.7 on 2026-10-19 03:20
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def populate(apps, schema_editor):
+    # Same sources as lms.access.sources(), on the historical models
+    Enrollment = apps.get_model('lms', 'Enrollment')
+    Course = apps.get_model('lms', 'Course')
+    CourseAccess = apps.get_model('lms', 'CourseAccess')
+    Payment = apps.get_model('users', 'Payment')
+    Subscription = apps.get_model('users', 'Subscription')
+    sources = {
+        'via_enrollment': Enrollment.objects.values_list('user_id', 'course_id'),
+        'via_subscription': Subscription.objects.values_list('user_sub_id', 'course_id'),
+        'via_payment': Payment.objects.filter(
+            status='completed', user__isnull=False, paid_course__isnull=False,
+        ).values_list('user_id', 'paid_course_id'),
+        'via_ownership': Course.objects.filter(owner__isnull=False).values_list('owner_id', 'id'),
+    }
+    flags = {}
+    for field, rows in sources.items():
+        for pair in rows.iterator(chunk_size=10000):
+            flags.setdefault(pair, set()).add(field)
+    CourseAccess.objects.bulk_create(
+        [
+            CourseAccess(user_id=user_id, course_id=course_id, **{field: True for field in reasons})
+            for (user_id, course_id), reasons in flags.items()
+        ],
+        batch_size=5000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lms', '0008_course_recommendation'),
+        ('users', '0007_payment_stripe_session_unique'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CourseAccess',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('via_enrollment', models.BooleanField(default=False, verbose_name='Запись на курс')),
+                ('via_subscription', models.BooleanField(default=False, verbose_name='Подписка')),
+                ('via_payment', models.BooleanField(default=False, verbose_name='Оплата')),
+                ('via_ownership', models.BooleanField(default=False, verbose_name='Автор курса')),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='access', to='lms.course')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='course_access', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Доступ к курсу',
+                'verbose_name_plural': 'Доступы к курсам',
+                'constraints': [models.UniqueConstraint(fields=('user', 'course'), name='unique_course_access')],
+            },
+        ),
+        migrations.RunPython(populate, migrations.RunPython.noop),
+    ]
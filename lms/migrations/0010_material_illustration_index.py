@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-19 03:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lms', '0009_course_access'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='material',
+            name='illustration',
+            field=models.ImageField(blank=True, db_index=True, help_text='Загрузите иллюстрацию к материалу', null=True, upload_to='lms/illustrations', verbose_name='Иллюстрация'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.7 on 2026-10-19 04:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lms', '0010_material_illustration_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ActivityEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('course_view', 'Просмотр курса'), ('material_view', 'Просмотр материала')], max_length=20, verbose_name='Событие')),
+                ('user_id', models.BigIntegerField(blank=True, null=True, verbose_name='ID пользователя')),
+                ('course_id', models.BigIntegerField(blank=True, null=True, verbose_name='ID курса')),
+                ('material_id', models.BigIntegerField(blank=True, null=True, verbose_name='ID материала')),
+                ('occurred_at', models.DateTimeField(db_index=True, verbose_name='Время события')),
+            ],
+            options={
+                'verbose_name': 'Событие активности',
+                'verbose_name_plural': 'События активности',
+                'indexes': [models.Index(fields=['course_id', 'occurred_at'], name='lms_activit_course__7d7972_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='CourseActivityHourly',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField(verbose_name='Час')),
+                ('course_views', models.PositiveIntegerField(default=0, verbose_name='Просмотры курса')),
+                ('material_views', models.PositiveIntegerField(default=0, verbose_name='Просмотры материалов')),
+                ('users', models.PositiveIntegerField(default=0, verbose_name='Уникальные пользователи')),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='hourly_activity', to='lms.course')),
+            ],
+            options={
+                'verbose_name': 'Активность по курсу за час',
+                'verbose_name_plural': 'Активность по курсам по часам',
+                'ordering': ['course', 'hour'],
+                'constraints': [models.UniqueConstraint(fields=('course', 'hour'), name='unique_course_activity_hour')],
+            },
+        ),
+    ]
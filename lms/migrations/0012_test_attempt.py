@@ -0,0 +1,33 @@
+# Generated by Django 5.2.7 on 2026-10-19 04:30
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lms', '0011_activity'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TestAttempt',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('active', 'Идёт'), ('submitted', 'Сдана'), ('expired', 'Время вышло')], default='active', max_length=10, verbose_name='Статус')),
+                ('started_at', models.DateTimeField(auto_now_add=True, verbose_name='Начало')),
+                ('deadline', models.DateTimeField(db_index=True, verbose_name='Срок сдачи')),
+                ('result', models.OneToOneField(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='attempt', to='lms.testresult', verbose_name='Результат')),
+                ('test', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='attempts', to='lms.test')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='test_attempts', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Попытка теста',
+                'verbose_name_plural': 'Попытки тестов',
+                'constraints': [models.UniqueConstraint(condition=models.Q(('status', 'active')), fields=('user', 'test'), name='unique_active_test_attempt')],
+            },
+        ),
+    ]
@@ -1,5 +1,5 @@
 from django.conf import settings
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
@@ -40,11 +40,45 @@ class Course(models.Model):
         blank=True,
     )
     created_at = models.DateTimeField(auto_now_add=True)
-    updated_at = models.DateTimeField(auto_now=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     def __str__(self):
         return self.title
 
+    def clone(self, owner, title=None):
+        """
+        Copy the course with all its materials and tests in one transaction
+        using bulk inserts. Uploaded files are shared by reference, not copied.
+        """
+        with transaction.atomic():
+            course = Course.objects.create(
+                title=title or self.title,
+                price=self.price,
+                preview=self.preview.name,
+                description=self.description,
+                owner=owner,
+            )
+            materials = list(self.materials.order_by('id'))
+            tests = {test.material_id: test for test in Test.objects.filter(material__course=self)}
+            new_materials = Material.objects.bulk_create(
+                Material(
+                    title=material.title,
+                    price=material.price,
+                    content=material.content,
+                    illustration=material.illustration.name,
+                    video_link=material.video_link,
+                    course=course,
+                    owner=owner,
+                )
+                for material in materials
+            )
+            Test.objects.bulk_create(
+                Test(material=new_material, questions=tests[material.id].questions, owner=owner)
+                for material, new_material in zip(materials, new_materials)
+                if material.id in tests
+            )
+        return course
+
     class Meta:
         verbose_name = "Курс"
         verbose_name_plural = "Курсы"
@@ -69,6 +103,7 @@ class Material(models.Model):
         upload_to="lms/illustrations",
         blank=True,
         null=True,
+        db_index=True,  # Поиск материала по файлу при проверке доступа к /media/
         verbose_name="Иллюстрация",
         help_text="Загрузите иллюстрацию к материалу",
     )
@@ -100,6 +135,7 @@ class Material(models.Model):
 
     )
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     class Meta:
         verbose_name = "Материал"
@@ -114,6 +150,7 @@ class Test(models.Model):
     questions = models.JSONField()  # Структура: [{"question": "Текст?", "answers": ["A", "B", "C"], "correct": "A"}]
     owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True, blank=True)  # Преподаватель
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     def __str__(self):
         return f"Test for {self.material.title}"
@@ -125,12 +162,75 @@ class TestResult(models.Model):  # Результаты прохождения 
     answers = models.JSONField()  # Ответы пользователя: {"question1": "A", ...}
     score = models.FloatField()  # Процент правильных (0-100)
     passed = models.BooleanField(default=False)  # Пройден ли
-    completed_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(auto_now_add=True, db_index=True)  # Ключ партиционирования в Postgres
 
     def __str__(self):
         return f"{self.user.username} - {self.test.material.title}: {self.score}%"
 
 
+class TestAttempt(models.Model):  # Попытка прохождения теста; ответы до сдачи хранятся в Redis (lms.attempts)
+    STATUS_CHOICES = [
+        ('active', 'Идёт'),
+        ('submitted', 'Сдана'),
+        ('expired', 'Время вышло'),
+    ]
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='test_attempts')
+    test = models.ForeignKey(Test, on_delete=models.CASCADE, related_name='attempts')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='active', verbose_name="Статус")
+    started_at = models.DateTimeField(auto_now_add=True, verbose_name="Начало")
+    deadline = models.DateTimeField(db_index=True, verbose_name="Срок сдачи")
+    # Без ограничения в БД: в Postgres TestResult секционирована и её ключ (id, completed_at)
+    result = models.OneToOneField(
+        'TestResult', on_delete=models.SET_NULL, null=True, blank=True, db_constraint=False,
+        related_name='attempt', verbose_name="Результат"
+    )
+
+    class Meta:
+        verbose_name = "Попытка теста"
+        verbose_name_plural = "Попытки тестов"
+        constraints = [
+            # Не больше одной незавершённой попытки на тест
+            models.UniqueConstraint(fields=['user', 'test'], condition=models.Q(status='active'),
+                                    name='unique_active_test_attempt'),
+        ]
+
+    def __str__(self):
+        return f"{self.user} - {self.test_id} ({self.status})"
+
+
+class TestResultSummary(models.Model):  # Итоги по старым попыткам, перенесённым в архив
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='test_summaries')
+    test = models.ForeignKey(Test, on_delete=models.CASCADE, related_name='summaries')
+    attempts = models.PositiveIntegerField(default=0)  # Сколько попыток свёрнуто
+    best_score = models.FloatField(default=0)
+    passed = models.BooleanField(default=False)  # Был ли тест пройден хотя бы раз
+    last_completed_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('user', 'test')
+        verbose_name = "Итог по тесту"
+        verbose_name_plural = "Итоги по тестам"
+
+    def __str__(self):
+        return f"{self.user} - {self.test}: {self.best_score}%"
+
+
+class TestResultArchive(models.Model):  # Пачка сырых результатов, сжатая zlib (NDJSON)
+    first_completed_at = models.DateTimeField(db_index=True)
+    last_completed_at = models.DateTimeField()
+    results_count = models.PositiveIntegerField()
+    data = models.BinaryField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Архив результатов"
+        verbose_name_plural = "Архивы результатов"
+        ordering = ["-first_completed_at"]
+
+    def __str__(self):
+        return f"{self.results_count} результатов с {self.first_completed_at:%Y-%m-%d}"
+
+
 class Enrollment(models.Model):
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
@@ -151,6 +251,7 @@ class Enrollment(models.Model):
         verbose_name="Дата записи",
         help_text="Когда пользователь записался",
     )
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     class Meta:
         unique_together = ('user', 'course')  # Предотвращает повторные записи
@@ -161,3 +262,91 @@ class Enrollment(models.Model):
     def __str__(self):
         return f"{self.user.email} записан на {self.course.title}"
 
+
+
+class Tombstone(models.Model):
+    """Запись об удалённом объекте для инкрементальной синхронизации клиентов."""
+    MODEL_CHOICES = [
+        ('course', 'Курс'),
+        ('material', 'Материал'),
+        ('test', 'Тест'),
+        ('enrollment', 'Запись на курс'),
+    ]
+    model = models.CharField(max_length=20, choices=MODEL_CHOICES, verbose_name="Тип объекта")
+    object_id = models.BigIntegerField(verbose_name="ID объекта")
+    course_id = models.BigIntegerField(null=True, blank=True, verbose_name="ID курса")
+    user_id = models.BigIntegerField(null=True, blank=True, verbose_name="ID пользователя")
+    deleted_at = models.DateTimeField(auto_now_add=True, db_index=True, verbose_name="Дата удаления")
+
+    class Meta:
+        verbose_name = "Удалённый объект"
+        verbose_name_plural = "Удалённые объекты"
+        ordering = ["deleted_at"]
+
+    def __str__(self):
+        return f"{self.model} #{self.object_id}"
+
+
+class CourseRecommendation(models.Model):  # «С этим курсом также проходят», пересчитывается задачей Celery
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='recommendations')
+    recommended = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField()  # Косинусная близость по записям на курсы
+    rank = models.PositiveSmallIntegerField()
+
+    class Meta:
+        verbose_name = "Рекомендация курса"
+        verbose_name_plural = "Рекомендации курсов"
+        ordering = ["course", "rank"]
+        indexes = [models.Index(fields=['course', 'rank'])]
+
+    def __str__(self):
+        return f"{self.course} -> {self.recommended}"
+
+
+class CourseAccess(models.Model):  # Кто имеет доступ к курсу и почему; поддерживается сигналами (lms.access)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='course_access')
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='access')
+    via_enrollment = models.BooleanField(default=False, verbose_name="Запись на курс")
+    via_subscription = models.BooleanField(default=False, verbose_name="Подписка")
+    via_payment = models.BooleanField(default=False, verbose_name="Оплата")
+    via_ownership = models.BooleanField(default=False, verbose_name="Автор курса")
+
+    class Meta:
+        verbose_name = "Доступ к курсу"
+        verbose_name_plural = "Доступы к курсам"
+        constraints = [models.UniqueConstraint(fields=['user', 'course'], name='unique_course_access')]
+
+    def __str__(self):
+        return f"{self.user} -> {self.course}"
+
+
+class ActivityEvent(models.Model):  # Просмотры курсов и материалов, пишутся пачками из буфера lms.activity
+    KIND_CHOICES = [
+        ('course_view', 'Просмотр курса'),
+        ('material_view', 'Просмотр материала'),
+    ]
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, verbose_name="Событие")
+    # Без внешних ключей: журнал только дописывается и не должен мешать удалению курсов
+    user_id = models.BigIntegerField(null=True, blank=True, verbose_name="ID пользователя")
+    course_id = models.BigIntegerField(null=True, blank=True, verbose_name="ID курса")
+    material_id = models.BigIntegerField(null=True, blank=True, verbose_name="ID материала")
+    occurred_at = models.DateTimeField(db_index=True, verbose_name="Время события")
+
+    class Meta:
+        verbose_name = "Событие активности"
+        verbose_name_plural = "События активности"
+        indexes = [models.Index(fields=['course_id', 'occurred_at'])]
+
+
+class CourseActivityHourly(models.Model):  # Почасовые итоги по курсу для запросов вовлечённости
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='hourly_activity')
+    hour = models.DateTimeField(verbose_name="Час")
+    course_views = models.PositiveIntegerField(default=0, verbose_name="Просмотры курса")
+    material_views = models.PositiveIntegerField(default=0, verbose_name="Просмотры материалов")
+    users = models.PositiveIntegerField(default=0, verbose_name="Уникальные пользователи")
+
+    class Meta:
+        verbose_name = "Активность по курсу за час"
+        verbose_name_plural = "Активность по курсам по часам"
+        ordering = ["course", "hour"]
+        constraints = [models.UniqueConstraint(fields=['course', 'hour'], name='unique_course_activity_hour')]
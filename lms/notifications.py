@@ -0,0 +1,92 @@
+"""
+E-mail notifications.
+
+notify() queues one Celery task per event once the transaction commits.
+That task resolves the recipients (a list of users or everyone enrolled in
+a course) and fans them out in chunks of NOTIFICATION_CHUNK_SIZE, one task
+per chunk. A chunk renders the template once and sends all of its messages
+over a single SMTP connection; if the server fails midway, only the
+recipients that have not been served yet are retried.
+"""
+import logging
+import smtplib
+
+from django.contrib.auth import get_user_model
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.template.loader import render_to_string
+
+from .models import Enrollment
+
+logger = logging.getLogger(__name__)
+
+# kind: (subject, body template); the context is shared by every recipient
+NOTIFICATIONS = {
+    'enrollment_confirmed': ("Вы записаны на курс «{course}»", 'lms/email/enrollment_confirmed.txt'),
+    'student_enrolled': ("Новый студент на курсе «{course}»", 'lms/email/student_enrolled.txt'),
+    'material_added': ("Новый материал в курсе «{course}»", 'lms/email/material_added.txt'),
+    'test_graded': ("Результат теста: {score}%", 'lms/email/test_graded.txt'),
+}
+
+
+def notify(kind, context, user_ids=None, course_id=None):
+    """
+    Queue a notification for the given users or, with course_id, for every
+    student enrolled in the course. The context must be JSON-serializable.
+    """
+    from .tasks import fan_out_notification  # Avoid circular imports
+
+    if kind not in NOTIFICATIONS:
+        raise ValueError(f"Unknown notification: {kind}")
+    if user_ids is not None:
+        audience = {'users': [user_id for user_id in user_ids if user_id]}
+        if not audience['users']:
+            return
+    else:
+        audience = {'course': course_id}
+    transaction.on_commit(lambda: fan_out_notification.delay(kind, context, audience))
+
+
+def recipient_ids(audience):
+    if 'course' in audience:
+        return Enrollment.objects.filter(course_id=audience['course']).values_list('user_id', flat=True).iterator()
+    return iter(audience['users'])
+
+
+def render(kind, context):
+    subject, template = NOTIFICATIONS[kind]
+    return subject.format(**context), render_to_string(template, context)
+
+
+class ChunkInterrupted(Exception):
+    """The mail server failed partway through a chunk; `remaining` are the users not served yet."""
+
+    def __init__(self, remaining):
+        super().__init__(f"{len(remaining)} recipients left")
+        self.remaining = remaining
+
+
+def send_chunk(kind, context, user_ids):
+    """
+    Render once, send to every active user of the chunk with an address;
+    returns the number sent. Raises ChunkInterrupted (from the SMTP error)
+    with the users still to be sent to when the connection fails.
+    """
+    subject, body = render(kind, context)
+    recipients = list(
+        get_user_model().objects.filter(pk__in=user_ids, is_active=True)
+        .exclude(email='').values_list('pk', 'email')
+    )
+    if not recipients:
+        return 0
+    sent = 0
+    with get_connection() as connection:
+        for index, (user_id, email) in enumerate(recipients):
+            try:
+                sent += connection.send_messages([EmailMessage(subject, body, to=[email])])
+            except smtplib.SMTPRecipientsRefused:
+                # Permanent for this address, retrying would not help
+                logger.warning("Mail server refused %s for the %s notification", email, kind)
+            except (smtplib.SMTPException, OSError) as exc:
+                raise ChunkInterrupted([user_id for user_id, _ in recipients[index:]]) from exc
+    return sent
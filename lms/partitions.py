@@ -0,0 +1,34 @@
+"""Monthly range partitions of lms_testresult by completed_at (Postgres only)."""
+from datetime import date
+
+TABLE = 'lms_testresult'
+
+
+def add_months(month, months):
+    month_index = month.month - 1 + months
+    return date(month.year + month_index // 12, month_index % 12 + 1, 1)
+
+
+def is_partitioned(connection):
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid WHERE c.relname = %s",
+            [TABLE],
+        )
+        return cursor.fetchone() is not None
+
+
+def create_partitions(connection, start, end):
+    """Create the monthly partitions covering start..end (dates), skipping existing ones."""
+    month = start.replace(day=1)
+    with connection.cursor() as cursor:
+        while month <= end:
+            next_month = add_months(month, 1)
+            cursor.execute(
+                f"CREATE TABLE IF NOT EXISTS {TABLE}_{month:%Y_%m} PARTITION OF {TABLE} "
+                f"FOR VALUES FROM (%s) TO (%s)",
+                [month, next_month],
+            )
+            month = next_month
@@ -1,5 +1,39 @@
+from django.contrib.auth.models import AnonymousUser
+from django.db.models import Exists, OuterRef
+from rest_framework import status
+from rest_framework.exceptions import APIException
 from rest_framework.permissions import BasePermission
 
+
+class PaymentRequired(APIException):
+    status_code = status.HTTP_402_PAYMENT_REQUIRED
+    default_detail = 'Материал платный, оплатите его через /api/users/payments/checkout/.'
+    default_code = 'payment_required'
+
+
+def course_lookup(model):
+    """Path from model to its course, mirroring the checks in IsStudentOrSubscribed."""
+    if model._meta.label == 'lms.Course':
+        return 'pk'
+    field_names = {field.name for field in model._meta.get_fields()}
+    if 'course' in field_names:
+        return 'course'
+    if 'material' in field_names:
+        return 'material__course'
+    return None
+
+
+def course_id_of(obj):
+    """Course id of a Course, Material or Test instance without fetching related rows."""
+    if obj._meta.label == 'lms.Course':
+        return obj.pk
+    if hasattr(obj, 'course_id'):
+        return obj.course_id
+    if hasattr(obj, 'material'):
+        return obj.material.course_id
+    return None
+
+
 class IsTeacherOrAdmin(BasePermission):
     def has_permission(self, request, view):
         user = request.user
@@ -17,7 +51,21 @@ class IsOwnerOrAdmin(BasePermission):
 
     def has_object_permission(self, request, view, obj):
         user = request.user
-        return (user.is_superuser or user.is_staff or user == obj.owner)
+        return (user.is_superuser or user.is_staff or obj.owner_id == user.pk)
+
+    def filter_queryset(self, request, queryset, view):
+        # has_object_permission as SQL, for list endpoints
+        user = request.user
+        if user.is_superuser or user.is_staff:
+            return queryset
+        return queryset.filter(owner=user)
+
+
+class IsObjectOwnerOrAdmin(IsOwnerOrAdmin):
+    """IsOwnerOrAdmin that lets owners who are not staff through, e.g. teachers cloning their own course."""
+
+    def has_permission(self, request, view):
+        return request.user.is_authenticated
 
 
 class IsStudentOrSubscribed(BasePermission):
@@ -29,16 +77,93 @@ class IsStudentOrSubscribed(BasePermission):
         # Teachers/admins always have access
         if request.user.role in ['teacher', 'admin']:
             return True
-        # For students, check enrollment in the course
-        # Handle different object types (Course, Material, Test)
-        if hasattr(obj, 'course'):
-            course = obj.course
-        elif hasattr(obj, 'material') and hasattr(obj.material, 'course'):
-            course = obj.material.course
-        elif hasattr(obj, 'subscriptions'):
-            return obj.subscriptions.filter(user_sub=request.user).exists()
-        else:
-            return False  # Can't determine course, deny access
-        # Use Enrollment model for the check
-        from .models import Enrollment  # Avoid circular imports
-        return Enrollment.objects.filter(user=request.user, course=course).exists()
+        # Students: enrollment, subscription, payment or ownership, all in CourseAccess
+        from .access import has_access  # Avoid circular imports
+        course_id = course_id_of(obj)
+        return course_id is not None and has_access(request.user, course_id)
+
+    def filter_queryset(self, request, queryset, view):
+        # has_object_permission as a single EXISTS filter, for list endpoints
+        if request.user.role in ['teacher', 'admin']:
+            return queryset
+        from .models import CourseAccess  # Avoid circular imports
+        path = course_lookup(queryset.model)
+        if path is None:
+            return queryset.none()
+        return queryset.filter(Exists(CourseAccess.objects.filter(user=request.user, course=OuterRef(path))))
+
+
+class HasCourseAccess(IsStudentOrSubscribed):
+    """
+    IsStudentOrSubscribed checked on the object only, so teachers and staff are
+    not turned away by its students-only has_permission, e.g. on leaderboards.
+    """
+
+    def has_permission(self, request, view):
+        return request.user.is_authenticated
+
+    def has_object_permission(self, request, view, obj):
+        return request.user.is_staff or request.user.is_superuser or super().has_object_permission(request, view, obj)
+
+
+# Fields of a paid material that only its buyers read; list endpoints render them as null for everybody else
+PAID_MATERIAL_FIELDS = ('content', 'video_link')
+
+
+class Paywall:
+    """
+    The payment rule of HasPaidForMaterial for many materials at once: the
+    user's completed payments are read once, on the first paid material.
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self.purchases = None  # (material ids, course ids)
+
+    @classmethod
+    def for_request(cls, request):
+        """One paywall per request, shared by every serializer that renders materials."""
+        if request is None:
+            return cls(AnonymousUser())
+        paywall = getattr(request, '_paywall', None)
+        if paywall is None:
+            paywall = request._paywall = cls(request.user)
+        return paywall
+
+    def exempt(self):
+        user = self.user
+        return user.is_authenticated and (user.is_superuser or user.is_staff or user.role in ['teacher', 'admin'])
+
+    def is_locked(self, material_id, course_id, price, owner_id):
+        """Whether the user has to pay before reading the material."""
+        if not price or self.exempt():
+            return False
+        if not self.user.is_authenticated:
+            return True
+        if owner_id == self.user.pk:
+            return False
+        if self.purchases is None:
+            from users.models import Payment  # Avoid circular imports
+            rows = Payment.objects.filter(user=self.user, status='completed').values_list(
+                'paid_material_id', 'paid_course_id'
+            )
+            self.purchases = (
+                {material for material, _ in rows if material}, {course for _, course in rows if course}
+            )
+        materials, courses = self.purchases
+        return material_id not in materials and course_id not in courses
+
+    def redact(self, data):
+        for name in PAID_MATERIAL_FIELDS:
+            if name in data:
+                data[name] = None
+        return data
+
+
+class HasPaidForMaterial(BasePermission):
+    """Paid materials are opened by a completed payment for the material or its course."""
+
+    def has_object_permission(self, request, view, obj):
+        if Paywall.for_request(request).is_locked(obj.pk, obj.course_id, obj.price, obj.owner_id):
+            raise PaymentRequired()
+        return True
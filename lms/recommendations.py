@@ -0,0 +1,71 @@
+"""Item-item course recommendations from co-enrollment, computed offline."""
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from scipy import sparse
+
+from .models import CourseRecommendation, Enrollment
+
+
+def enrollment_matrix():
+    """Sparse user x course matrix of enrollments and the course id of every column."""
+    pairs = np.fromiter(
+        (value for pair in Enrollment.objects.values_list('user_id', 'course_id').iterator(chunk_size=10000)
+         for value in pair),
+        dtype=np.int64,
+    ).reshape(-1, 2)
+    user_ids, rows = np.unique(pairs[:, 0], return_inverse=True)
+    course_ids, columns = np.unique(pairs[:, 1], return_inverse=True)
+    matrix = sparse.csr_matrix(
+        (np.ones(len(pairs), dtype=np.float32), (rows, columns)),
+        shape=(len(user_ids), len(course_ids)),
+    )
+    return matrix, course_ids
+
+
+def course_similarity(matrix, min_support):
+    """Cosine similarity between course columns, ignoring pairs with fewer than min_support shared students."""
+    co_enrolled = (matrix.T @ matrix).tocsr()
+    co_enrolled.setdiag(0)
+    co_enrolled.data[co_enrolled.data < min_support] = 0
+    co_enrolled.eliminate_zeros()
+
+    norms = np.sqrt(np.asarray(matrix.sum(axis=0)).ravel())
+    similarity = co_enrolled.tocoo()
+    similarity.data /= norms[similarity.row] * norms[similarity.col]
+    return similarity.tocsr()
+
+
+def top_k(similarity, k):
+    """Yield (course column, neighbour columns, scores) with the k best neighbours of every course."""
+    for row in range(similarity.shape[0]):
+        start, end = similarity.indptr[row], similarity.indptr[row + 1]
+        if start == end:
+            continue
+        columns, scores = similarity.indices[start:end], similarity.data[start:end]
+        if len(scores) > k:
+            best = np.argpartition(-scores, k)[:k]
+            columns, scores = columns[best], scores[best]
+        order = np.argsort(-scores, kind='stable')
+        yield row, columns[order], scores[order]
+
+
+def build_recommendations(k=None, min_support=None):
+    """Recompute the CourseRecommendation table from all enrollments."""
+    k = k or settings.RECOMMENDATIONS_TOP_K
+    min_support = min_support or settings.RECOMMENDATIONS_MIN_SUPPORT
+    matrix, course_ids = enrollment_matrix()
+    recommendations = []
+    if matrix.nnz:
+        for row, columns, scores in top_k(course_similarity(matrix, min_support), k):
+            recommendations.extend(
+                CourseRecommendation(
+                    course_id=int(course_ids[row]), recommended_id=int(course_ids[column]), score=float(score),
+                    rank=rank,
+                )
+                for rank, (column, score) in enumerate(zip(columns, scores), start=1)
+            )
+    with transaction.atomic():
+        CourseRecommendation.objects.all().delete()
+        CourseRecommendation.objects.bulk_create(recommendations, batch_size=5000)
+    return len(recommendations)
@@ -0,0 +1,138 @@
+"""
+Typeahead suggestions for course titles and teacher names.
+
+Every index is a Redis sorted set with all scores 0, so members are ordered
+lexicographically and ZRANGEBYLEX returns the entries starting with a
+prefix. A member is "<normalized text>\\x00<id>\\x00<display text>", one per
+word of the text, so "python" also finds "Основы Python". A hash keeps the
+members of every id for removal; signals update both on save and delete.
+"""
+import logging
+import re
+
+from django.contrib.auth import get_user_model
+from django_redis import get_redis_connection
+from redis.exceptions import RedisError
+
+from .models import Course
+
+logger = logging.getLogger(__name__)
+
+SEPARATOR = '\x00'
+WORD_RE = re.compile(r'\w+')
+MAX_PREFIX_LENGTH = 50
+
+INDEXES = {
+    # name: (sorted set, hash of members by id)
+    'courses': ('suggest:courses', 'suggest:courses:members'),
+    'teachers': ('suggest:teachers', 'suggest:teachers:members'),
+}
+
+
+def get_connection():
+    return get_redis_connection('default')
+
+
+def normalize(text):
+    return ' '.join(WORD_RE.findall(text.casefold().replace('ё', 'е')))
+
+
+def members(object_id, text):
+    """Index members of one object: the normalized text from every word start."""
+    words = normalize(text or '').split(' ')
+    starts = {' '.join(words[index:]) for index in range(len(words))} - {''}
+    return [f'{start}{SEPARATOR}{object_id}{SEPARATOR}{text}' for start in sorted(starts)]
+
+
+def index(name, object_id, text):
+    """Replace the entries of one object; text=None removes it."""
+    index_many(name, [(object_id, text)])
+
+
+def index_many(name, rows):
+    """index() for many (id, text) pairs in two round trips, e.g. after bulk_create."""
+    rows = list(rows)
+    if not rows:
+        return
+    zset_key, hash_key = INDEXES[name]
+    try:
+        redis = get_connection()
+        olds = redis.hmget(hash_key, [object_id for object_id, _ in rows])
+        pipe = redis.pipeline()
+        for (object_id, text), old in zip(rows, olds):
+            new = members(object_id, text) if text else []
+            if old:
+                pipe.zrem(zset_key, *old.decode().split('\n'))
+            if new:
+                pipe.zadd(zset_key, dict.fromkeys(new, 0))
+                pipe.hset(hash_key, object_id, '\n'.join(new))
+            else:
+                pipe.hdel(hash_key, object_id)
+        pipe.execute()
+    except (RedisError, NotImplementedError):  # NotImplementedError: cache is not Redis
+        logger.warning("Could not update %s suggestions for %s", name, [object_id for object_id, _ in rows],
+                       exc_info=True)
+
+
+def sources():
+    """Rows of every index as (id, text) querysets."""
+    return {
+        'courses': Course.objects.values_list('id', 'title'),
+        'teachers': get_user_model().objects.filter(role='teacher').exclude(name='').values_list('id', 'name'),
+    }
+
+
+def rebuild():
+    """Rebuild every index from the database; returns {name: number of objects}."""
+    redis = get_connection()
+    counts = {}
+    for name, rows in sources().items():
+        zset_key, hash_key = INDEXES[name]
+        pipe = redis.pipeline()
+        pipe.delete(f'{zset_key}:new', f'{hash_key}:new')
+        counts[name] = 0
+        for object_id, text in rows.iterator(chunk_size=5000):
+            new = members(object_id, text)
+            if new:
+                pipe.zadd(f'{zset_key}:new', dict.fromkeys(new, 0))
+                pipe.hset(f'{hash_key}:new', object_id, '\n'.join(new))
+                counts[name] += 1
+        pipe.execute()
+        if counts[name]:
+            # Swap in atomically, readers never see a half-built index
+            pipe = redis.pipeline()
+            pipe.rename(f'{zset_key}:new', zset_key)
+            pipe.rename(f'{hash_key}:new', hash_key)
+            pipe.execute()
+        else:
+            redis.delete(zset_key, hash_key)
+    return counts
+
+
+def suggest(name, query, limit=10):
+    """Up to `limit` objects whose text has a word starting with the query, as (id, text)."""
+    prefix = normalize(query)[:MAX_PREFIX_LENGTH]
+    if not prefix:
+        return []
+    zset_key, _ = INDEXES[name]
+    found = {}
+    start = f'[{prefix}'.encode()
+    # 0xff never occurs in UTF-8, so it sorts after every member with this prefix
+    end = f'[{prefix}'.encode() + b'\xff'
+    offset, batch = 0, limit * 3
+    while len(found) < limit:
+        entries = get_connection().zrangebylex(zset_key, start, end, start=offset, num=batch)
+        for entry in entries:
+            _, object_id, text = entry.decode().split(SEPARATOR, 2)
+            found.setdefault(int(object_id), text)
+        if len(entries) < batch:
+            break
+        offset += batch
+    return list(found.items())[:limit]
+
+
+def suggest_from_database(name, query, limit=10):
+    """Fallback when Redis is unavailable: prefix match on the whole text."""
+    rows = sources()[name]
+    field = 'title' if name == 'courses' else 'name'
+    return list(rows.filter(**{f'{field}__istartswith': query.strip()}).order_by(field)[:limit])
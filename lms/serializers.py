@@ -1,14 +1,129 @@
+from collections import defaultdict
+
+from django.db.models import Prefetch, QuerySet
+from django.utils import timezone
 from rest_framework import serializers
 from .models import Course, Material, Test, TestResult, Enrollment
+from .permissions import PAID_MATERIAL_FIELDS, Paywall
+
+
+def parse_fieldset(value):
+    """'id,title,materials.id' -> {'id': '', 'title': '', 'materials': 'id'}; None stays None."""
+    if value is None:
+        return None
+    selected = {}
+    for name in value.split(','):
+        head, _, rest = name.strip().partition('.')
+        if head:
+            selected.setdefault(head, [])
+            if rest:
+                selected[head].append(rest)
+    return {head: ','.join(rest) for head, rest in selected.items()}
+
+
+def requested_fieldsets(request):
+    """?fields= and ?expand= of a request, parsed; None where the parameter is absent."""
+    if request is None:
+        return None, None
+    return parse_fieldset(request.query_params.get('fields')), parse_fieldset(request.query_params.get('expand'))
+
+
+def nested_fieldsets(name, fields, expand):
+    """Fieldsets passed down to the serializer of the `name` relation."""
+    return (
+        parse_fieldset(fields[name]) if fields and name in fields else None,
+        parse_fieldset(expand[name]) if expand is not None and name in expand else None,
+    )
+
+
+class DynamicFieldsMixin:
+    """
+    Sparse fieldsets for ModelSerializers.
+
+    ?fields=id,title,materials.id keeps only the listed fields (dotted names
+    select fields of nested objects). ?expand=materials chooses which of
+    Meta.expandable_fields are nested objects; the others are rendered as
+    ids, or left out for reverse relations. Without ?expand= the relations in
+    Meta.default_expand are nested, so responses without the parameters do
+    not change. The top-level serializer of a GET request reads the query
+    string, nested ones get their fieldsets from the parent.
+    """
+
+    def __init__(self, *args, fields=None, expand=None, **kwargs):
+        self.fieldsets = (fields, expand) if fields is not None or expand is not None else None
+        super().__init__(*args, **kwargs)
 
+    def get_fieldsets(self):
+        if self.fieldsets is not None:
+            return self.fieldsets
+        request = self.context.get('request')
+        # Top-level serializer (or the child of a top-level list) of a read request
+        if self.root in (self, self.parent) and request is not None and request.method == 'GET':
+            return requested_fieldsets(request)
+        return None, None
 
-class MaterialSerializer(serializers.ModelSerializer):
+    def get_fields(self):
+        fields = super().get_fields()
+        selected, expand = self.get_fieldsets()
+        expanded = set(getattr(self.Meta, 'default_expand', ())) if expand is None else set(expand)
+        for name, (serializer_class, kwargs) in getattr(self.Meta, 'expandable_fields', {}).items():
+            if name in expanded:
+                sub_fields, sub_expand = nested_fieldsets(name, selected, expand)
+                fields[name] = serializer_class(read_only=True, fields=sub_fields, expand=sub_expand, **kwargs)
+            elif self.Meta.model._meta.get_field(name).many_to_one:
+                fields[name] = serializers.PrimaryKeyRelatedField(read_only=True)
+            else:
+                fields.pop(name, None)
+        if selected:
+            fields = {name: field for name, field in fields.items() if name in selected}
+        return fields
+
+    @classmethod
+    def optimize_queryset(cls, queryset, fields=None, expand=None, required=()):
+        """
+        Restrict the queryset to what the fieldsets render: .only() the selected
+        columns (when ?fields= is given) and prefetch only the nested relations
+        that are expanded, each with its own restricted queryset.
+        """
+        model = cls.Meta.model
+        queryset = queryset.prefetch_related(None)
+        columns = set(required) | set(getattr(cls.Meta, 'required_fields', ()))
+        for name, field in cls(fields=fields or {}, expand=expand).fields.items():
+            nested = getattr(field, 'child', field)
+            if isinstance(nested, DynamicFieldsMixin):
+                relation = model._meta.get_field(field.source)
+                sub_fields, sub_expand = nested.fieldsets or (None, None)
+                related_required = (relation.field.name,) if relation.one_to_many else ()
+                related = type(nested).optimize_queryset(
+                    relation.related_model._default_manager.all(), sub_fields, sub_expand, related_required,
+                )
+                queryset = queryset.prefetch_related(Prefetch(field.source, queryset=related))
+                if relation.many_to_one:
+                    columns.add(relation.name)
+            else:
+                columns.add(field.source.split('.')[0])
+        if fields:
+            concrete = {field.name for field in model._meta.concrete_fields}
+            queryset = queryset.only(*(columns & concrete))
+        return queryset
+
+
+class MaterialSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    """Paid materials the requesting user has not bought are rendered without their content."""
     illustration = serializers.FileField()
     class Meta:
         model = Material
         fields = '__all__'
+        required_fields = ('price', 'course', 'owner')  # Read by the paywall even when ?fields= leaves them out
 
-class TestSerializer(serializers.ModelSerializer):
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        paywall = Paywall.for_request(self.context.get('request'))
+        if paywall.is_locked(instance.pk, instance.course_id, instance.price, instance.owner_id):
+            paywall.redact(data)
+        return data
+
+class TestSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
 
     def validate_questions(self, value):
         if not isinstance(value, list):
@@ -22,22 +137,196 @@ class TestSerializer(serializers.ModelSerializer):
         model = Test
         fields = '__all__'
 
-class TestResultSerializer(serializers.ModelSerializer):
+class TestResultSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = TestResult
         fields = '__all__'
 
-class CourseSerializer(serializers.ModelSerializer):
+class CourseSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     materials = MaterialSerializer(many=True, read_only=True)
 
     class Meta:
         model = Course
         fields = '__all__'
+        expandable_fields = {'materials': (MaterialSerializer, {'many': True})}
+        default_expand = ['materials']
 
-class EnrollmentSerializer(serializers.ModelSerializer):
+class EnrollmentSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     course = CourseSerializer(read_only=True)
 
     class Meta:
         model = Enrollment
         fields = ['id', 'user', 'course', 'enrolled_at']
         read_only_fields = ['user', 'enrolled_at']
+        expandable_fields = {'course': (CourseSerializer, {})}
+        default_expand = ['course']
+
+
+class ValuesSerializer:
+    """
+    Read-only serializer for hot list endpoints.
+    Builds dicts straight from ``.values()`` rows instead of model instances,
+    producing the same output as the matching ModelSerializer.
+    """
+    model = None
+    fields = ()
+    decimal_fields = ()
+    datetime_fields = ()
+    file_fields = ()
+
+    def __init__(self, instance, context=None, fields=None, expand=None):
+        self.instance = instance  # queryset or already fetched rows
+        self.context = context or {}
+        self.selected = fields  # Parsed ?fields= / ?expand= (see parse_fieldset), None for everything
+        self.expand = expand
+
+    def get_rows(self):
+        if isinstance(self.instance, QuerySet):
+            return self.values(self.instance, self.selected)
+        return self.instance
+
+    @classmethod
+    def get_columns(cls, fields=None):
+        if not fields:
+            return cls.fields
+        # The id is always read, nested rows are grouped by it
+        return tuple(name for name in cls.fields if name in fields or name == 'id')
+
+    @classmethod
+    def values(cls, queryset, fields=None):
+        return queryset.prefetch_related(None).values(*cls.get_columns(fields))
+
+    def get_converters(self):
+        tz = timezone.get_current_timezone()
+        request = self.context.get('request')
+
+        def to_decimal(value):
+            return '' if value is None else f'{value:f}'
+
+        def to_datetime(value):
+            if value is None:
+                return None
+            value = value.astimezone(tz).isoformat()
+            if value.endswith('+00:00'):
+                value = value[:-6] + 'Z'
+            return value
+
+        def file_converter(storage):
+            def to_url(value):
+                if not value:
+                    return None
+                url = storage.url(value)
+                return request.build_absolute_uri(url) if request is not None else url
+            return to_url
+
+        converters = {name: to_decimal for name in self.decimal_fields}
+        converters.update({name: to_datetime for name in self.datetime_fields})
+        converters.update({
+            name: file_converter(self.model._meta.get_field(name).storage)
+            for name in self.file_fields
+        })
+        return converters
+
+    def serialize(self):
+        converters = list(self.get_converters().items())
+        columns = self.get_columns(self.selected)
+        rows = []
+        for row in self.get_rows():
+            row = {name: row[name] for name in columns}
+            for name, convert in converters:
+                if name in row:
+                    row[name] = convert(row[name])
+            rows.append(row)
+        return rows
+
+    def trim(self, rows):
+        """Drop the columns read only for internal use (such as the id) that ?fields= did not ask for."""
+        if self.selected:
+            extra = [name for name in self.get_columns(self.selected) if name not in self.selected]
+            for row in rows:
+                for name in extra:
+                    row.pop(name, None)
+        return rows
+
+    @property
+    def data(self):
+        return self.trim(self.serialize())
+
+
+class MaterialValuesSerializer(ValuesSerializer):
+    """Paid materials the requesting user has not bought are rendered without their content."""
+    model = Material
+    fields = ('id', 'illustration', 'title', 'price', 'content', 'video_link', 'created_at', 'updated_at',
+              'course', 'owner')
+    decimal_fields = ('price',)
+    datetime_fields = ('created_at', 'updated_at')
+    file_fields = ('illustration',)
+    paywall_columns = ('id', 'price', 'course', 'owner')
+
+    @classmethod
+    def get_columns(cls, fields=None):
+        columns = super().get_columns(fields)
+        if fields and any(name in fields for name in PAID_MATERIAL_FIELDS):
+            columns += tuple(name for name in cls.paywall_columns if name not in columns)
+        return columns
+
+    def get_rows(self):
+        rows = super().get_rows()
+        if not any(name in self.get_columns(self.selected) for name in PAID_MATERIAL_FIELDS):
+            return rows
+        paywall = Paywall.for_request(self.context.get('request'))
+        return [
+            paywall.redact(dict(row)) if paywall.is_locked(row['id'], row['course'], row['price'], row['owner'])
+            else row
+            for row in rows
+        ]
+
+
+class CourseCardValuesSerializer(ValuesSerializer):
+    """Course row without the nested materials."""
+    model = Course
+    fields = ('id', 'title', 'price', 'preview', 'description', 'created_at', 'updated_at', 'owner')
+    decimal_fields = ('price',)
+    datetime_fields = ('created_at', 'updated_at')
+    file_fields = ('preview',)
+
+
+class CourseValuesSerializer(CourseCardValuesSerializer):
+    """Course rows with their materials nested, unless ?expand= leaves them out."""
+
+    @property
+    def data(self):
+        courses = self.serialize()
+        expanded = self.expand is None or 'materials' in self.expand
+        if not expanded or (self.selected and 'materials' not in self.selected):
+            return self.trim(courses)
+        # One query for the nested materials of the whole page instead of a prefetch into instances
+        material_fields, _ = nested_fieldsets('materials', self.selected, self.expand)
+        grouping = {'course': ''} if material_fields and 'course' not in material_fields else {}
+        materials = defaultdict(list)
+        course_ids = [course['id'] for course in courses]
+        material_qs = Material.objects.filter(course_id__in=course_ids).order_by('id')
+        serializer = MaterialValuesSerializer(
+            material_qs, context=self.context, fields={**material_fields, **grouping} if material_fields else None,
+        )
+        for material in serializer.data:
+            materials[material.pop('course') if grouping else material['course']].append(material)
+        return self.trim([{'id': course['id'], 'materials': materials[course['id']], **course} for course in courses])
+
+
+class TestValuesSerializer(ValuesSerializer):
+    model = Test
+    fields = ('id', 'questions', 'created_at', 'updated_at', 'material', 'owner')
+    datetime_fields = ('created_at', 'updated_at')
+
+
+class EnrollmentValuesSerializer(ValuesSerializer):
+    model = Enrollment
+    fields = ('id', 'user', 'course', 'enrolled_at', 'updated_at')
+    datetime_fields = ('enrolled_at', 'updated_at')
+
+
+class TestResultValuesSerializer(ValuesSerializer):
+    model = TestResult
+    fields = ('id', 'answers', 'score', 'passed', 'completed_at', 'user', 'test')
+    datetime_fields = ('completed_at',)
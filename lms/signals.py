@@ -0,0 +1,139 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import access, grading, leaderboards, search
+from .events import publish_event
+from .models import Course, CourseAccess, Material, Test, TestResult, Enrollment, Tombstone
+
+
+@receiver(post_delete, sender=Course)
+def course_deleted(sender, instance, **kwargs):
+    Tombstone.objects.create(model='course', object_id=instance.pk, course_id=instance.pk)
+
+
+@receiver(post_delete, sender=Material)
+def material_deleted(sender, instance, **kwargs):
+    Tombstone.objects.create(model='material', object_id=instance.pk, course_id=instance.course_id)
+
+
+@receiver(post_delete, sender=Test)
+def test_deleted(sender, instance, **kwargs):
+    # Tests are deleted before their material on cascade, so the material row is still there
+    course_id = Material.objects.filter(pk=instance.material_id).values_list('course_id', flat=True).first()
+    Tombstone.objects.create(model='test', object_id=instance.pk, course_id=course_id)
+
+
+@receiver(post_delete, sender=Enrollment)
+def enrollment_deleted(sender, instance, **kwargs):
+    Tombstone.objects.create(
+        model='enrollment', object_id=instance.pk, course_id=instance.course_id, user_id=instance.user_id
+    )
+
+
+@receiver(post_save, sender=TestResult)
+def test_graded(sender, instance, created, **kwargs):
+    if created:
+        publish_event(
+            'test_graded',
+            {'result': instance.pk, 'test': instance.test_id, 'score': instance.score, 'passed': instance.passed},
+            user_id=instance.user_id,
+        )
+
+
+@receiver(post_save, sender=TestResult)
+def update_leaderboards(sender, instance, created, **kwargs):
+    if created and instance.user_id:
+        course_id = grading.compiled_test(instance.test_id)['course_id']
+        transaction.on_commit(lambda: leaderboards.record_score(
+            instance.user_id, instance.test_id, course_id, instance.score
+        ))
+
+
+@receiver(post_save, sender=Enrollment)
+def enrollment_confirmed(sender, instance, created, **kwargs):
+    if created:
+        publish_event(
+            'enrollment_confirmed',
+            {'enrollment': instance.pk, 'course': instance.course_id},
+            user_id=instance.user_id,
+            course_id=instance.course_id,
+        )
+
+
+@receiver(post_save, sender=Material)
+def material_added(sender, instance, created, **kwargs):
+    if created and instance.course_id:
+        publish_event(
+            'material_added',
+            {'material': instance.pk, 'course': instance.course_id, 'title': instance.title},
+            course_id=instance.course_id,
+        )
+
+
+# Course entitlements (lms.access): refreshed after the source row is committed
+
+@receiver(post_save, sender=Enrollment)
+@receiver(post_delete, sender=Enrollment)
+def enrollment_access(sender, instance, **kwargs):
+    access.refresh_on_commit([(instance.user_id, instance.course_id)])
+
+
+@receiver(post_save, sender='users.Subscription')
+@receiver(post_delete, sender='users.Subscription')
+def subscription_access(sender, instance, **kwargs):
+    access.refresh_on_commit([(instance.user_sub_id, instance.course_id)])
+
+
+@receiver(post_save, sender='users.Payment')
+@receiver(post_delete, sender='users.Payment')
+def payment_access(sender, instance, **kwargs):
+    if instance.paid_course_id:
+        access.refresh_on_commit([(instance.user_id, instance.paid_course_id)])
+
+
+@receiver(post_save, sender=Course)
+def ownership_access(sender, instance, **kwargs):
+    owners = list(CourseAccess.objects.filter(course=instance, via_ownership=True).values_list('user_id', flat=True))
+    if owners != [instance.owner_id]:  # New course or a new owner
+        access.refresh_on_commit([(user_id, instance.pk) for user_id in owners + [instance.owner_id]])
+
+
+# Compiled tests (lms.grading) cached in the two-tier cache
+
+@receiver(post_save, sender=Test)
+@receiver(post_delete, sender=Test)
+def test_changed(sender, instance, **kwargs):
+    transaction.on_commit(lambda: grading.invalidate_compiled_tests([instance.pk]))
+
+
+@receiver(post_save, sender=Material)
+def material_moved(sender, instance, created, **kwargs):
+    if not created:  # The course of the material's tests may have changed
+        test_ids = list(Test.objects.filter(material=instance).values_list('pk', flat=True))
+        transaction.on_commit(lambda: grading.invalidate_compiled_tests(test_ids))
+
+
+# Typeahead indexes (lms.search)
+
+@receiver(post_save, sender=Course)
+def course_suggestions(sender, instance, **kwargs):
+    transaction.on_commit(lambda: search.index('courses', instance.pk, instance.title))
+
+
+@receiver(post_delete, sender=Course)
+def course_suggestions_removed(sender, instance, **kwargs):
+    transaction.on_commit(lambda: search.index('courses', instance.pk, None))
+
+
+@receiver(post_save, sender='users.User')
+def teacher_suggestions(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not {'name', 'role'} & set(update_fields):  # e.g. last_login
+        return
+    name = instance.name if instance.role == 'teacher' else None
+    transaction.on_commit(lambda: search.index('teachers', instance.pk, name))
+
+
+@receiver(post_delete, sender='users.User')
+def teacher_suggestions_removed(sender, instance, **kwargs):
+    transaction.on_commit(lambda: search.index('teachers', instance.pk, None))
@@ -0,0 +1,191 @@
+import json
+import logging
+import zlib
+from datetime import date, timedelta
+
+from celery import shared_task
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.utils import timezone
+from redis.exceptions import RedisError
+
+from . import activity, attempts, leaderboards, notifications
+from .models import ActivityEvent, Test, TestAttempt, TestResult, TestResultSummary, TestResultArchive, Tombstone
+from .partitions import add_months, create_partitions, is_partitioned
+
+logger = logging.getLogger(__name__)
+
+
+def fold_into_summaries(rows):
+    """Merge a batch of raw results into the per-user best-score summaries."""
+    folded = {}
+    for row in rows:
+        if row['user_id'] is None:
+            continue
+        key = (row['user_id'], row['test_id'])
+        summary = folded.get(key)
+        if summary is None:
+            summary = folded[key] = TestResultSummary(
+                user_id=row['user_id'], test_id=row['test_id'], last_completed_at=row['completed_at']
+            )
+        summary.attempts += 1
+        summary.best_score = max(summary.best_score, row['score'])
+        summary.passed = summary.passed or row['passed']
+        summary.last_completed_at = max(summary.last_completed_at, row['completed_at'])
+
+    existing = TestResultSummary.objects.filter(
+        user_id__in={user_id for user_id, _ in folded},
+        test_id__in={test_id for _, test_id in folded},
+    )
+    for summary in existing:
+        new = folded.get((summary.user_id, summary.test_id))
+        if new is not None:
+            new.attempts += summary.attempts
+            new.best_score = max(new.best_score, summary.best_score)
+            new.passed = new.passed or summary.passed
+            new.last_completed_at = max(new.last_completed_at, summary.last_completed_at)
+
+    TestResultSummary.objects.bulk_create(
+        folded.values(),
+        update_conflicts=True,
+        unique_fields=['user', 'test'],
+        update_fields=['attempts', 'best_score', 'passed', 'last_completed_at'],
+    )
+
+
+def archive(rows):
+    """Store a batch of raw results as one zlib-compressed NDJSON blob."""
+    data = '\n'.join(json.dumps(row, cls=DjangoJSONEncoder) for row in rows).encode()
+    TestResultArchive.objects.create(
+        first_completed_at=rows[0]['completed_at'],
+        last_completed_at=rows[-1]['completed_at'],
+        results_count=len(rows),
+        data=zlib.compress(data, 9),
+    )
+
+
+@shared_task
+def compact_test_results():
+    """
+    Move results older than TEST_RESULT_RETENTION_DAYS out of the live table:
+    fold them into TestResultSummary, archive the raw rows and delete them.
+    """
+    cutoff = timezone.now() - timedelta(days=settings.TEST_RESULT_RETENTION_DAYS)
+    old_results = TestResult.objects.filter(completed_at__lt=cutoff)
+    compacted = 0
+    while True:
+        with transaction.atomic():
+            rows = list(
+                old_results.order_by('completed_at', 'id')
+                .values('id', 'user_id', 'test_id', 'answers', 'score', 'passed', 'completed_at')
+                [:settings.TEST_RESULT_COMPACTION_BATCH]
+            )
+            if not rows:
+                break
+            fold_into_summaries(rows)
+            archive(rows)
+            # completed_at__lt keeps the delete on the old partitions only
+            old_results.filter(id__in=[row['id'] for row in rows]).delete()
+        compacted += len(rows)
+    return compacted
+
+
+@shared_task
+def ensure_test_result_partitions(months_ahead=3):
+    """Create the monthly TestResult partitions for the next months (Postgres only)."""
+    if not is_partitioned(connection):
+        return
+    today = date.today()
+    create_partitions(connection, today, add_months(today, months_ahead))
+
+
+@shared_task
+def prune_tombstones():
+    cutoff = timezone.now() - timedelta(days=settings.SYNC_TOMBSTONE_RETENTION_DAYS)
+    deleted, _ = Tombstone.objects.filter(deleted_at__lt=cutoff).delete()
+    return deleted
+
+
+@shared_task
+def finalize_expired_attempt(attempt_id):
+    """Timer set when an attempt starts: grade it if it was not submitted in time."""
+    if TestAttempt.objects.filter(pk=attempt_id, status='active', deadline__lte=timezone.now()).exists():
+        attempts.finalize(attempt_id, status='expired')
+
+
+@shared_task
+def finalize_expired_attempts():
+    """Safety net for timers lost with a broker restart."""
+    cutoff = timezone.now() - timedelta(seconds=settings.TEST_ATTEMPT_GRACE_SECONDS)
+    expired = list(TestAttempt.objects.filter(status='active', deadline__lt=cutoff).values_list('pk', flat=True))
+    for attempt_id in expired:
+        attempts.finalize(attempt_id, status='expired')
+    return len(expired)
+
+
+@shared_task
+def flush_activity():
+    """Write buffered view events and refresh the hourly rollups."""
+    return activity.flush()
+
+
+@shared_task
+def prune_activity_events():
+    cutoff = timezone.now() - timedelta(days=settings.ACTIVITY_RAW_RETENTION_DAYS)
+    deleted, _ = ActivityEvent.objects.filter(occurred_at__lt=cutoff).delete()
+    return deleted
+
+
+@shared_task
+def build_course_recommendations():
+    from .recommendations import build_recommendations  # numpy/scipy are only needed by the worker
+    return build_recommendations()
+
+
+@shared_task
+def regrade_test_results(test_id):
+    """Re-score the stored results of a test after its answer key was fixed."""
+    from .grading import regrade, regrade_summaries
+    test = Test.objects.filter(pk=test_id).first()
+    if test is None:
+        return None
+    # Celery's prefork workers are daemonic and cannot start a process pool: score in-process here,
+    # the regrade_results command runs the pool for big re-grades.
+    checked, updated = regrade(test, batch_size=settings.REGRADE_BATCH_SIZE)
+    summaries = regrade_summaries(test)
+    if updated or summaries:
+        rebuild_leaderboards([test_id])
+    return {'checked': checked, 'updated': updated, 'summaries': summaries}
+
+
+def rebuild_leaderboards(test_ids=None):
+    """All leaderboards, or those of the given tests and their courses."""
+    try:
+        leaderboards.rebuild(test_ids)
+    except (RedisError, NotImplementedError):  # NotImplementedError: cache is not Redis (tests)
+        logger.warning("Could not rebuild leaderboards", exc_info=True)
+
+
+@shared_task
+def fan_out_notification(kind, context, audience):
+    """Split the recipients of a notification into chunks, each sent by its own task."""
+    chunk, chunks = [], 0
+    for user_id in notifications.recipient_ids(audience):
+        chunk.append(user_id)
+        if len(chunk) == settings.NOTIFICATION_CHUNK_SIZE:
+            send_notification_chunk.delay(kind, context, chunk)
+            chunk, chunks = [], chunks + 1
+    if chunk:
+        send_notification_chunk.delay(kind, context, chunk)
+        chunks += 1
+    return chunks
+
+
+@shared_task(bind=True, max_retries=5, default_retry_delay=60)
+def send_notification_chunk(self, kind, context, user_ids):
+    """Send one chunk over one SMTP connection; if the server fails, the unsent rest is retried."""
+    try:
+        return notifications.send_chunk(kind, context, user_ids)
+    except notifications.ChunkInterrupted as exc:
+        raise self.retry(args=(kind, context, exc.remaining), exc=exc.__cause__)
@@ -1,3 +1,1094 @@
-from django.test import TestCase
+import hashlib
+import json
+import os
+import smtplib
+import tempfile
+import threading
+import time
+import zlib
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+import fakeredis
+from django.contrib.auth.models import AnonymousUser
+from django.core import mail
+from django.core.cache import cache
+from django.core.mail.backends.locmem import EmailBackend
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import QuerySet
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from redis.exceptions import RedisError
+from rest_framework.test import APIClient
+
+from Diploma_Self_study import profiling
+from Diploma_Self_study.cache import INVALIDATION_CHANNEL, MISSING, TieredCache, tiered
+from users import throttling
+from users.models import Payment, Subscription, User
+from . import access, activity, attempts, leaderboards, notifications, recommendations, tasks
+from .admin_utils import EstimatedCountPaginator
+from .events import EVENTS_CHANNEL, EventBroker, publish_event
+from .filters import PermissionQuerysetFilter
+from .models import (
+    ActivityEvent, Course, CourseAccess, CourseActivityHourly, CourseRecommendation, Enrollment, Material, Test,
+    TestAttempt, TestResult, TestResultArchive, TestResultSummary, Tombstone,
+)
+from .permissions import IsOwnerOrAdmin, IsStudentOrSubscribed
+from .views import EventStreamView
+
+
+class LmsTestCase(TestCase):
+    """Clears the caches between tests: ids are reused after each rollback."""
+
+    def setUp(self):
+        cache.clear()
+        tiered.local.clear()
+        self.client = APIClient()
+
+    def create_user(self, email, role='student', **fields):
+        return User.objects.create_user(username=email, email=email, password='x', role=role, **fields)
+
+
+class PaywallTests(LmsTestCase):
+    def setUp(self):
+        super().setUp()
+        # Signals refresh CourseAccess on commit
+        with self.captureOnCommitCallbacks(execute=True):
+            self.teacher = self.create_user('t@x.com', role='teacher')
+            self.student = self.create_user('s@x.com')
+            self.course = Course.objects.create(title='Free', owner=self.teacher)
+            self.free = Material.objects.create(title='Intro', content='free text', course=self.course,
+                                                owner=self.teacher)
+            self.paid = Material.objects.create(title='Pro', content='paid text', video_link='https://v/1',
+                                                price=100, course=self.course, owner=self.teacher)
+            Enrollment.objects.create(user=self.student, course=self.course)
+        self.client.force_authenticate(self.student)
+
+    def material_contents(self, materials):
+        return {material['id']: material['content'] for material in materials}
+
+    def assertLocked(self, materials):
+        contents = self.material_contents(materials)
+        self.assertEqual(contents[self.free.pk], 'free text')
+        self.assertIsNone(contents[self.paid.pk])
+
+    def test_retrieve_requires_payment(self):
+        self.assertEqual(self.client.get(f'/api/materials/{self.paid.pk}/').status_code, 402)
+
+    def test_material_list(self):
+        self.assertLocked(self.client.get('/api/materials/').json())
+        materials = self.client.get('/api/materials/?fields=id,content,video_link').json()
+        self.assertLocked(materials)
+        self.assertEqual(set(materials[0]), {'id', 'content', 'video_link'})
+
+    def test_sync(self):
+        self.assertLocked(self.client.get('/api/sync/').json()['materials'])
+
+    def test_my_courses(self):
+        self.assertLocked(self.client.get('/api/courses/my/').json()['courses'][0]['materials'])
+        courses = self.client.get('/api/courses/my/?fields=id,materials.id,materials.content').json()['courses']
+        self.assertLocked(courses[0]['materials'])
+
+    def test_public_course_list(self):
+        self.client.force_authenticate(None)
+        self.assertLocked(self.client.get('/api/courses/').json()[0]['materials'])
+
+    def test_bought_material(self):
+        # Older than the overlap of consecutive syncs
+        Material.objects.update(updated_at=timezone.now() - timedelta(hours=1))
+        Enrollment.objects.update(enrolled_at=timezone.now() - timedelta(hours=1))
+        watermark = self.client.get('/api/sync/').json()['watermark']
+        Payment.objects.create(user=self.student, paid_material=self.paid, payment_amount=100, status='completed',
+                               payment_date=timezone.localdate())
+        contents = self.material_contents(self.client.get('/api/materials/').json())
+        self.assertEqual(contents[self.paid.pk], 'paid text')
+        # The purchase resends the material to clients that synced before it
+        materials = self.client.get('/api/sync/', {'since': watermark}).json()['materials']
+        self.assertEqual(self.material_contents(materials), {self.paid.pk: 'paid text'})
+
+    def test_teacher_reads_everything(self):
+        self.client.force_authenticate(self.teacher)
+        contents = self.material_contents(self.client.get('/api/courses/my/').json()['courses'][0]['materials'])
+        self.assertEqual(contents[self.paid.pk], 'paid text')
+
+
+class ListVisibilityTests(LmsTestCase):
+    def setUp(self):
+        super().setUp()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.owner = self.create_user('t@x.com', role='teacher')
+            other = self.create_user('o@x.com', role='teacher')
+            self.student = self.create_user('s@x.com')
+            self.course, self.other_course = (Course.objects.create(title=title, owner=teacher)
+                                              for title, teacher in (('A', self.owner), ('B', other)))
+            self.materials = [Material.objects.create(title='M', content='x', course=course, owner=course.owner)
+                              for course in (self.course, self.other_course)]
+            self.tests = [Test.objects.create(material=material, owner=material.owner, questions=[])
+                          for material in self.materials]
+            Enrollment.objects.create(user=self.student, course=self.course)
+
+    def ids(self, url):
+        data = self.client.get(url).json()
+        return {row['id'] for row in (data['results'] if isinstance(data, dict) else data)}
+
+    def filtered(self, user, permission, queryset, action='list'):
+        view = mock.Mock(action=action, get_permissions=lambda: [permission])
+        return set(PermissionQuerysetFilter().filter_queryset(mock.Mock(user=user), queryset, view)
+                   .values_list('pk', flat=True))
+
+    def test_student_lists_accessible_courses_only(self):
+        self.client.force_authenticate(self.student)
+        self.assertEqual(self.ids('/api/materials/'), {self.materials[0].pk})
+        self.assertEqual(self.ids('/api/tests/'), {self.tests[0].pk})
+        # The catalog stays public
+        self.assertEqual(self.ids('/api/courses/'), {self.course.pk, self.other_course.pk})
+
+    def test_student_after_unenrolling(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Enrollment.objects.filter(user=self.student).delete()
+        self.client.force_authenticate(self.student)
+        self.assertEqual(self.ids('/api/materials/'), set())
+        self.assertEqual(self.ids('/api/tests/'), set())
+
+    def test_owner_and_admin(self):
+        admin = self.create_user('a@x.com', role='admin', is_staff=True)
+        everything = {self.course.pk, self.other_course.pk}
+        courses = Course.objects.all()
+        self.assertEqual(self.filtered(self.owner, IsOwnerOrAdmin(), courses), {self.course.pk})
+        self.assertEqual(self.filtered(admin, IsOwnerOrAdmin(), courses), everything)
+        self.assertEqual(self.filtered(self.owner, IsStudentOrSubscribed(), Material.objects.all()),
+                         {material.pk for material in self.materials})
+        self.assertEqual(self.filtered(admin, IsStudentOrSubscribed(), Test.objects.all()),
+                         {test.pk for test in self.tests})
+        # Single objects are left to has_object_permission
+        self.assertEqual(self.filtered(self.owner, IsOwnerOrAdmin(), courses, action='retrieve'), everything)
+
+    def test_teachers_cannot_list_student_content(self):
+        # IsStudentOrSubscribed admits students only on these lists
+        for user in (self.owner, self.create_user('a@x.com', role='admin', is_staff=True)):
+            self.client.force_authenticate(user)
+            self.assertEqual(self.client.get('/api/materials/').status_code, 403)
+            self.assertEqual(self.client.get('/api/tests/').status_code, 403)
+
+
+@override_settings(NOTIFICATION_CHUNK_SIZE=2)
+class NotificationTests(LmsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.teacher = self.create_user('t@x.com', role='teacher')
+        self.course = Course.objects.create(title='C', owner=self.teacher)
+        self.students = [self.create_user(f's{number}@x.com') for number in range(5)]
+        self.students[4].is_active = False
+        self.students[4].save()
+        Enrollment.objects.bulk_create(Enrollment(user=student, course=self.course) for student in self.students)
+
+    def notify_course(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            notifications.notify('material_added', {'course': 'C', 'material': 'M'}, course_id=self.course.pk)
+
+    def recipients(self):
+        return sorted(message.to[0] for message in mail.outbox)
+
+    def test_fan_out_in_chunks(self):
+        with mock.patch('lms.notifications.get_connection', wraps=notifications.get_connection) as connections:
+            self.notify_course()
+        self.assertEqual(self.recipients(), [f's{number}@x.com' for number in range(4)])
+        self.assertEqual(connections.call_count, 3)  # One per chunk of 2, the inactive student is skipped
+
+    def test_retry_skips_served_recipients(self):
+        send_messages = EmailBackend.send_messages
+        failures = iter([False, True])  # The server drops the connection on the second message of a chunk
+
+        def flaky(backend, messages):
+            if next(failures, False):
+                raise smtplib.SMTPServerDisconnected()
+            return send_messages(backend, messages)
+
+        with mock.patch.object(EmailBackend, 'send_messages', flaky):
+            self.notify_course()
+        self.assertEqual(self.recipients(), [f's{number}@x.com' for number in range(4)])
+
+    def test_plain_text_is_not_escaped(self):
+        subject, body = notifications.render('material_added', {'course': 'Rock & Roll "101"', 'material': '<Intro>'})
+        self.assertEqual(subject, 'Новый материал в курсе «Rock & Roll "101"»')
+        self.assertIn('В курсе «Rock & Roll "101"» появился новый материал: «<Intro>».', body)
+
+
+class EventTests(LmsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.broker = EventBroker()
+        # No Redis subscription, events are dispatched by hand
+        self.enterContext(mock.patch.object(EventBroker, 'read', mock.AsyncMock()))
+
+    def received(self, queue):
+        return [queue.get_nowait()['type'] for _ in range(queue.qsize())]
+
+    def event(self, event_type, user=None, course=None):
+        self.broker.dispatch({'type': event_type, 'data': {}, 'user': user, 'course': course})
+
+    async def test_routing(self):
+        alice, bob = self.broker.subscribe(1, [10]), self.broker.subscribe(2, [])
+        self.event('test_graded', user=1)
+        self.event('material_added', course=10)
+        self.assertEqual((self.received(alice), self.received(bob)), (['test_graded', 'material_added'], []))
+        # Course events follow an enrollment made while connected
+        self.event('enrollment_confirmed', user=2, course=10)
+        self.event('material_added', course=10)
+        self.assertEqual((self.received(alice), self.received(bob)),
+                         (['material_added'], ['enrollment_confirmed', 'material_added']))
+        self.broker.unsubscribe(alice)
+        self.event('material_added', course=10)
+        self.assertEqual(self.received(alice), [])
+
+    async def test_slow_client(self):
+        self.broker.queue_size = 1
+        queue = self.broker.subscribe(1, [])
+        with self.assertLogs('lms.events', 'WARNING'):
+            self.event('test_graded', user=1)
+            self.event('payment_completed', user=1)
+        self.assertEqual(self.received(queue), ['test_graded'])
+
+    async def test_stream(self):
+        with mock.patch('lms.views.broker', self.broker):
+            stream = EventStreamView().stream(1, [10])
+            self.assertEqual(await anext(stream), 'retry: 5000\n\n')
+            self.broker.dispatch({'type': 'material_added', 'data': {'material': 'M'}, 'user': None, 'course': 10})
+            self.assertEqual(await anext(stream), 'event: material_added\ndata: {"material": "M"}\n\n')
+            await stream.aclose()
+        self.assertEqual(self.broker.listeners, {})
+
+    def test_published_on_commit(self):
+        redis = fakeredis.FakeRedis()
+        pubsub = redis.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(EVENTS_CHANNEL)
+        with mock.patch('lms.events.get_redis_connection', return_value=redis):
+            with self.captureOnCommitCallbacks(execute=True):
+                publish_event('material_added', {'material': 'M'}, course_id=10)
+                self.assertIsNone(pubsub.get_message())
+        self.assertEqual(json.loads(pubsub.get_message()['data']),
+                         {'type': 'material_added', 'data': {'material': 'M'}, 'user': None, 'course': 10})
+
+    def test_stream_requires_a_token(self):
+        self.assertEqual(self.client.get('/api/events/').status_code, 401)
+        self.assertEqual(self.client.get('/api/events/?token=forged').status_code, 401)
+
+
+class MediaTests(LmsTestCase):
+    def setUp(self):
+        super().setUp()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        os.makedirs(os.path.join(media.name, 'lms/illustrations'))
+        with open(os.path.join(media.name, 'lms/illustrations/shared.png'), 'wb') as file:
+            file.write(b'png')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.teacher = self.create_user('t@x.com', role='teacher')
+            self.student = self.create_user('s@x.com')
+            original = Course.objects.create(title='Original', owner=self.teacher)
+            Material.objects.create(title='M', content='x', course=original, owner=self.teacher,
+                                    illustration='lms/illustrations/shared.png')
+            self.clone = original.clone(owner=self.teacher, title='Clone')
+        self.client.force_authenticate(self.student)
+
+    def get(self):
+        return self.client.get('/media/lms/illustrations/shared.png')
+
+    def test_shared_illustration_of_a_clone(self):
+        self.assertEqual(self.get().status_code, 403)
+        with self.captureOnCommitCallbacks(execute=True):
+            Enrollment.objects.create(user=self.student, course=self.clone)
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'png')
+
+    def test_paid_illustration(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Material.objects.filter(course=self.clone).update(price=100)
+            Enrollment.objects.create(user=self.student, course=self.clone)
+        self.assertEqual(self.get().status_code, 402)
+
+
+class CloneTests(LmsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.teacher = self.create_user('t@x.com', role='teacher')
+        self.course = Course.objects.create(title='C', owner=self.teacher)
+        Material.objects.create(title='M', content='x', course=self.course, owner=self.teacher)
+
+    def test_owner_clones(self):
+        self.client.force_authenticate(self.teacher)
+        response = self.client.post(f'/api/courses/{self.course.pk}/clone/', {'title': 'Copy'}, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        clone = Course.objects.get(pk=response.json()['id'])
+        self.assertEqual((clone.title, clone.owner_id, clone.materials.count()), ('Copy', self.teacher.pk, 1))
+
+    def test_other_teacher_cannot_clone(self):
+        self.client.force_authenticate(self.create_user('other@x.com', role='teacher'))
+        self.assertEqual(self.client.post(f'/api/courses/{self.course.pk}/clone/').status_code, 403)
+
+
+class AttemptTests(LmsTestCase):
+    def setUp(self):
+        super().setUp()
+        throttling._bucket = None  # Fresh buckets for every test
+        self.redis = fakeredis.FakeRedis()
+        self.enterContext(mock.patch('lms.attempts.get_connection', return_value=self.redis))
+        with self.captureOnCommitCallbacks(execute=True):
+            teacher = self.create_user('t@x.com', role='teacher')
+            self.student = self.create_user('s@x.com')
+            course = Course.objects.create(title='C', owner=teacher)
+            material = Material.objects.create(title='M', content='x', course=course, owner=teacher)
+            self.test = Test.objects.create(material=material, owner=teacher, questions=[
+                {'question': 'q1', 'answers': ['A', 'B'], 'correct': 'A'},
+                {'id': 7, 'question': 'q2', 'answers': ['A', 'B'], 'correct': 'B'},
+            ])
+            Enrollment.objects.create(user=self.student, course=course)
+        self.client.force_authenticate(self.student)
+
+    def start(self):
+        return self.client.post(f'/api/tests/{self.test.pk}/attempts/')
+
+    def save(self, attempt_id, answers):
+        return self.client.patch(f'/api/attempts/{attempt_id}/answers/', {'answers': answers}, format='json')
+
+    def test_autosave_and_submit(self):
+        response = self.start()
+        self.assertEqual(response.status_code, 201, response.content)
+        attempt_id = response.json()['attempt']
+        self.assertEqual(self.save(attempt_id, {'question1': 'A'}).json(), {'saved': 1})
+        self.assertEqual(self.save(attempt_id, {'7': 'A'}).json(), {'saved': 1})
+        self.assertEqual(self.save(attempt_id, {'7': 'B'}).json(), {'saved': 1})
+
+        resumed = self.start()
+        self.assertEqual(resumed.status_code, 200)
+        self.assertEqual(resumed.json()['answers'], {'question1': 'A', '7': 'B'})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            result = self.client.post(f'/api/attempts/{attempt_id}/submit/').json()
+        self.assertEqual((result['status'], result['score'], result['passed']), ('submitted', 100.0, True))
+        self.assertFalse(self.redis.exists(attempts.META_KEY.format(attempt_id)))
+        # Finished: autosave is refused and the result is read from the database
+        self.assertEqual(self.save(attempt_id, {'question1': 'B'}).status_code, 404)
+        self.assertEqual(self.client.get(f'/api/attempts/{attempt_id}/').json()['score'], 100.0)
+        self.assertEqual(TestResult.objects.filter(user=self.student, test=self.test).count(), 1)
+
+    def test_unknown_question(self):
+        attempt_id = self.start().json()['attempt']
+        for answers in ({'question3': 'A'}, {'question1': 'A', 'junk': 'x'}, {'question1': 'A' * 5000}):
+            self.assertEqual(self.save(attempt_id, answers).status_code, 400)
+        self.assertEqual(self.client.get(f'/api/attempts/{attempt_id}/').json()['answers'], {})
+
+    def test_autosave_throttle(self):
+        attempt_id = self.start().json()['attempt']
+        with mock.patch.object(throttling.AutosaveRateThrottle, 'rate', '2/min', create=True):
+            for _ in range(2):
+                self.assertEqual(self.save(attempt_id, {'question1': 'A'}).status_code, 200)
+            self.assertEqual(self.save(attempt_id, {'question1': 'A'}).status_code, 429)
+
+    def test_other_users_attempt(self):
+        attempt_id = self.start().json()['attempt']
+        self.client.force_authenticate(self.create_user('other@x.com'))
+        self.assertEqual(self.save(attempt_id, {'question1': 'A'}).status_code, 404)
+        self.assertEqual(self.client.get(f'/api/attempts/{attempt_id}/').status_code, 404)
+
+    def test_concurrent_start(self):
+        first_click, _ = attempts.start(self.student, self.test)
+        first = QuerySet.first
+        stale = [None]  # The second click looked for a running attempt before the first one inserted it
+
+        with mock.patch.object(QuerySet, 'first', lambda queryset: stale.pop() if stale else first(queryset)):
+            response = self.start()
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.json()['attempt'], first_click.pk)
+        self.assertEqual(TestAttempt.objects.filter(user=self.student).count(), 1)
+
+    def test_submit_while_redis_is_down(self):
+        attempt_id = self.start().json()['attempt']
+        with mock.patch.object(fakeredis.FakeRedis, 'pipeline', side_effect=RedisError):
+            response = self.client.post(f'/api/attempts/{attempt_id}/submit/')
+        self.assertEqual(response.status_code, 503)
+        # Nothing was graded, the attempt can be submitted once Redis is back
+        self.assertEqual(TestAttempt.objects.get(pk=attempt_id).status, 'active')
+        self.assertFalse(TestResult.objects.exists())
+        self.assertEqual(self.client.post(f'/api/attempts/{attempt_id}/submit/').json()['status'], 'submitted')
+
+    def test_redis_failure_rolls_back(self):
+        with mock.patch.object(fakeredis.FakeRedis, 'pipeline', side_effect=RedisError):
+            self.assertEqual(self.start().status_code, 503)
+        self.assertFalse(TestAttempt.objects.exists())
+
+
+class RegradeTests(LmsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.redis = fakeredis.FakeRedis()
+        self.enterContext(mock.patch('lms.leaderboards.get_connection', return_value=self.redis))
+        teacher = self.create_user('t@x.com', role='teacher')
+        self.student = self.create_user('s@x.com')
+        self.course, self.other_course = (Course.objects.create(title=title, owner=teacher) for title in 'AB')
+        self.fixed, self.sibling, self.other = (
+            Test.objects.create(material=Material.objects.create(title='M', content='x', course=course, owner=teacher),
+                                owner=teacher, questions=[{'question': 'q', 'answers': ['A', 'B'], 'correct': 'A'}])
+            for course in (self.course, self.course, self.other_course)
+        )
+        # Graded against the broken key
+        TestResult.objects.create(user=self.student, test=self.fixed, answers={'question1': 'A'}, score=0)
+        TestResult.objects.create(user=self.student, test=self.sibling, answers={'question1': 'A'}, score=100)
+
+    def board(self, key):
+        return {int(member): score for member, score in self.redis.zrange(key, 0, -1, withscores=True)}
+
+    def test_rebuilds_only_the_affected_boards(self):
+        untouched = {leaderboards.TEST_KEY.format(self.other.pk), leaderboards.COURSE_KEY.format(self.other_course.pk)}
+        for key in untouched:
+            self.redis.zadd(key, {'99': 5})
+        self.assertEqual(tasks.regrade_test_results(self.fixed.pk), {'checked': 1, 'updated': 1, 'summaries': 0})
+        self.assertEqual(self.board(leaderboards.TEST_KEY.format(self.fixed.pk)), {self.student.pk: 100})
+        # The course board keeps the sibling test's score
+        self.assertEqual(self.board(leaderboards.COURSE_KEY.format(self.course.pk)), {self.student.pk: 200})
+        self.assertFalse(self.redis.exists(leaderboards.TEST_KEY.format(self.sibling.pk)))
+        for key in untouched:
+            self.assertEqual(self.board(key), {99: 5})
+
+    def test_archived_results(self):
+        veteran = self.create_user('v@x.com')
+        TestResult.objects.create(user=veteran, test=self.fixed, answers={'question1': 'A'}, score=0)
+        TestResult.objects.filter(user=veteran).update(completed_at=timezone.now() - timedelta(days=400))
+        self.assertEqual(tasks.compact_test_results(), 1)
+
+        self.assertEqual(tasks.regrade_test_results(self.fixed.pk), {'checked': 1, 'updated': 1, 'summaries': 1})
+        summary = TestResultSummary.objects.get(user=veteran)
+        self.assertEqual((summary.best_score, summary.passed, summary.attempts), (100, True, 1))
+        self.assertEqual(self.board(leaderboards.TEST_KEY.format(self.fixed.pk)),
+                         {self.student.pk: 100, veteran.pk: 100})
+
+    def test_owner_starts_regrade(self):
+        self.client.force_authenticate(self.fixed.owner)
+        self.assertEqual(self.client.post(f'/api/tests/{self.fixed.pk}/regrade/').status_code, 202)
+        self.assertEqual(TestResult.objects.get(test=self.fixed).score, 100)
+
+    def test_other_teacher_cannot_regrade(self):
+        self.client.force_authenticate(self.create_user('other@x.com', role='teacher'))
+        self.assertEqual(self.client.post(f'/api/tests/{self.fixed.pk}/regrade/').status_code, 403)
+        self.assertEqual(TestResult.objects.get(test=self.fixed).score, 0)
+
+
+class CompactionTests(LmsTestCase):
+    def setUp(self):
+        super().setUp()
+        teacher = self.create_user('t@x.com', role='teacher')
+        self.student = self.create_user('s@x.com')
+        course = Course.objects.create(title='C', owner=teacher)
+        material = Material.objects.create(title='M', content='x', course=course, owner=teacher)
+        self.test = Test.objects.create(material=material, owner=teacher,
+                                        questions=[{'question': 'q', 'answers': ['A', 'B'], 'correct': 'A'}])
+
+    def result(self, score, days_ago):
+        result = TestResult.objects.create(user=self.student, test=self.test, answers={'question1': 'A'},
+                                           score=score, passed=score >= 50)
+        TestResult.objects.filter(pk=result.pk).update(completed_at=timezone.now() - timedelta(days=days_ago))
+        return result
+
+    @override_settings(TEST_RESULT_RETENTION_DAYS=180, TEST_RESULT_COMPACTION_BATCH=2)
+    def test_fold_archive_and_delete(self):
+        last_run = timezone.now() - timedelta(days=500)
+        TestResultSummary.objects.create(user=self.student, test=self.test, attempts=2, best_score=90, passed=True,
+                                         last_completed_at=last_run)
+        old = [self.result(score, days_ago) for score, days_ago in ((40, 300), (70, 250), (10, 200))]
+        recent = self.result(20, 10)
+        newest = TestResult.objects.get(pk=old[-1].pk).completed_at
+
+        self.assertEqual(tasks.compact_test_results(), 3)
+        self.assertEqual(list(TestResult.objects.values_list('pk', flat=True)), [recent.pk])
+        summary = TestResultSummary.objects.get()
+        self.assertEqual((summary.attempts, summary.best_score, summary.passed), (5, 90, True))
+        self.assertEqual(summary.last_completed_at, newest)
+        # One blob per batch, the rows come back from it as they were
+        archives = TestResultArchive.objects.order_by('first_completed_at')
+        self.assertEqual([archive.results_count for archive in archives], [2, 1])
+        rows = [json.loads(line) for archive in archives
+                for line in zlib.decompress(archive.data).decode().splitlines()]
+        self.assertEqual([(row['id'], row['score'], row['answers']) for row in rows],
+                         [(result.pk, result.score, {'question1': 'A'}) for result in old])
+        self.assertEqual(tasks.compact_test_results(), 0)
+
+
+class RenderingTests(LmsTestCase):
+    def setUp(self):
+        super().setUp()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.teacher = self.create_user('t@x.com', role='teacher')
+            self.student = self.create_user('s@x.com')
+            course = Course.objects.create(title='Курс', owner=self.teacher, price='1499.90')
+            Material.objects.create(title='Free', content='x', course=course, owner=self.teacher)
+            Material.objects.create(title='Paid', content='secret', price='10.50', course=course, owner=self.teacher)
+            Enrollment.objects.create(user=self.student, course=course)
+
+    def test_values_list_matches_model_serializer(self):
+        # Detail views still go through the ModelSerializer
+        self.client.force_authenticate(self.create_user('a@x.com', role='admin', is_staff=True))
+        courses = self.client.get('/api/courses/').json()
+        self.assertEqual(courses, [self.client.get(f"/api/courses/{course['id']}/").json() for course in courses])
+
+        self.client.force_authenticate(self.student)
+        free, paid = sorted(self.client.get('/api/materials/').json(), key=lambda material: material['price'])
+        self.assertEqual(free, self.client.get(f"/api/materials/{free['id']}/").json())
+        self.assertEqual((paid['price'], paid['content']), ('10.50', None))
+
+    def test_decimals_and_unicode(self):
+        response = self.client.get('/api/courses/')
+        self.assertIn('"title":"Курс"'.encode(), response.content)
+        self.assertEqual(response.json()[0]['price'], '1499.90')
+
+    def test_malformed_json(self):
+        self.client.force_authenticate(self.create_user('a@x.com', role='admin', is_staff=True))
+        response = self.client.generic('POST', '/api/courses/', '{"title": ', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('JSON parse error', response.json()['detail'])
+
+
+class AdminTests(LmsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.admin = self.create_user('a@x.com', role='admin', is_staff=True, is_superuser=True)
+        teacher = self.create_user('t@x.com', role='teacher')
+        course = Course.objects.create(title='C', owner=teacher)
+        self.tests = [
+            Test.objects.create(material=Material.objects.create(title='M', content='x', course=course, owner=teacher),
+                                owner=teacher, questions=[])
+            for _ in range(2)
+        ]
+        self.results = [TestResult.objects.create(user=self.admin, test=test, answers={}, score=0)
+                        for test in self.tests]
+        self.client.force_login(self.admin)
+
+    def paginator(self, plan_rows):
+        """EstimatedCountPaginator over all results, with the planner estimate of a Postgres connection."""
+        connection = mock.MagicMock(vendor='postgresql')
+        cursor = connection.cursor.return_value.__enter__.return_value
+        cursor.fetchone.return_value = [[{'Plan': {'Plan Rows': plan_rows}}]]
+        self.enterContext(mock.patch('lms.admin_utils.connections', {'default': connection}))
+        return EstimatedCountPaginator(TestResult.objects.all(), 100)
+
+    def test_estimated_count(self):
+        paginator = self.paginator(plan_rows=2_000_000)
+        with self.assertNumQueries(0):
+            self.assertEqual(paginator.count, 2_000_000)
+        self.assertEqual(paginator.num_pages, 20_000)
+
+    def test_small_tables_are_counted(self):
+        paginator = self.paginator(plan_rows=50)
+        with self.assertNumQueries(1):
+            self.assertEqual(paginator.count, 2)
+
+    def test_input_filter(self):
+        response = self.client.get('/admin/lms/testresult/', {'test_id': self.tests[1].pk, 'q': 'a@'})
+        self.assertEqual(list(response.context['cl'].result_list), [self.results[1]])
+        self.assertContains(response, 'name="q" value="a@"')  # Kept when the box is submitted
+        # A value the lookup can't take is reported like any other bad filter
+        self.assertRedirects(self.client.get('/admin/lms/testresult/', {'test_id': 'abc'}),
+                             '/admin/lms/testresult/?e=1')
+
+
+class RecommendationTests(LmsTestCase):
+    def setUp(self):
+        super().setUp()
+        teacher = self.create_user('t@x.com', role='teacher')
+        self.a, self.b, self.c, self.d = (Course.objects.create(title=title, owner=teacher, price=10)
+                                          for title in 'ABCD')
+        enrollments = {'s1': 'abc', 's2': 'ab', 's3': 'ac', 's4': 'bd'}
+        for name, courses in enrollments.items():
+            student = self.create_user(f'{name}@x.com')
+            Enrollment.objects.bulk_create(Enrollment(user=student, course=getattr(self, course)) for course in courses)
+
+    def recommended(self, course):
+        return [(row.recommended_id, round(row.score, 4))
+                for row in CourseRecommendation.objects.filter(course=course).order_by('rank')]
+
+    def test_co_enrollment(self):
+        CourseRecommendation.objects.create(course=self.d, recommended=self.a, score=1, rank=1)  # Stale
+        self.assertEqual(tasks.build_course_recommendations(), 4)
+        # Cosine over students: A-C share 2 of 3 and 2, A-B 2 of 3 and 3; pairs with one shared student are dropped
+        self.assertEqual(self.recommended(self.a), [(self.c.pk, 0.8165), (self.b.pk, 0.6667)])
+        self.assertEqual(self.recommended(self.b), [(self.a.pk, 0.6667)])
+        self.assertEqual(self.recommended(self.c), [(self.a.pk, 0.8165)])
+        self.assertEqual(self.recommended(self.d), [])
+
+        response = self.client.get(f'/api/courses/{self.a.pk}/recommendations/').json()
+        self.assertEqual([(row['id'], row['title'], row['price']) for row in response],
+                         [(self.c.pk, 'C', '10.00'), (self.b.pk, 'B', '10.00')])
+
+    def test_top_k_and_support(self):
+        self.assertEqual(recommendations.build_recommendations(k=1), 3)
+        self.assertEqual(self.recommended(self.a), [(self.c.pk, 0.8165)])
+        recommendations.build_recommendations(min_support=1)
+        self.assertEqual([course for course, _ in self.recommended(self.b)], [self.a.pk, self.d.pk, self.c.pk])
+
+    def test_no_enrollments(self):
+        Enrollment.objects.all().delete()
+        self.assertEqual(recommendations.build_recommendations(), 0)
+
+
+class AccessTests(LmsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.teacher = self.create_user('t@x.com', role='teacher')
+        self.student = self.create_user('s@x.com')
+        self.free, self.paid, self.subscribed = (Course.objects.create(title=title, owner=self.teacher, price=100)
+                                                 for title in ('Free', 'Paid', 'Subscribed'))
+
+    def reasons(self):
+        return {
+            (row.user_id, row.course_id): {field for field in access.SOURCE_FIELDS if getattr(row, field)}
+            for row in CourseAccess.objects.all()
+        }
+
+    def test_signals_keep_access_current(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            enrollment = Enrollment.objects.create(user=self.student, course=self.paid)
+        self.assertTrue(access.has_access(self.student, self.paid.pk))
+        with self.captureOnCommitCallbacks(execute=True):
+            Payment.objects.create(user=self.student, paid_course=self.paid, payment_amount=100, payment_type='card',
+                                   status='completed')
+        with self.captureOnCommitCallbacks(execute=True):
+            enrollment.delete()
+        # Still paid for
+        self.assertEqual(self.reasons()[self.student.pk, self.paid.pk], {'via_payment'})
+        self.assertTrue(access.has_access(self.student, self.paid.pk))
+        with self.captureOnCommitCallbacks(execute=True):
+            Payment.objects.all().delete()
+        self.assertFalse(access.has_access(self.student, self.paid.pk))
+
+    def test_rebuild(self):
+        # Rows written without signals and a row nothing grants any more
+        Enrollment.objects.bulk_create([Enrollment(user=self.student, course=self.free)])
+        Payment.objects.bulk_create([Payment(user=self.student, paid_course=self.paid, payment_amount=100,
+                                             payment_type='card', status='completed')])
+        Subscription.objects.bulk_create([Subscription(user_sub=self.student, course=self.subscribed)])
+        stale = self.create_user('gone@x.com')
+        CourseAccess.objects.create(user=stale, course=self.free, via_enrollment=True)
+        self.assertTrue(access.has_access(stale, self.free.pk))
+        self.assertFalse(access.has_access(self.student, self.free.pk))  # Cached
+
+        out = StringIO()
+        call_command('rebuild_course_access', stdout=out)
+        self.assertIn('Rebuilt 6 course access rows', out.getvalue())
+        self.assertEqual(self.reasons(), {
+            (self.student.pk, self.free.pk): {'via_enrollment'},
+            (self.student.pk, self.paid.pk): {'via_payment'},
+            (self.student.pk, self.subscribed.pk): {'via_subscription'},
+            **{(self.teacher.pk, course.pk): {'via_ownership'} for course in (self.free, self.paid, self.subscribed)},
+        })
+        # Both caches are dropped
+        self.assertTrue(access.has_access(self.student, self.free.pk))
+        self.assertFalse(access.has_access(stale, self.free.pk))
+
+
+class TieredCacheTests(LmsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.tiered = TieredCache()
+        self.computed = 0
+
+    def compute(self, value='fresh', delay=0):
+        def compute():
+            time.sleep(delay)
+            self.computed += 1
+            return value
+        return compute
+
+    def wait_until(self, condition):
+        deadline = time.monotonic() + 2
+        while not condition():
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.01)
+
+    def test_single_flight(self):
+        barrier = threading.Barrier(8)
+        results = []
+
+        def read():
+            barrier.wait()
+            results.append(self.tiered.get_or_set('k', self.compute(delay=0.1), 60))
+
+        threads = [threading.Thread(target=read) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual((results, self.computed), (['fresh'] * 8, 1))
+        self.assertEqual(self.tiered.stats()['local_hits'], 7)
+
+    def test_waits_for_another_worker(self):
+        other = TieredCache()
+        self.assertTrue(other.acquire('k'))
+        threading.Timer(0.1, other.recompute, ('k', lambda: 'theirs', 60)).start()
+        self.assertEqual(self.tiered.get_or_set('k', self.compute(), 60), 'theirs')
+        self.assertEqual((self.computed, self.tiered.stats()['lock_waits']), (0, 1))
+
+    @override_settings(TIERED_CACHE_LOCK_WAIT=0.1)
+    def test_gives_up_on_a_stuck_worker(self):
+        self.assertTrue(TieredCache().acquire('k'))  # Never released
+        self.assertEqual(self.tiered.get_or_set('k', self.compute(), 60), 'fresh')
+        self.assertEqual(self.tiered.stats()['lock_timeouts'], 1)
+
+    def test_early_recompute(self):
+        # Took 10s to compute and expires in 1s
+        cache.set('k', ('old', 10.0, time.time() + 1), 60)
+        with mock.patch('random.random', return_value=1.0):
+            self.assertEqual(self.tiered.fetch('k', self.compute(), 60), 'old')
+        with mock.patch('random.random', return_value=1e-9):
+            self.assertEqual(self.tiered.fetch('k', self.compute(), 60), 'fresh')
+        self.assertEqual(cache.get('k')[0], 'fresh')
+
+    def test_delete(self):
+        self.assertEqual(self.tiered.get_or_set('k', self.compute('v1'), 60), 'v1')
+        self.assertEqual(self.tiered.get_or_set('k', self.compute('v2'), 60), 'v1')
+        self.tiered.delete('k')
+        self.assertEqual(self.tiered.get_or_set('k', self.compute('v2'), 60), 'v2')
+        # None is computed again every time
+        self.tiered.get_or_set('none', self.compute(None), 60)
+        self.tiered.get_or_set('none', self.compute(None), 60)
+        self.assertEqual(self.computed, 4)
+
+    def test_invalidation_from_other_processes(self):
+        redis = fakeredis.FakeRedis()
+        self.enterContext(mock.patch('Diploma_Self_study.cache.get_redis_connection', return_value=redis))
+        self.tiered.listen()
+        self.wait_until(lambda: redis.pubsub_numsub(INVALIDATION_CHANNEL)[0][1])
+        self.tiered.local.set('k', 'stale', 30)
+        # What delete() sends from another process
+        redis.publish(INVALIDATION_CHANNEL, json.dumps(['k']))
+        self.wait_until(lambda: self.tiered.local.get('k') is MISSING)
+
+
+class FieldsetTests(LmsTestCase):
+    def setUp(self):
+        super().setUp()
+        teacher = self.create_user('t@x.com', role='teacher')
+        self.course = Course.objects.create(title='C', description='long text', owner=teacher)
+        for title in ('M1', 'M2'):
+            Material.objects.create(title=title, content='x', course=self.course, owner=teacher)
+
+    def get(self, url, **params):
+        return self.client.get(url, params).json()
+
+    def test_course_shapes(self):
+        self.client.force_authenticate(self.create_user('a@x.com', role='admin', is_staff=True))
+        detail_url = f'/api/courses/{self.course.pk}/'
+        for params in ({}, {'fields': 'id,title,materials.title'}, {'expand': ''}, {'fields': 'id', 'expand': ''}):
+            # The values list and the ModelSerializer agree for every fieldset
+            self.assertEqual(self.get('/api/courses/', **params), [self.get(detail_url, **params)], params)
+
+        self.assertEqual(len(self.get(detail_url)['materials'][0]), len(Material._meta.concrete_fields))
+        self.assertEqual(self.get(detail_url, fields='id,title,materials.title'),
+                         {'id': self.course.pk, 'title': 'C', 'materials': [{'title': 'M1'}, {'title': 'M2'}]})
+        self.assertNotIn('materials', self.get(detail_url, expand=''))
+
+    def test_only_selected_columns_are_read(self):
+        with CaptureQueriesContext(connection) as full:
+            self.get('/api/courses/')
+        with CaptureQueriesContext(connection) as sparse:
+            self.get('/api/courses/', fields='id,title', expand='')
+        self.assertIn('"description"', full[0]['sql'])
+        self.assertNotIn('"description"', sparse[0]['sql'])
+        self.assertFalse(any('lms_material' in query['sql'] for query in sparse))
+        self.assertLess(len(sparse), len(full))
+
+    def test_enrollment_course_as_id(self):
+        self.client.force_authenticate(self.create_user('s@x.com'))
+        url = f'/api/courses/{self.course.pk}/enroll/'
+        self.assertEqual(self.client.post(url).json()['enrollment']['course']['title'], 'C')
+        response = self.client.post(f'{url}?expand=&fields=id,course')
+        self.assertEqual(set(response.json()['enrollment']), {'id', 'course'})
+        self.assertEqual(response.json()['enrollment']['course'], self.course.pk)
+
+
+class SchemaTests(LmsTestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'openapi.json')
+        self.enterContext(override_settings(OPENAPI_SCHEMA_FILE=self.path))
+
+    def test_revalidation(self):
+        # No deploy-time file: generated on the first request
+        response = self.client.get('/api/schema/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('/api/courses/', response.json()['paths'])
+        self.assertEqual(response['ETag'], f'"{hashlib.sha256(response.content).hexdigest()}"')
+        self.assertEqual(response['Cache-Control'], 'public, no-cache')
+
+        with mock.patch('Diploma_Self_study.schema.generate_schema') as generate:
+            revalidated = self.client.get('/api/schema/', HTTP_IF_NONE_MATCH=response['ETag'])
+            generate.assert_not_called()
+        self.assertEqual((revalidated.status_code, revalidated.content), (304, b''))
+        self.assertEqual(revalidated['ETag'], response['ETag'])
+        self.assertEqual(self.client.get('/api/schema/', HTTP_IF_NONE_MATCH='"other"').status_code, 200)
+
+    def test_deploy_replaces_the_cached_copy(self):
+        with mock.patch('Diploma_Self_study.schema.generate_schema', return_value=b'{"swagger": "2.0", "v": 1}'):
+            call_command('generate_openapi_schema', stdout=StringIO())
+        old = self.client.get('/api/schema/')
+        self.assertEqual(old.json()['v'], 1)
+
+        with mock.patch('Diploma_Self_study.schema.generate_schema', return_value=b'{"swagger": "2.0", "v": 2}'):
+            out = StringIO()
+            call_command('generate_openapi_schema', stdout=out)
+        self.assertIn(f'Wrote 26 bytes to {self.path}', out.getvalue())
+        response = self.client.get('/api/schema/', HTTP_IF_NONE_MATCH=old['ETag'])
+        self.assertEqual((response.status_code, response.json()['v']), (200, 2))
+
+
+class CompressionTests(LmsTestCase):
+    def test_brotli_for_json_only(self):
+        teacher = self.create_user('t@x.com', role='teacher')
+        Course.objects.bulk_create(Course(title=f'Course {number}', owner=teacher) for number in range(10))
+        response = self.client.get('/api/courses/', HTTP_ACCEPT_ENCODING='br, gzip')
+        self.assertEqual(response['Content-Encoding'], 'br')
+        # Pages with a CSRF token get gzip and its BREACH padding
+        response = self.client.get('/admin/login/', HTTP_ACCEPT_ENCODING='br, gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+
+
+class ActivityTests(LmsTestCase):
+    def setUp(self):
+        super().setUp()
+        activity._buffer = None  # Fresh buffer for every test
+        self.teacher = self.create_user('t@x.com', role='teacher')
+        self.course = Course.objects.create(title='C', owner=self.teacher)
+        self.material = Material.objects.create(title='M', content='x', course=self.course, owner=self.teacher)
+        self.students = [self.create_user(f's{number}@x.com') for number in range(2)]
+
+    def record_views(self):
+        for student in self.students:
+            activity.record('course_view', student, self.course.pk)
+        activity.record('course_view', self.students[0], self.course.pk)
+        activity.record('material_view', AnonymousUser(), self.course.pk, self.material.pk)
+
+    def test_flush_rolls_up_hours(self):
+        self.record_views()
+        self.assertFalse(ActivityEvent.objects.exists())  # Buffered, not written per view
+        self.assertEqual(activity.flush(), 4)
+        self.assertEqual(ActivityEvent.objects.count(), 4)
+        hour = CourseActivityHourly.objects.get(course=self.course)
+        self.assertEqual((hour.course_views, hour.material_views, hour.users), (3, 1, 2))
+
+        # A later flush recomputes the hour instead of adding to it
+        activity.record('material_view', self.students[1], self.course.pk, self.material.pk)
+        self.assertEqual(activity.flush(), 1)
+        hour.refresh_from_db()
+        self.assertEqual((hour.course_views, hour.material_views, hour.users), (3, 2, 2))
+
+    @override_settings(ACTIVITY_BACKEND='redis')
+    def test_redis_stream(self):
+        redis = fakeredis.FakeRedis()
+        with mock.patch('lms.activity.get_redis_connection', return_value=redis):
+            self.record_views()
+            self.assertEqual(redis.xlen(activity.STREAM_KEY), 4)
+            self.assertEqual(activity.flush(), 4)
+            self.assertEqual(redis.xlen(activity.STREAM_KEY), 0)  # Acknowledged and trimmed
+            self.assertEqual(activity.flush(), 0)
+        self.assertEqual(CourseActivityHourly.objects.get(course=self.course).course_views, 3)
+
+    def test_engagement(self):
+        self.record_views()
+        activity.flush()
+        self.client.force_authenticate(self.teacher)
+        data = self.client.get(f'/api/courses/{self.course.pk}/engagement/?hours=24').json()
+        self.assertEqual((data['course_views'], data['material_views'], len(data['hours'])), (3, 1, 1))
+        self.assertEqual(self.client.get(f'/api/courses/{self.course.pk}/engagement/?hours=x').status_code, 400)
+
+    def test_engagement_of_another_course(self):
+        self.client.force_authenticate(self.create_user('other@x.com', role='teacher'))
+        self.assertEqual(self.client.get(f'/api/courses/{self.course.pk}/engagement/').status_code, 403)
+        self.client.force_authenticate(self.students[0])
+        self.assertEqual(self.client.get(f'/api/courses/{self.course.pk}/engagement/').status_code, 403)
+
+
+@override_settings(PROFILING_ENABLED=True, PROFILING_SAMPLE_RATE=0, PROFILING_MODE='cprofile')
+class ProfilingTests(LmsTestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.enterContext(override_settings(PROFILING_DIR=directory.name))
+        self.admin = self.create_user('a@x.com', is_staff=True)
+
+    def get(self, **headers):
+        return self.client.get('/api/courses/', **headers)
+
+    def profiled(self, **headers):
+        return self.get(HTTP_X_PROFILE=profiling.make_token(), **headers)
+
+    def test_sampling(self):
+        self.assertNotIn('X-Profile-Id', self.get())
+        with override_settings(PROFILING_SAMPLE_RATE=1):
+            response = self.get()
+        meta = profiling.load_profile(response['X-Profile-Id'])
+        self.assertEqual((meta['path'], meta['status'], meta['mode']), ('/api/courses/', 200, 'cprofile'))
+        self.assertEqual(meta['query_count'], len(meta['queries']))
+        self.assertTrue(os.path.exists(profiling.profile_path(meta['id'], 'prof')))
+
+    def test_signed_header(self):
+        self.assertIn('X-Profile-Id', self.profiled())
+        self.assertNotIn('X-Profile-Id', self.get(HTTP_X_PROFILE='forged:token'))
+        with override_settings(PROFILING_TOKEN_MAX_AGE=-1):  # Expired
+            self.assertNotIn('X-Profile-Id', self.profiled())
+
+    @override_settings(PROFILING_MODE='sample')
+    def test_stack_samples(self):
+        profile_id = self.profiled()['X-Profile-Id']
+        self.assertEqual(profiling.load_profile(profile_id)['mode'], 'sample')
+        self.assertTrue(os.path.exists(profiling.profile_path(profile_id, 'folded')))
+
+    def test_concurrent_request_is_not_profiled(self):
+        with profiling.cprofile_lock:  # Another thread is being profiled
+            response = self.profiled()
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('X-Profile-Id', response)
+        self.assertIn('X-Profile-Id', self.profiled())
+
+    @override_settings(PROFILING_MAX_PROFILES=2)
+    def test_keeps_newest_profiles(self):
+        ids = [self.profiled()['X-Profile-Id'] for _ in range(3)]
+        self.assertEqual(profiling.list_profile_ids(), ids[:0:-1])
+        self.assertFalse(os.path.exists(profiling.profile_path(ids[0], 'prof')))
+
+    def test_admin_views(self):
+        profile_id = self.profiled()['X-Profile-Id']
+        list_url = reverse('request-profile-list')
+        detail_url = reverse('request-profile-detail', args=[profile_id])
+        download_url = reverse('request-profile-download', args=[profile_id])
+        self.client.force_authenticate(self.create_user('s@x.com'))
+        for url in (list_url, detail_url, download_url):
+            self.assertEqual(self.client.get(url).status_code, 403)
+
+        self.client.force_authenticate(self.admin)
+        profiles = self.client.get(list_url).json()
+        self.assertEqual([profile['id'] for profile in profiles], [profile_id])
+        self.assertNotIn('queries', profiles[0])
+        self.assertIn('queries', self.client.get(detail_url).json())
+        self.assertEqual(self.client.get(download_url, {'kind': 'prof'})['Content-Type'], 'application/octet-stream')
+        self.assertEqual(self.client.get(download_url, {'kind': 'exe'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('request-profile-detail', args=['..settings'])).status_code, 404)
+        self.assertEqual(reverse('profile-list'), '/api/users/profiles/')
+
+
+class LeaderboardTests(LmsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.redis = fakeredis.FakeRedis()
+        self.enterContext(mock.patch('lms.leaderboards.get_connection', return_value=self.redis))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.teacher = self.create_user('t@x.com', role='teacher')
+            self.course = Course.objects.create(title='C', owner=self.teacher)
+            material = Material.objects.create(title='M', content='x', course=self.course, owner=self.teacher)
+            self.test = Test.objects.create(material=material, owner=self.teacher, questions=[])
+            self.students = [self.create_user(f's{number}@x.com', name=f'S{number}') for number in range(3)]
+            for student in self.students:
+                Enrollment.objects.create(user=student, course=self.course)
+        for student, score in zip(self.students, (50, 90, 70)):
+            leaderboards.record_score(student.pk, self.test.pk, self.course.pk, score)
+        self.client.force_authenticate(self.students[0])
+
+    def test_standings(self):
+        data = self.client.get(f'/api/tests/{self.test.pk}/leaderboard/?limit=2').json()
+        self.assertEqual([(entry['name'], entry['score']) for entry in data['top']], [('S1', 90), ('S2', 70)])
+        self.assertEqual(data['me'], {'rank': 3, 'score': 50, 'percentile': 0.0})
+        data = self.client.get(f'/api/courses/{self.course.pk}/leaderboard/').json()
+        self.assertEqual(data['total'], 3)
+
+    def test_redis_down(self):
+        with mock.patch.object(fakeredis.FakeRedis, 'pipeline', side_effect=RedisError):
+            self.assertEqual(self.client.get(f'/api/tests/{self.test.pk}/leaderboard/').status_code, 503)
+            self.assertEqual(self.client.get(f'/api/courses/{self.course.pk}/leaderboard/').status_code, 503)
+
+    def test_outsiders(self):
+        self.client.force_authenticate(self.create_user('outsider@x.com'))
+        self.assertEqual(self.client.get(f'/api/tests/{self.test.pk}/leaderboard/').status_code, 403)
+        self.assertEqual(self.client.get(f'/api/courses/{self.course.pk}/leaderboard/').status_code, 403)
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get(f'/api/courses/{self.course.pk}/leaderboard/').status_code, 401)
+
+    def test_teacher_and_unknown_ids(self):
+        self.client.force_authenticate(self.teacher)
+        self.assertEqual(self.client.get(f'/api/courses/{self.course.pk}/leaderboard/').json()['total'], 3)
+        self.assertEqual(self.client.get('/api/tests/0/leaderboard/').status_code, 404)
+        self.assertEqual(self.client.get('/api/courses/0/leaderboard/').status_code, 404)
+
+
+@override_settings(SYNC_SAFETY_MARGIN=60)
+class SyncTests(LmsTestCase):
+    def setUp(self):
+        super().setUp()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.teacher = self.create_user('t@x.com', role='teacher')
+            self.student = self.create_user('s@x.com')
+            self.course = Course.objects.create(title='Mine', owner=self.teacher)
+            self.other = Course.objects.create(title='Other', owner=self.teacher)
+            self.materials = [
+                Material.objects.create(title=f'M{number}', content='x', course=course, owner=self.teacher)
+                for number, course in enumerate((self.course, self.course, self.other))
+            ]
+            Enrollment.objects.create(user=self.student, course=self.course)
+        # Everything above happened an hour ago
+        hour_ago = timezone.now() - timedelta(hours=1)
+        for model in (Course, Material, Enrollment):
+            model.objects.update(updated_at=hour_ago)
+        Enrollment.objects.update(enrolled_at=hour_ago)
+        self.client.force_authenticate(self.student)
+
+    def sync(self, since=None):
+        response = self.client.get('/api/sync/', {'since': since} if since else {})
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def ids(self, rows):
+        return sorted(row['id'] for row in rows)
+
+    def test_full_snapshot(self):
+        data = self.sync()
+        self.assertTrue(data['reset'])
+        self.assertLessEqual(parse_datetime(data['watermark']), timezone.now() - timedelta(seconds=60))
+        self.assertEqual(self.ids(data['courses']), [self.course.pk, self.other.pk])
+        # Materials only of the courses the student is enrolled in
+        self.assertEqual(self.ids(data['materials']), [self.materials[0].pk, self.materials[1].pk])
+        self.assertEqual(len(data['enrollments']), 1)
+
+    def test_delta_and_tombstones(self):
+        watermark = self.sync()['watermark']
+        self.assertEqual(list(self.sync(watermark)), ['watermark'])  # Nothing changed
+
+        changed, deleted, hidden = self.materials
+        deleted_id = deleted.pk
+        changed.title = 'M0 v2'
+        changed.save()
+        deleted.delete()
+        hidden.delete()  # Another course's material: its tombstone is not sent
+        data = self.sync(watermark)
+        self.assertFalse(data.get('reset'))
+        self.assertEqual([row['title'] for row in data['materials']], ['M0 v2'])
+        self.assertEqual(data['deleted'], {'materials': [deleted_id]})
+        self.assertNotIn('courses', data)
+
+    def test_late_commit_is_not_skipped(self):
+        watermark = self.sync()['watermark']
+        # Stamped just before the sync answered, committed after it
+        Material.objects.filter(pk=self.materials[0].pk).update(updated_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(self.ids(self.sync(watermark)['materials']), [self.materials[0].pk])
+
+    def test_old_or_invalid_watermark(self):
+        self.assertEqual(self.client.get('/api/sync/', {'since': 'yesterday'}).status_code, 400)
+        Tombstone.objects.create(model='material', object_id=0, course_id=self.course.pk)
+        data = self.sync((timezone.now() - timedelta(days=365)).isoformat())
+        self.assertTrue(data['reset'])
+        self.assertNotIn('deleted', data)  # A reset is a full snapshot, tombstones are not needed
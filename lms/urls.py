@@ -1,7 +1,8 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from . import views
-from .views import EnrollCourseView, MyCoursesView, SubmitTestView, CourseViewSet
+from .views import EnrollCourseView, MyCoursesView, SubmitTestView, CourseViewSet, SyncView, EventStreamView
+from .views import AttemptView, AttemptAnswersView, AttemptSubmitView, SuggestView
 
 router = DefaultRouter()
 router.register(r'courses', views.CourseViewSet)
@@ -17,4 +18,10 @@ urlpatterns = [
     path('', include(router.urls)),
 
     path('submit-test/<int:test_id>/', SubmitTestView.as_view(), name='submit-test'),
+    path('search/suggest/', SuggestView.as_view(), name='search-suggest'),
+    path('attempts/<int:attempt_id>/', AttemptView.as_view(), name='attempt'),
+    path('attempts/<int:attempt_id>/answers/', AttemptAnswersView.as_view(), name='attempt-answers'),
+    path('attempts/<int:attempt_id>/submit/', AttemptSubmitView.as_view(), name='attempt-submit'),
+    path('sync/', SyncView.as_view(), name='sync'),
+    path('events/', EventStreamView.as_view(), name='events'),
 ]
@@ -1,21 +1,167 @@
-from rest_framework import viewsets, permissions, status
+import asyncio
+import hashlib
+import json
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views import View
+from django.db.models import Prefetch, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from rest_framework import viewsets, permissions, status, serializers
 from rest_framework.decorators import action
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
+from redis.exceptions import RedisError
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from .models import Course, Material, Test, TestResult, Enrollment
+from .models import Course, Material, Test, TestAttempt, TestResult, Enrollment, Tombstone, CourseRecommendation, CourseActivityHourly
 from .serializers import CourseSerializer, MaterialSerializer, TestSerializer, TestResultSerializer, EnrollmentSerializer
-from .permissions import IsTeacherOrAdmin, IsOwnerOrAdmin, IsStudentOrSubscribed
+from .serializers import (
+    requested_fieldsets, CourseValuesSerializer, CourseCardValuesSerializer, MaterialValuesSerializer, TestValuesSerializer,
+    EnrollmentValuesSerializer, TestResultValuesSerializer,
+)
+from .permissions import (
+    IsTeacherOrAdmin, IsOwnerOrAdmin, IsObjectOwnerOrAdmin, IsStudentOrSubscribed, HasCourseAccess, HasPaidForMaterial,
+    Paywall,
+)
+from .access import has_access
+from .grading import PASS_SCORE, calculate_score, compiled_test
+from .events import broker
+from .tasks import regrade_test_results
+from . import activity, attempts, leaderboards, search
+from .notifications import notify
+from users.authentication import QueryParamJWTAuthentication
+from users.models import Payment
+from users.throttling import AutosaveRateThrottle, SubmitTestRateThrottle
+
+User = get_user_model()
+
+
+class ValuesListMixin:
+    """
+    Serves list() through a ValuesSerializer: rows come from .values()
+    and are never turned into model instances. ?fields= narrows the
+    selected columns, ?expand= the nested rows.
+    """
+    values_serializer_class = None
+
+    def list(self, request, *args, **kwargs):
+        fields, expand = requested_fieldsets(request)
+        queryset = self.filter_queryset(self.get_queryset())
+        rows = self.values_serializer_class.values(queryset, fields)
+        page = self.paginate_queryset(rows)
+        context = self.get_serializer_context()
+        if page is not None:
+            serializer = self.values_serializer_class(page, context=context, fields=fields, expand=expand)
+            return self.get_paginated_response(serializer.data)
+        serializer = self.values_serializer_class(rows, context=context, fields=fields, expand=expand)
+        return Response(serializer.data)
+
+
+def fingerprint(*instances):
+    """Content hash of model rows, much cheaper than serializing them."""
+    digest = hashlib.blake2b(digest_size=16)
+    for instance in instances:
+        for field in instance._meta.concrete_fields:
+            digest.update(repr(field.value_from_object(instance)).encode())
+    return digest.hexdigest()
+
+
+class ConditionalRetrieveMixin:
+    """
+    Adds ETag/Last-Modified to retrieve() and answers 304 Not Modified
+    before the object is serialized.
+    """
+
+    def get_etag(self, instance):
+        return fingerprint(instance)
+
+    def get_last_modified(self, instance):
+        return getattr(instance, 'updated_at', None)
+
+    def track_view(self, request, instance):
+        pass
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        self.track_view(request, instance)
+        etag = quote_etag(self.get_etag(instance))
+        last_modified = self.get_last_modified(instance)
+        last_modified = int(last_modified.timestamp()) if last_modified else None
+
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            serializer = self.get_serializer(instance)
+            response = Response(serializer.data)
+
+        response.headers['ETag'] = etag
+        if last_modified:
+            response.headers['Last-Modified'] = http_date(last_modified)
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+
+class LeaderboardMixin:
+    """
+    Adds user names to leaderboard standings read from Redis.
+    ?limit= sets the size of the top (default 10, at most 100).
+    """
+    leaderboard_default_limit = 10
+    leaderboard_max_limit = 100
+
+    def leaderboard_response(self, request, key):
+        try:
+            limit = min(max(int(request.query_params.get('limit', self.leaderboard_default_limit)), 1),
+                        self.leaderboard_max_limit)
+        except ValueError:
+            return Response({"error": "limit must be an integer."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            data = leaderboards.standings(key, request.user.pk, limit)
+        except RedisError:
+            return Response({"error": "Рейтинг временно недоступен."}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        names = dict(User.objects.filter(pk__in=[entry['user'] for entry in data['top']]).values_list('pk', 'name'))
+        for entry in data['top']:
+            entry['name'] = names.get(entry['user'])
+        return Response(data, status=status.HTTP_200_OK)
+
 
-class CourseViewSet(viewsets.ModelViewSet):
+class CourseViewSet(LeaderboardMixin, ConditionalRetrieveMixin, ValuesListMixin, viewsets.ModelViewSet):
     queryset = Course.objects.prefetch_related('materials').all()
     serializer_class = CourseSerializer
+    values_serializer_class = CourseValuesSerializer
+
+    def get_etag(self, instance):
+        # Materials are nested into the course payload, without the content of those the user has not paid for
+        paywall = Paywall.for_request(self.request)
+        locked = [
+            material.pk for material in instance.materials.all()
+            if paywall.is_locked(material.pk, material.course_id, material.price, material.owner_id)
+        ]
+        locked_digest = hashlib.blake2b(repr(locked).encode(), digest_size=8).hexdigest()
+        return f'{fingerprint(instance, *instance.materials.all())}-{locked_digest}'
+
+    def get_last_modified(self, instance):
+        return max([instance.updated_at] + [material.updated_at for material in instance.materials.all()])
+
+    def track_view(self, request, instance):
+        activity.record('course_view', request.user, instance.pk)
 
     def get_permissions(self):
-        if self.action == 'list':
+        if self.action in ['list', 'recommendations']:
             return [permissions.AllowAny()]
+        if self.action == 'leaderboard':
+            return [permissions.IsAuthenticated(), HasCourseAccess()]
 
+        if self.action in ['clone', 'engagement']:
+            return [permissions.IsAuthenticated(), IsTeacherOrAdmin(), IsObjectOwnerOrAdmin()]
         if self.action in ['create', 'update', 'partial_update', 'destroy', 'edit', 'add_materials']:
             return [permissions.IsAuthenticated(), IsTeacherOrAdmin(), IsOwnerOrAdmin()]
         elif self.action == 'retrieve':
@@ -35,48 +181,167 @@ class CourseViewSet(viewsets.ModelViewSet):
             return Response(serializer.data, status=status.HTTP_200_OK)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    @action(detail=True, methods=['get'], url_path='recommendations')
+    def recommendations(self, request, pk=None):
+        """
+        GET: "Students who took this also took" for the course.
+        Served from the precomputed CourseRecommendation table (one indexed lookup).
+        """
+        rows = CourseRecommendation.objects.filter(course_id=pk).order_by('rank').values(
+            'score', 'recommended_id', 'recommended__title', 'recommended__preview', 'recommended__price'
+        )
+        preview_storage = Course._meta.get_field('preview').storage
+        data = [
+            {
+                'id': row['recommended_id'],
+                'title': row['recommended__title'],
+                'preview': request.build_absolute_uri(preview_storage.url(row['recommended__preview']))
+                if row['recommended__preview'] else None,
+                'price': f"{row['recommended__price']:f}",
+                'score': row['score'],
+            }
+            for row in rows
+        ]
+        return Response(data, status=status.HTTP_200_OK)
+
+    @action(detail=True, methods=['get'], url_path='leaderboard')
+    def leaderboard(self, request, pk=None):
+        """
+        GET: Course ranking by the sum of best test scores, with the current user's rank and percentile.
+        """
+        course = self.get_object()
+        return self.leaderboard_response(request, leaderboards.COURSE_KEY.format(course.pk))
+
+    @action(detail=True, methods=['get'], url_path='engagement')
+    def engagement(self, request, pk=None):
+        """
+        GET: Hourly views of the course page and its materials and unique viewers.
+        ?hours=168 sets the window (at most 90 days). Served from the hourly rollups.
+        """
+        course = self.get_object()
+        try:
+            hours = min(max(int(request.query_params.get('hours', 24 * 7)), 1), 24 * 90)
+        except ValueError:
+            return Response({"error": "hours must be an integer."}, status=status.HTTP_400_BAD_REQUEST)
+        since = timezone.now().replace(minute=0, second=0, microsecond=0) - timedelta(hours=hours - 1)
+        rows = list(
+            CourseActivityHourly.objects.filter(course=course, hour__gte=since)
+            .order_by('hour').values('hour', 'course_views', 'material_views', 'users')
+        )
+        return Response({
+            'course': course.pk,
+            'since': since,
+            'course_views': sum(row['course_views'] for row in rows),
+            'material_views': sum(row['material_views'] for row in rows),
+            'hours': rows,
+        }, status=status.HTTP_200_OK)
+
+    @action(detail=True, methods=['post'], url_path='clone')
+    def clone(self, request, pk=None):
+        """
+        POST: Copy the course with all materials and tests for the current user.
+        Body: {"title": "..."} (optional, defaults to the original title + " (копия)").
+        """
+        course = self.get_object()
+        title = (request.data.get('title') or f"{course.title} (копия)")[:Course._meta.get_field('title').max_length]
+        clone = course.clone(owner=request.user, title=title)
+        serializer = self.get_serializer(Course.objects.prefetch_related('materials').get(pk=clone.pk))
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
     @action(detail=True, methods=['post'], permission_classes=[IsTeacherOrAdmin, IsOwnerOrAdmin],
             url_path='add-material')
     def add_material(self, request, pk=None):
         course = self.get_object()
-        serializer = MaterialSerializer(data=request.data)
-        print(f"DEBUG: Reached add_material - User: {request.user}, Course: {course}")
+        serializer = MaterialSerializer(data=request.data, context={'request': request})
         if serializer.is_valid():
             material = serializer.save(course=course)
+            notify('material_added', {'course': course.title, 'material': material.title}, course_id=course.pk)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class MaterialViewSet(viewsets.ModelViewSet):
+class MaterialViewSet(ConditionalRetrieveMixin, ValuesListMixin, viewsets.ModelViewSet):
     queryset = Material.objects.all()
     serializer_class = MaterialSerializer
+    values_serializer_class = MaterialValuesSerializer
+
+    def track_view(self, request, instance):
+        activity.record('material_view', request.user, instance.course_id, instance.pk)
 
     def get_permissions(self):
         if self.action in ['create', 'update', 'partial_update', 'destroy']:
             return [permissions.IsAuthenticated(), IsTeacherOrAdmin(), IsOwnerOrAdmin()]
+        if self.action == 'retrieve':
+            return [permissions.IsAuthenticated(), IsStudentOrSubscribed(), HasPaidForMaterial()]
         return [permissions.IsAuthenticated(), IsStudentOrSubscribed()]
 
     def perform_create(self, serializer):
         serializer.save(owner=self.request.user)
 
-class TestViewSet(viewsets.ModelViewSet):
+class TestViewSet(LeaderboardMixin, ConditionalRetrieveMixin, viewsets.ModelViewSet):
     queryset = Test.objects.all()
     serializer_class = TestSerializer
 
+    def get_queryset(self):
+        if self.action == 'list':
+            return TestSerializer.optimize_queryset(self.queryset, *requested_fieldsets(self.request))
+        return self.queryset
+
     def get_permissions(self):
+        if self.action == 'regrade':
+            return [permissions.IsAuthenticated(), IsTeacherOrAdmin(), IsObjectOwnerOrAdmin()]
         if self.action in ['create', 'update', 'partial_update', 'destroy']:
             return [permissions.IsAuthenticated(), IsTeacherOrAdmin(), IsOwnerOrAdmin()]
+        if self.action == 'leaderboard':
+            return [permissions.IsAuthenticated(), HasCourseAccess()]
         return [permissions.IsAuthenticated(), IsStudentOrSubscribed()]
 
     def perform_create(self, serializer):
         serializer.save(owner=self.request.user)
 
-class TestResultViewSet(viewsets.ModelViewSet):
+    @action(detail=True, methods=['get'], url_path='leaderboard')
+    def leaderboard(self, request, pk=None):
+        """
+        GET: Best scores on the test, with the current user's rank and percentile.
+        """
+        test = self.get_object()
+        return self.leaderboard_response(request, leaderboards.TEST_KEY.format(test.pk))
+
+    @action(detail=True, methods=['post'], url_path='attempts')
+    def start_attempt(self, request, pk=None):
+        """
+        POST: Start a timed attempt, or resume the running one with its saved answers.
+        """
+        test = self.get_object()
+        try:
+            attempt, created = attempts.start(request.user, test)
+            saved = attempts.state(attempt.pk)
+        except RedisError:
+            return Response({"error": "Попытки временно недоступны."}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        return Response(
+            attempt_payload(attempt, saved['answers'] if saved else {}),
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK,
+        )
+
+    @action(detail=True, methods=['post'], url_path='regrade')
+    def regrade(self, request, pk=None):
+        """
+        POST: Re-score all stored results of the test against its current answer key.
+        Runs as a Celery task, returns its id.
+        """
+        test = self.get_object()
+        task = regrade_test_results.delay(test.pk)
+        return Response({"task": task.id}, status=status.HTTP_202_ACCEPTED)
+
+class TestResultViewSet(ValuesListMixin, viewsets.ModelViewSet):
     queryset = TestResult.objects.all()
     serializer_class = TestResultSerializer
+    values_serializer_class = TestResultValuesSerializer
     permission_classes = [permissions.IsAuthenticated]  # Users can only see their own results
 
     def get_queryset(self):
+        if getattr(self, 'swagger_fake_view', False):  # OpenAPI schema generation, no request user
+            return self.queryset.none()
         return self.queryset.filter(user=self.request.user)  # Filter to user's results
 
 class MyCoursesView(APIView):
@@ -89,22 +354,24 @@ class MyCoursesView(APIView):
 
     def get(self, request):
         role = request.user.role
+        fields, expand = requested_fieldsets(request)
 
         if role == 'teacher':
-            courses = Course.objects.filter(owner=request.user).prefetch_related('materials')
-            print("Teacher courses found:", courses.count())
-            serializer = CourseSerializer(courses, many=True)
+            courses = CourseSerializer.optimize_queryset(Course.objects.filter(owner=request.user), fields, expand)
+            serializer = CourseSerializer(courses, many=True, context={'request': request}, fields=fields,
+                                          expand=expand)
             return Response(
                 {"role": "teacher", "courses": serializer.data},
                 status=status.HTTP_200_OK
             )
         else:
-            enrollments = Enrollment.objects.filter(user=request.user).select_related('course').prefetch_related(
-                'course__materials')
-            print("Student enrollments found:", enrollments.count())
+            enrollments = Enrollment.objects.filter(user=request.user).only('course')
+            enrollments = enrollments.prefetch_related(Prefetch(
+                'course', queryset=CourseSerializer.optimize_queryset(Course.objects.all(), fields, expand),
+            ))
             courses = [enrollment.course for enrollment in enrollments]
-            print("Student courses found:", len(courses))
-            serializer = CourseSerializer(courses, many=True)
+            serializer = CourseSerializer(courses, many=True, context={'request': request}, fields=fields,
+                                          expand=expand)
             return Response(
                 {"role": "student", "courses": serializer.data},
                 status=status.HTTP_200_OK
@@ -120,18 +387,30 @@ class EnrollCourseView(APIView):
     def post(self, request, course_id):
         try:
             course = Course.objects.get(id=course_id)
+            # Paid courses are enrolled by the payment webhook, not here
+            if course.price and not has_access(request.user, course.pk):
+                return Response(
+                    {"error": "Курс платный, оплатите его через /api/users/payments/checkout/."},
+                    status=status.HTTP_402_PAYMENT_REQUIRED
+                )
             enrollment, created = Enrollment.objects.get_or_create(
                 user=request.user,
                 course=course
             )
+            fields, expand = requested_fieldsets(request)
             if created:
-                serializer = EnrollmentSerializer(enrollment)
+                notify('enrollment_confirmed', {'course': course.title}, user_ids=[request.user.pk])
+                notify('student_enrolled', {'course': course.title, 'student': request.user.name or request.user.email},
+                       user_ids=[course.owner_id])
+                serializer = EnrollmentSerializer(enrollment, context={'request': request}, fields=fields,
+                                                  expand=expand)
                 return Response(
                     {"message": "Успешно записаны на курс!", "enrollment": serializer.data},
                     status=status.HTTP_201_CREATED
                 )
             else:
-                serializer = EnrollmentSerializer(enrollment)
+                serializer = EnrollmentSerializer(enrollment, context={'request': request}, fields=fields,
+                                                  expand=expand)
                 return Response(
                     {"message": "Вы уже записаны на этот курс.", "enrollment": serializer.data},
                     status=status.HTTP_200_OK
@@ -140,20 +419,258 @@ class EnrollCourseView(APIView):
             return Response({"error": "Курс не найден."}, status=status.HTTP_404_NOT_FOUND)
 
 
+def attempt_payload(attempt, answers):
+    return {
+        "attempt": attempt.pk,
+        "test": attempt.test_id,
+        "status": attempt.status,
+        "deadline": attempt.deadline,
+        "remaining": max(int((attempt.deadline - timezone.now()).total_seconds()), 0) if attempt.status == 'active' else 0,
+        "answers": answers,
+    }
+
+
+class AttemptView(APIView):
+    """
+    GET: State of an attempt. A running attempt is read from Redis only
+    (stateless JWT, no database queries); a finished one returns its result.
+    """
+    authentication_classes = [JWTStatelessUserAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, attempt_id):
+        saved = attempts.state(attempt_id)
+        if saved is not None:
+            if saved['user'] != str(request.user.id):
+                return Response({"error": "Попытка не найдена."}, status=status.HTTP_404_NOT_FOUND)
+            return Response({
+                "attempt": attempt_id,
+                "test": saved['test'],
+                "status": 'active',
+                "remaining": max(saved['deadline'] - int(timezone.now().timestamp()), 0),
+                "answers": saved['answers'],
+            }, status=status.HTTP_200_OK)
+
+        attempt = TestAttempt.objects.select_related('result').filter(pk=attempt_id, user_id=request.user.id).first()
+        if attempt is None:
+            return Response({"error": "Попытка не найдена."}, status=status.HTTP_404_NOT_FOUND)
+        data = attempt_payload(attempt, attempt.result.answers if attempt.result else {})
+        if attempt.result:
+            data.update(score=attempt.result.score, passed=attempt.result.passed)
+        return Response(data, status=status.HTTP_200_OK)
+
+
+class AttemptAnswersView(APIView):
+    """
+    PATCH: Autosave answers of a running attempt.
+    Body: {"answers": {"<question id>": "<answer>", ...}}, usually one answer per request.
+    Written to a Redis hash only; Postgres is not touched.
+    """
+    authentication_classes = [JWTStatelessUserAuthentication]
+    permission_classes = [IsAuthenticated]
+    throttle_classes = [AutosaveRateThrottle]
+    max_answers = 200
+    max_answer_length = 2000
+
+    def patch(self, request, attempt_id):
+        answers = request.data.get('answers')
+        if not isinstance(answers, dict) or not answers or len(answers) > self.max_answers:
+            return Response({"error": "answers must be a non-empty object."}, status=status.HTTP_400_BAD_REQUEST)
+        if any(len(str(answer)) > self.max_answer_length for answer in answers.values()):
+            return Response({"error": "answer is too long."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            saved = attempts.save_answers(attempt_id, request.user.id, answers)
+        except RedisError:
+            return Response({"error": "Автосохранение временно недоступно."},
+                            status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        if saved in ('not_found', 'forbidden'):
+            return Response({"error": "Попытка не найдена или уже завершена."}, status=status.HTTP_404_NOT_FOUND)
+        if saved == 'expired':
+            return Response({"error": "Время попытки истекло."}, status=status.HTTP_409_CONFLICT)
+        if saved == 'unknown_question':
+            return Response({"error": "В тесте нет такого вопроса."}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({"saved": saved}, status=status.HTTP_200_OK)
+
+
+class AttemptSubmitView(APIView):
+    """
+    POST: Finish an attempt: the saved answers are graded into one TestResult.
+    Repeated submits return the same result.
+    """
+    permission_classes = [IsAuthenticated]
+    throttle_classes = [SubmitTestRateThrottle]
+
+    def post(self, request, attempt_id):
+        if not TestAttempt.objects.filter(pk=attempt_id, user=request.user).exists():
+            return Response({"error": "Попытка не найдена."}, status=status.HTTP_404_NOT_FOUND)
+        try:
+            attempt = attempts.finalize(attempt_id)
+        except RedisError:
+            return Response({"error": "Попытки временно недоступны."}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        result = attempt.result
+        return Response({
+            "attempt": attempt.pk,
+            "status": attempt.status,
+            "score": result.score if result else None,
+            "passed": result.passed if result else None,
+        }, status=status.HTTP_200_OK)
+
+
 class SubmitTestView(APIView):
     permission_classes = [IsAuthenticated, IsStudentOrSubscribed]
+    throttle_classes = [SubmitTestRateThrottle]
 
     def post(self, request, test_id):
-        try:
-            test = Test.objects.get(id=test_id)
-            # Check if user is enrolled in the course
-            if not Enrollment.objects.filter(user=request.user, course=test.material.course).exists():
-                return Response({"error": "Not enrolled in this course."}, status=403)
-            answers = request.data.get('answers', {})
-            # Validate and score (implement logic here)
-            score = calculate_score(test.questions, answers)
-            passed = score >= 70  # Example threshold
-            TestResult.objects.create(user=request.user, test=test, answers=answers, score=score, passed=passed)
-            return Response({"score": score, "passed": passed}, status=201)
-        except Test.DoesNotExist:
+        test = compiled_test(test_id)
+        if test is None:
             return Response({"error": "Test not found."}, status=404)
+        # Check if user is enrolled in the course
+        if not has_access(request.user, test['course_id']):
+            return Response({"error": "Not enrolled in this course."}, status=403)
+        answers = request.data.get('answers', {})
+        if not isinstance(answers, dict):
+            return Response({"error": "answers must be an object."}, status=400)
+        score = calculate_score(test['questions'], answers, test['compiled'])
+        passed = score >= PASS_SCORE
+        TestResult.objects.create(user=request.user, test_id=test_id, answers=answers, score=score, passed=passed)
+        notify('test_graded', {'material': test['material'], 'score': score, 'passed': passed}, user_ids=[request.user.pk])
+        return Response({"score": score, "passed": passed}, status=201)
+
+
+class SuggestView(APIView):
+    """
+    GET: Typeahead for the course catalog and the teachers directory.
+    Query: q=<text>, type=courses|teachers (both when omitted).
+    Returns up to 10 matches per type whose title or name has a word starting with q.
+    """
+    authentication_classes = []
+    permission_classes = [permissions.AllowAny]
+    limit = 10
+    result_fields = {'courses': 'title', 'teachers': 'name'}
+
+    def get(self, request):
+        query = request.query_params.get('q', '')
+        kind = request.query_params.get('type')
+        if kind is not None and kind not in search.INDEXES:
+            return Response({"error": "type must be 'courses' or 'teachers'."}, status=status.HTTP_400_BAD_REQUEST)
+        data = {}
+        for name in [kind] if kind else search.INDEXES:
+            try:
+                rows = search.suggest(name, query, self.limit)
+            except (RedisError, NotImplementedError):  # NotImplementedError: cache is not Redis
+                rows = search.suggest_from_database(name, query, self.limit)
+            data[name] = [{'id': object_id, self.result_fields[name]: text} for object_id, text in rows]
+        return Response(data, status=status.HTTP_200_OK)
+
+
+class SyncView(APIView):
+    """
+    GET: Incremental sync of courses, materials, tests and the user's enrollments.
+    Query: since=<watermark from the previous response>, omit it for a full snapshot.
+    Returns only rows created or updated since the watermark plus ids of deleted rows;
+    empty sections are left out. "reset": true means the client must drop its local copy.
+    Consecutive deltas overlap by SYNC_SAFETY_MARGIN, clients upsert rows by id.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        now = timezone.now()
+        # Rows stamped before now by transactions that are still open are read by the next delta
+        watermark = now - timedelta(seconds=settings.SYNC_SAFETY_MARGIN)
+        since = request.query_params.get('since')
+        if since:
+            since = parse_datetime(since)
+            if since is None:
+                return Response({"error": "Invalid 'since' watermark."}, status=status.HTTP_400_BAD_REQUEST)
+            if timezone.is_naive(since):
+                since = timezone.make_aware(since)
+        # Tombstones older than the retention period are pruned, so older watermarks get a full snapshot
+        reset = not since or since < now - timedelta(days=settings.SYNC_TOMBSTONE_RETENTION_DAYS)
+
+        user = request.user
+        courses = Course.objects.all()
+        materials = Material.objects.all()
+        tests = Test.objects.all()
+        enrollments = Enrollment.objects.filter(user=user)
+        tombstones = Tombstone.objects.none() if reset else Tombstone.objects.filter(deleted_at__gte=since)
+        if not (user.is_staff or user.is_superuser):
+            course_ids = Course.objects.filter(Q(owner=user) | Q(enrollments__user=user)).values('id')
+            materials = materials.filter(course_id__in=course_ids)
+            tests = tests.filter(material__course_id__in=course_ids)
+            tombstones = tombstones.filter(
+                Q(model='course') | Q(user_id=user.id) | Q(model__in=['material', 'test'], course_id__in=course_ids)
+            )
+        if not reset:
+            # Courses the user got access to since the watermark arrive with all their materials and tests
+            new_course_ids = enrollments.filter(enrolled_at__gte=since).values('course_id')
+            # Paid content is left out until bought, so purchases resend their materials in full
+            # (payment_date is a date: the whole day of the watermark counts)
+            purchases = Payment.objects.filter(
+                user=user, status='completed', payment_date__gte=timezone.localdate(since),
+            )
+            courses = courses.filter(updated_at__gte=since)
+            materials = materials.filter(
+                Q(updated_at__gte=since) | Q(course_id__in=new_course_ids)
+                | Q(pk__in=purchases.values('paid_material_id')) | Q(course_id__in=purchases.values('paid_course_id'))
+            )
+            tests = tests.filter(Q(updated_at__gte=since) | Q(material__course_id__in=new_course_ids))
+            enrollments = enrollments.filter(updated_at__gte=since)
+
+        context = {'request': request}
+        data = {
+            "watermark": serializers.DateTimeField().to_representation(watermark),
+            "reset": reset,
+            "courses": CourseCardValuesSerializer(courses, context=context).data,
+            "materials": MaterialValuesSerializer(materials, context=context).data,
+            "tests": TestValuesSerializer(tests, context=context).data,
+            "enrollments": EnrollmentValuesSerializer(enrollments, context=context).data,
+        }
+        deleted = {}
+        for model, object_id in tombstones.values_list('model', 'object_id'):
+            deleted.setdefault(model + 's', []).append(object_id)
+        if deleted:
+            data["deleted"] = deleted
+        return Response({key: value for key, value in data.items() if value or key == "watermark"})
+
+
+class EventStreamView(View):
+    """
+    GET: Server-Sent Events stream for the authenticated user:
+    test_graded, enrollment_confirmed and material_added (enrolled courses).
+    Auth: Bearer header or ?token=<access token> (EventSource cannot set headers).
+    Must be served through the ASGI application.
+    """
+    keepalive = 15
+
+    async def get(self, request):
+        try:
+            auth = await sync_to_async(QueryParamJWTAuthentication().authenticate)(request)
+        except AuthenticationFailed:
+            auth = None
+        if auth is None:
+            return JsonResponse({"error": "Authentication required."}, status=status.HTTP_401_UNAUTHORIZED)
+
+        user = auth[0]
+        course_ids = [
+            course_id async for course_id in
+            Enrollment.objects.filter(user=user).values_list('course_id', flat=True)
+        ]
+        return StreamingHttpResponse(
+            self.stream(user.id, course_ids),
+            content_type='text/event-stream',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+        )
+
+    async def stream(self, user_id, course_ids):
+        queue = broker.subscribe(user_id, course_ids)
+        try:
+            yield 'retry: 5000\n\n'
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), self.keepalive)
+                except asyncio.TimeoutError:
+                    yield ': keepalive\n\n'
+                    continue
+                yield f"event: {event['type']}\ndata: {json.dumps(event['data'])}\n\n"
+        finally:
+            broker.unsubscribe(queue)
@@ -1,13 +1,16 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin  # For advanced User admin features
-from .models import User
+from lms.admin_utils import EstimatedCountPaginator
+from .models import User, Payment
 
 @admin.register(User)
 class UserAdmin(UserAdmin):  # Inherit from UserAdmin for built-in features like search/filter
     list_display = ['id', 'email', 'name', 'role', 'is_staff', 'is_active', 'date_joined']  # What to show in the list
     list_filter = ['role', 'is_staff', 'is_superuser', 'is_active']  # Filters on the right
-    search_fields = ['email', 'name']  # Search by these fields
+    search_fields = ['^email', '^name']  # Prefix search (email is indexed for it)
     ordering = ['email']  # Sort by email
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     fieldsets = UserAdmin.fieldsets + (  # Add your custom fields to the edit form
         ('Custom Fields', {
             'fields': ('name', 'phone', 'city', 'avatar', 'role')
@@ -18,3 +21,15 @@ class UserAdmin(UserAdmin):  # Inherit from UserAdmin for built-in features like
             'fields': ('name', 'phone', 'city', 'avatar', 'role')
         }),
     )
+
+
+@admin.register(Payment)
+class PaymentAdmin(admin.ModelAdmin):
+    list_display = ['id', 'user', 'paid_course', 'paid_material', 'payment_amount', 'status', 'created_at']
+    list_filter = ['status', 'created_at']
+    search_fields = ['^stripe_session_id', '^user__email']
+    list_select_related = ['user', 'paid_course', 'paid_material']
+    raw_id_fields = ['user', 'paid_course', 'paid_material']
+    readonly_fields = ['stripe_session_id', 'stripe_payment_status', 'payment_url', 'created_at']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
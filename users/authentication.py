@@ -0,0 +1,19 @@
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+
+class QueryParamJWTAuthentication(JWTAuthentication):
+    """
+    JWT authentication that also accepts the access token as ?token=...
+    for clients that cannot set headers (EventSource, <img src>).
+    """
+
+    def authenticate(self, request):
+        header = self.get_header(request)
+        if header is not None:
+            return super().authenticate(request)
+
+        raw_token = request.GET.get('token')
+        if not raw_token:
+            return None
+        validated_token = self.get_validated_token(raw_token)
+        return self.get_user(validated_token), validated_token
@@ -0,0 +1,226 @@
+"""
+Bulk user import from CSV or NDJSON: rows are validated as they are read,
+passwords are hashed on a process pool (PBKDF2 is CPU bound) and users are
+inserted with bulk_create, optionally enrolled in courses in the same pass.
+Uploads through the API are imported by a Celery task; the job state and
+report are kept in the cache under the job id.
+"""
+import csv
+import io
+import json
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from itertools import islice
+
+import django
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, transaction
+
+from Diploma_Self_study.cache import tiered
+from lms import access, search
+from lms.models import Course, Enrollment
+from .models import User
+from .serializers import UserImportSerializer
+from .signals import invalidate_teachers_directory
+
+MAX_REPORTED_ERRORS = 100
+FORMATS = ('csv', 'ndjson')
+JOB_KEY = 'user-import:{}'
+JOB_TIMEOUT = 60 * 60 * 24
+UPLOAD_DIR = 'imports'  # In default_storage, outside the directories ProtectedMediaView serves
+
+
+def read_rows(stream, fmt):
+    """Yield raw row dicts from a text stream. CSV 'courses' is a ';'-separated list of ids."""
+    if fmt == 'ndjson':
+        for line in stream:
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield row if isinstance(row, dict) else {'__invalid__': line}
+    elif fmt == 'csv':
+        for row in csv.DictReader(stream):
+            courses = (row.get('courses') or '').strip()
+            row = {key: value for key, value in row.items() if key and value not in (None, '')}
+            if courses:
+                row['courses'] = [course for course in courses.split(';') if course.strip()]
+            yield row
+    else:
+        raise ValueError(f"Unknown format {fmt!r}, expected one of {', '.join(FORMATS)}")
+
+
+def format_from_name(name):
+    return 'ndjson' if name.endswith(('.ndjson', '.jsonl')) else 'csv'
+
+
+class UserImport:
+    """Runs one import and collects its report."""
+
+    def __init__(self, course_ids=(), batch_size=1000, workers=1):
+        self.course_ids = set(course_ids)
+        self.batch_size = batch_size
+        self.workers = workers
+        self.created = 0
+        self.enrolled = 0
+        self.failed = 0
+        self.errors = []
+        self.seen_emails = set()
+
+    def report(self):
+        return {'created': self.created, 'enrolled': self.enrolled, 'failed': self.failed, 'errors': self.errors}
+
+    def error(self, row, errors):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'row': row, 'errors': errors})
+
+    def validated(self, rows):
+        for number, row in enumerate(rows, start=1):
+            if '__invalid__' in row:
+                self.error(number, {'non_field_errors': ['Строка не является JSON-объектом.']})
+                continue
+            serializer = UserImportSerializer(data=row)
+            if not serializer.is_valid():
+                self.error(number, serializer.errors)
+                continue
+            data = serializer.validated_data
+            data['email'] = User.objects.normalize_email(data['email'])
+            if data['email'].lower() in self.seen_emails:
+                self.error(number, {'email': ['Почта повторяется в файле.']})
+                continue
+            self.seen_emails.add(data['email'].lower())
+            yield number, data
+
+    def run(self, rows):
+        pool = ProcessPoolExecutor(self.workers, initializer=django.setup) if self.workers > 1 else nullcontext()
+        with pool as executor:
+            rows = self.validated(rows)
+            while batch := list(islice(rows, self.batch_size)):
+                self.insert(batch, executor)
+        return self.report()
+
+    def hash_passwords(self, passwords, pool):
+        if pool is None:
+            return [make_password(password) for password in passwords]
+        chunksize = max(1, len(passwords) // (self.workers * 4))
+        return list(pool.map(make_password, passwords, chunksize=chunksize))
+
+    def existing_emails(self, emails):
+        return {email.lower() for email in User.objects.filter(email__in=list(emails)).values_list('email', flat=True)}
+
+    def reject_taken(self, batch, taken):
+        """Report the rows whose email is taken, return the others."""
+        kept = []
+        for number, data in batch:
+            if data['email'].lower() in taken:
+                self.error(number, {'email': ['Пользователь с такой почтой уже существует.']})
+            else:
+                kept.append((number, data))
+        return kept
+
+    def insert(self, batch, pool):
+        fresh = self.reject_taken(batch, self.existing_emails(data['email'] for _, data in batch))
+        if not fresh:
+            return
+
+        # Rows without a password get an unusable one, which costs no hashing
+        to_hash = [data['password'] for _, data in fresh if data.get('password')]
+        hashed = iter(self.hash_passwords(to_hash, pool if to_hash else None))
+        users = {
+            number: User(
+                username=data['email'],  # bulk_create skips User.save(), which sets it
+                email=data['email'],
+                name=data.get('name') or User._meta.get_field('name').default,
+                phone=data.get('phone') or None,
+                city=data.get('city') or None,
+                role=data['role'],
+                password=next(hashed) if data.get('password') else make_password(None),
+            )
+            for number, data in fresh
+        }
+        requested = self.course_ids.union(*(data.get('courses', ()) for _, data in fresh))
+        courses = set(Course.objects.filter(pk__in=requested).values_list('pk', flat=True)) if requested else set()
+
+        while fresh:
+            try:
+                self.save([(users[number], data) for number, data in fresh], courses)
+                return
+            except IntegrityError:
+                # Somebody registered one of the emails between the check above and the insert
+                for user in users.values():
+                    user.pk = None  # Set by the rolled back insert on backends that return ids
+                taken = self.existing_emails(data['email'] for _, data in fresh)
+                if not taken:
+                    raise
+                fresh = self.reject_taken(fresh, taken)
+
+    def save(self, rows, courses):
+        from .views import ROLE_COUNTS_KEY
+        users = [user for user, _ in rows]
+        with transaction.atomic():
+            User.objects.bulk_create(users, batch_size=self.batch_size)
+            pairs = [
+                (user.pk, course_id)
+                for user, data in rows
+                for course_id in (self.course_ids | set(data.get('courses', ()))) & courses
+            ]
+            Enrollment.objects.bulk_create(
+                [Enrollment(user_id=user_id, course_id=course_id) for user_id, course_id in pairs],
+                ignore_conflicts=True,
+                batch_size=self.batch_size,
+            )
+            # bulk_create bypasses the signals that maintain CourseAccess, the role counters, the teachers cache
+            # and suggestions
+            access.refresh_on_commit(pairs)
+            transaction.on_commit(lambda: tiered.delete(ROLE_COUNTS_KEY))
+            teachers = [(user.pk, user.name) for user in users if user.role == 'teacher']
+            if teachers:
+                transaction.on_commit(invalidate_teachers_directory)
+                transaction.on_commit(lambda: search.index_many('teachers', teachers))
+        self.created += len(users)
+        self.enrolled += len(pairs)
+
+
+def import_users(stream, fmt, course_ids=(), batch_size=1000, workers=1):
+    return UserImport(course_ids, batch_size, workers).run(read_rows(stream, fmt))
+
+
+def set_job(job_id, state):
+    cache.set(JOB_KEY.format(job_id), state, JOB_TIMEOUT)
+
+
+def get_job(job_id):
+    return cache.get(JOB_KEY.format(job_id))
+
+
+def queue_import(upload, fmt, course_ids=()):
+    """Store the upload and import it in a Celery task; returns the job id."""
+    from .tasks import import_users_file  # Avoid circular imports
+
+    job_id = uuid.uuid4().hex
+    path = default_storage.save(f'{UPLOAD_DIR}/{job_id}.{fmt}', upload)
+    set_job(job_id, {'status': 'queued'})
+    import_users_file.delay(job_id, path, fmt, list(course_ids))
+    return job_id
+
+
+def run_job(job_id, path, fmt, course_ids, batch_size=1000, workers=1):
+    """Import a stored upload, record the report under the job id and delete the file."""
+    set_job(job_id, {'status': 'running'})
+    try:
+        with default_storage.open(path, 'rb') as file:
+            stream = io.TextIOWrapper(file, encoding='utf-8-sig', newline='')
+            report = import_users(stream, fmt, course_ids, batch_size, workers)
+    except Exception:
+        set_job(job_id, {'status': 'failed'})
+        raise
+    finally:
+        default_storage.delete(path)
+    set_job(job_id, {'status': 'done', **report})
+    return report
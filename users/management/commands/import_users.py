@@ -0,0 +1,40 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from lms.models import Course
+from users.importing import FORMATS, format_from_name, import_users
+
+
+class Command(BaseCommand):
+    help = "Bulk import users from a CSV or NDJSON file (email, name, phone, city, role, password, courses)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=FORMATS, help="Defaults to the file extension")
+        parser.add_argument('--course', type=int, action='append', default=[], dest='courses',
+                            help="Enroll every imported user in this course (repeatable)")
+        parser.add_argument('--batch-size', type=int, default=settings.USER_IMPORT_BATCH_SIZE)
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help="Password hashing processes; 1 hashes in this process")
+
+    def handle(self, *args, **options):
+        missing = set(options['courses']) - set(
+            Course.objects.filter(pk__in=options['courses']).values_list('pk', flat=True)
+        )
+        if missing:
+            raise CommandError(f"Courses not found: {', '.join(map(str, sorted(missing)))}")
+
+        fmt = options['format'] or format_from_name(options['path'])
+        with open(options['path'], newline='', encoding='utf-8-sig') as stream:
+            report = import_users(
+                stream, fmt, course_ids=options['courses'],
+                batch_size=options['batch_size'], workers=options['workers'],
+            )
+
+        for error in report['errors']:
+            self.stderr.write(f"Row {error['row']}: {error['errors']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {report['created']} users, {report['enrolled']} enrollments, {report['failed']} rows rejected"
+        ))
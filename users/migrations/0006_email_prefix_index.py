@@ -0,0 +1,29 @@
+# Generated by Django 5.2.7 on 2026-10-19 02:41
+
+from django.db import migrations
+
+
+# Admin '^email' search compiles to UPPER(email::text) LIKE UPPER('value%') on Postgres
+def create_prefix_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS users_user_email_upper_prefix ON users_user (UPPER(email::text) text_pattern_ops)'
+    )
+
+
+def drop_prefix_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS users_user_email_upper_prefix')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0005_alter_user_role'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_prefix_index, drop_prefix_index),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-19 03:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0006_email_prefix_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='payment',
+            name='payment_url',
+            field=models.URLField(blank=True, max_length=1000, null=True, verbose_name='Ссылка на оплату'),
+        ),
+        migrations.AlterField(
+            model_name='payment',
+            name='stripe_session_id',
+            field=models.CharField(blank=True, max_length=255, null=True, unique=True, verbose_name='Stripe Session ID'),
+        ),
+    ]
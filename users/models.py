@@ -66,6 +66,7 @@ class User(AbstractUser):
         max_length=10,
         choices=ROLE_CHOICES,
         default='student',
+        db_index=True,
         verbose_name="Роль",
         help_text="Выберите роль пользователя"
     )
@@ -86,3 +87,121 @@ class User(AbstractUser):
 
     def __str__(self):
         return self.email
+
+
+class Payment(models.Model):
+    PAYMENT_TYPE_CHOICES = [
+        ('card', 'картой'),
+        ('to_account', 'переводом на счёт'),
+    ]
+    STATUS_CHOICES = [
+        ('pending', 'Ожидает оплаты'),
+        ('completed', 'Оплачено'),
+        ('failed', 'Не удалось'),
+    ]
+    user = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        blank=True,
+        null=True,
+        related_name='payments',
+        verbose_name="Пользователь"
+    )
+    payment_date = models.DateField(
+        blank=True,
+        null=True,
+        verbose_name="Дата платежа",
+        help_text="Укажите дату оплаты"
+    )
+    paid_course = models.ForeignKey(
+        'lms.Course',
+        on_delete=models.SET_NULL,
+        blank=True,
+        null=True,
+        verbose_name="Оплаченный курс",
+        help_text="Укажите оплаченный курс"
+    )
+    paid_material = models.ForeignKey(
+        'lms.Material',
+        on_delete=models.SET_NULL,
+        blank=True,
+        null=True,
+        verbose_name="Оплаченный урок",
+        help_text="Укажите оплаченный урок"
+    )
+    payment_amount = models.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        blank=True,
+        null=True,
+        verbose_name="Сумма платежа",
+        help_text="Укажите сумму платежа"
+    )
+    payment_type = models.CharField(
+        max_length=20,
+        choices=PAYMENT_TYPE_CHOICES,
+        blank=True,
+        null=True,
+        verbose_name="Способ оплаты",
+        help_text="Выберите способ оплаты"
+    )
+    status = models.CharField(
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default='pending',
+        verbose_name="Статус платежа",
+        help_text="Текущий статус оплаты"
+    )
+    # Idempotency key for webhook processing: one payment per Checkout Session
+    stripe_session_id = models.CharField(
+        max_length=255,
+        unique=True,
+        blank=True,
+        null=True,
+        verbose_name="Stripe Session ID"
+    )
+    stripe_payment_status = models.CharField(
+        max_length=50,
+        blank=True,
+        null=True,
+        verbose_name="Статус оплаты в Stripe"
+    )
+    payment_url = models.URLField(
+        max_length=1000,
+        blank=True,
+        null=True,
+        verbose_name="Ссылка на оплату"
+    )
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания платежа")
+
+    class Meta:
+        verbose_name = "Платеж"
+        verbose_name_plural = "Платежи"
+        ordering = ["-created_at"]
+
+    def __str__(self):
+        return f"{self.user} - {self.payment_amount} ({self.get_status_display()})"
+
+
+class Subscription(models.Model):
+    user_sub = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='subscriber',
+        verbose_name="Подписчик"
+    )
+    course = models.ForeignKey(
+        'lms.Course',
+        on_delete=models.CASCADE,
+        related_name='subscriptions',
+        verbose_name="Курс"
+    )
+    subscribed_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата подписки")
+
+    class Meta:
+        verbose_name = "Подписка"
+        verbose_name_plural = "Подписки"
+        unique_together = ('user_sub', 'course')
+
+    def __str__(self):
+        return f"{self.user_sub} - {self.course}"
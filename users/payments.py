@@ -0,0 +1,145 @@
+"""Stripe Checkout payments: session creation and idempotent fulfillment."""
+import logging
+from decimal import Decimal
+from urllib.parse import urlsplit
+
+import stripe
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from lms import access
+from lms.events import publish_event
+from lms.models import Enrollment
+from .models import Payment
+
+logger = logging.getLogger(__name__)
+
+
+def to_minor_units(amount):
+    """Stripe expects amounts in kopecks/cents."""
+    return int((Decimal(amount) * 100).to_integral_value())
+
+
+def origin(url):
+    parts = urlsplit(url)
+    return f'{parts.scheme}://{parts.netloc}'.lower()
+
+
+def redirect_url(url, default):
+    """
+    The page Stripe sends the user back to. A URL from the client must be on
+    one of the frontend origins (CORS_ALLOWED_ORIGINS or the default pages'),
+    otherwise checkout would redirect anywhere; raises ValueError.
+    """
+    if not url:
+        return default
+    allowed = {origin(allowed_url) for allowed_url in settings.CORS_ALLOWED_ORIGINS}
+    allowed |= {origin(settings.STRIPE_SUCCESS_URL), origin(settings.STRIPE_CANCEL_URL)}
+    if urlsplit(url).scheme not in ('http', 'https') or origin(url) not in allowed:
+        raise ValueError(url)
+    return url
+
+
+def create_checkout(user, success_url, cancel_url, course=None, material=None):
+    """
+    Create a pending Payment and its Checkout Session. A still pending
+    payment of the same user for the same item is reused, so repeated
+    clicks on "Buy" do not open several sessions.
+    """
+    item = course or material
+    payment = Payment.objects.filter(
+        user=user, paid_course=course, paid_material=material, status='pending', payment_url__isnull=False,
+    ).first()
+    if payment is not None:
+        return payment
+
+    payment = Payment.objects.create(
+        user=user, paid_course=course, paid_material=material, payment_amount=item.price, payment_type='card',
+    )
+    try:
+        session = stripe.checkout.Session.create(
+            mode='payment',
+            line_items=[{
+                'price_data': {
+                    'currency': settings.STRIPE_CURRENCY,
+                    'unit_amount': to_minor_units(item.price),
+                    'product_data': {'name': item.title},
+                },
+                'quantity': 1,
+            }],
+            client_reference_id=str(payment.pk),
+            metadata={'payment_id': payment.pk},
+            success_url=success_url,
+            cancel_url=cancel_url,
+            # A retried request after a network error must not create a second session
+            idempotency_key=f'checkout-payment-{payment.pk}',
+        )
+    except stripe.StripeError:
+        # Not left pending: it has no session, so it can't be paid or reconciled
+        payment.status = 'failed'
+        payment.save(update_fields=['status'])
+        raise
+    payment.stripe_session_id = session['id']
+    payment.payment_url = session['url']
+    payment.save(update_fields=['stripe_session_id', 'payment_url'])
+    return payment
+
+
+def session_state(session_id):
+    """Current state of a Checkout Session as known to Stripe."""
+    session = stripe.checkout.Session.retrieve(session_id)
+    return {'id': session['id'], 'status': session['status'], 'payment_status': session['payment_status']}
+
+
+def fulfill_sessions(sessions):
+    """
+    Apply Checkout Session states to their payments in one transaction.
+    `sessions` is a list of dicts with 'id', 'status' and 'payment_status'.
+
+    Payments are locked with SELECT ... FOR UPDATE and only pending ones
+    are touched, so redelivered webhooks and the reconciliation task can
+    run concurrently without enrolling anybody twice. Enrollments for all
+    paid courses are inserted with a single bulk_create.
+    """
+    states = {session['id']: session for session in sessions}
+    if not states:
+        return 0
+    today = timezone.localdate()
+    with transaction.atomic():
+        payments = list(
+            Payment.objects.select_for_update()
+            .filter(stripe_session_id__in=states, status='pending')
+        )
+        completed, failed = [], []
+        for payment in payments:
+            session = states[payment.stripe_session_id]
+            payment.stripe_payment_status = session.get('payment_status')
+            if session.get('payment_status') in ('paid', 'no_payment_required'):
+                payment.status = 'completed'
+                payment.payment_date = today
+                completed.append(payment)
+            elif session.get('status') == 'expired' or session.get('payment_status') == 'failed':
+                payment.status = 'failed'
+                failed.append(payment)
+        Payment.objects.bulk_update(completed + failed, ['status', 'payment_date', 'stripe_payment_status'])
+        Enrollment.objects.bulk_create(
+            [
+                Enrollment(user_id=payment.user_id, course_id=payment.paid_course_id)
+                for payment in completed if payment.user_id and payment.paid_course_id
+            ],
+            ignore_conflicts=True,
+        )
+        # bulk_create and bulk_update bypass the signals that maintain CourseAccess
+        access.refresh_on_commit(
+            (payment.user_id, payment.paid_course_id) for payment in completed + failed if payment.paid_course_id
+        )
+        for payment in completed:
+            publish_event(
+                'payment_completed',
+                {'payment': payment.pk, 'course': payment.paid_course_id, 'material': payment.paid_material_id},
+                user_id=payment.user_id,
+            )
+    if completed or failed:
+        logger.info("Stripe sessions processed: %s completed, %s failed", len(completed), len(failed))
+    return len(completed)
@@ -73,3 +73,16 @@ class ProfileSerializer(serializers.ModelSerializer):
             if value.size > 2 * 1024 * 1024:
                 raise serializers.ValidationError('Файл слишком большой (макс. 2MB).')
         return value
+
+
+class UserImportSerializer(serializers.Serializer):
+    """One row of a bulk import; uniqueness of emails is checked per batch in users.importing."""
+    email = serializers.EmailField()
+    name = serializers.CharField(max_length=100, required=False, allow_blank=True)
+    phone = serializers.CharField(
+        max_length=35, required=False, allow_blank=True, validators=User._meta.get_field('phone').validators
+    )
+    city = serializers.CharField(max_length=100, required=False, allow_blank=True)
+    role = serializers.ChoiceField(choices=['student', 'teacher'], default='student')
+    password = serializers.CharField(required=False, allow_blank=True, validators=[validate_password])
+    courses = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False)
@@ -0,0 +1,48 @@
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from Diploma_Self_study.cache import tiered
+from .models import User
+
+
+def invalidate_teachers_directory():
+    from .views import TEACHERS_CACHE_VERSION_KEY
+    try:
+        cache.incr(TEACHERS_CACHE_VERSION_KEY)
+    except ValueError:  # No version stored yet, nothing is cached
+        pass
+
+
+@receiver(pre_save, sender=User)
+def remember_role(sender, instance, update_fields=None, **kwargs):
+    # A teacher demoted to student must leave the directory too
+    if instance.pk is None or (update_fields is not None and 'role' not in update_fields):
+        instance._saved_role = None
+    else:
+        instance._saved_role = User.objects.filter(pk=instance.pk).values_list('role', flat=True).first()
+
+
+@receiver([post_save, post_delete], sender=User)
+def teacher_changed(sender, instance, **kwargs):
+    if 'teacher' in (instance.role, getattr(instance, '_saved_role', None)):
+        invalidate_teachers_directory()
+
+
+@receiver([post_save, post_delete], sender='lms.Course')
+def course_changed(sender, instance, **kwargs):
+    invalidate_teachers_directory()
+
+
+@receiver(post_save, sender=User)
+def role_counts_changed(sender, instance, created, update_fields=None, **kwargs):
+    from .views import ROLE_COUNTS_KEY
+    if created or update_fields is None or 'role' in update_fields:  # Not on last_login updates
+        transaction.on_commit(lambda: tiered.delete(ROLE_COUNTS_KEY))
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    from .views import ROLE_COUNTS_KEY
+    transaction.on_commit(lambda: tiered.delete(ROLE_COUNTS_KEY))
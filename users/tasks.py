@@ -0,0 +1,58 @@
+from datetime import timedelta
+
+from celery import shared_task
+from django.conf import settings
+from django.utils import timezone
+
+from .importing import run_job
+from .models import Payment
+from .payments import fulfill_sessions, session_state
+
+# Checkout Session events that change the state of a payment
+CHECKOUT_EVENTS = {
+    'checkout.session.completed',
+    'checkout.session.async_payment_succeeded',
+    'checkout.session.async_payment_failed',
+    'checkout.session.expired',
+}
+
+
+@shared_task(bind=True, max_retries=5, default_retry_delay=30)
+def process_stripe_event(self, event_type, session):
+    """
+    Apply a verified webhook event; retried on Stripe and database errors,
+    safe to run twice. The payload only names the session: its state is
+    fetched from Stripe, so a payment is never fulfilled on the word of
+    the webhook body alone.
+    """
+    if event_type not in CHECKOUT_EVENTS:
+        return 0
+    try:
+        session = session_state(session['id'])
+        if event_type == 'checkout.session.async_payment_failed':
+            session = {**session, 'payment_status': 'failed'}
+        return fulfill_sessions([session])
+    except Exception as exc:
+        raise self.retry(exc=exc)
+
+
+@shared_task
+def reconcile_pending_payments():
+    """
+    Catch payments whose webhook was lost: ask Stripe for the state of
+    sessions that stayed pending and fulfill them in one batch.
+    """
+    cutoff = timezone.now() - timedelta(minutes=settings.STRIPE_RECONCILE_AFTER_MINUTES)
+    session_ids = Payment.objects.filter(
+        status='pending', stripe_session_id__isnull=False, created_at__lt=cutoff,
+    ).values_list('stripe_session_id', flat=True)[:settings.STRIPE_RECONCILE_BATCH]
+    return fulfill_sessions([session_state(session_id) for session_id in session_ids])
+
+
+@shared_task
+def import_users_file(job_id, path, fmt, course_ids):
+    """Bulk import queued by POST /api/users/import/, see users.importing."""
+    return run_job(
+        job_id, path, fmt, course_ids,
+        batch_size=settings.USER_IMPORT_BATCH_SIZE, workers=settings.USER_IMPORT_WORKERS,
+    )
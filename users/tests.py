@@ -0,0 +1,276 @@
+import hashlib
+import hmac
+import json
+import tempfile
+import time
+from unittest import mock
+
+import fakeredis
+import stripe
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from redis.exceptions import RedisError
+from rest_framework.test import APIClient
+
+from Diploma_Self_study.cache import tiered
+from lms import search
+from lms.models import Course, Enrollment
+from . import importing, throttling
+from .models import Payment, User
+
+CHECKOUT_URL = '/api/users/payments/checkout/'
+IMPORT_URL = '/api/users/import/'
+LOGIN_URL = '/api/users/login/'
+TEACHERS_URL = '/api/users/teachers/'
+WEBHOOK_URL = '/api/users/payments/webhook/'
+WEBHOOK_SECRET = 'whsec_test'
+
+
+def stripe_signature(payload, secret, timestamp=None):
+    """Stripe-Signature header for the payload, as Stripe computes it."""
+    timestamp = int(time.time()) if timestamp is None else timestamp
+    signature = hmac.new(secret.encode(), f'{timestamp}.{payload}'.encode(), hashlib.sha256).hexdigest()
+    return f't={timestamp},v1={signature}'
+
+
+@override_settings(STRIPE_WEBHOOK_SECRET=WEBHOOK_SECRET)
+class StripeWebhookTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        teacher = User.objects.create_user(username='t@x.com', email='t@x.com', password='x', role='teacher')
+        self.student = User.objects.create_user(username='s@x.com', email='s@x.com', password='x', role='student')
+        self.course = Course.objects.create(title='Paid', owner=teacher, price=100)
+        self.payment = Payment.objects.create(
+            user=self.student, paid_course=self.course, payment_amount=100, payment_type='card',
+            stripe_session_id='cs_test_1',
+        )
+
+    def post_event(self, payment_status='paid', secret=WEBHOOK_SECRET):
+        payload = json.dumps({
+            'id': 'evt_1',
+            'object': 'event',
+            'type': 'checkout.session.completed',
+            'data': {'object': {'id': 'cs_test_1', 'status': 'complete', 'payment_status': payment_status}},
+        })
+        return self.client.generic('POST', WEBHOOK_URL, payload, content_type='application/json',
+                                   HTTP_STRIPE_SIGNATURE=stripe_signature(payload, secret))
+
+    def stripe_session(self, payment_status):
+        session = {'id': 'cs_test_1', 'status': 'complete', 'payment_status': payment_status}
+        return mock.patch('stripe.checkout.Session.retrieve', return_value=session)
+
+    @override_settings(STRIPE_WEBHOOK_SECRET='')
+    def test_rejected_without_secret(self):
+        with self.stripe_session('paid') as retrieve:
+            response = self.post_event(secret='')
+        self.assertEqual(response.status_code, 503)
+        retrieve.assert_not_called()
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, 'pending')
+
+    def test_rejects_bad_signature(self):
+        with self.stripe_session('paid') as retrieve:
+            response = self.post_event(secret='whsec_forged')
+        self.assertEqual(response.status_code, 400)
+        retrieve.assert_not_called()
+
+    def test_state_comes_from_stripe(self):
+        # A correctly signed event whose body claims "paid" for a session that Stripe says is unpaid
+        with self.stripe_session('unpaid'):
+            response = self.post_event(payment_status='paid')
+        self.assertEqual(response.status_code, 200)
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, 'pending')
+        self.assertFalse(Enrollment.objects.filter(user=self.student, course=self.course).exists())
+
+    def test_redelivery_is_idempotent(self):
+        with self.stripe_session('paid'):
+            for _ in range(2):
+                self.assertEqual(self.post_event().status_code, 200)
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, 'completed')
+        self.assertEqual(Enrollment.objects.filter(user=self.student, course=self.course).count(), 1)
+
+
+@override_settings(THROTTLE_BACKEND='memory')
+class CheckoutTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        teacher = User.objects.create_user(username='t@x.com', email='t@x.com', password='x', role='teacher')
+        self.student = User.objects.create_user(username='s@x.com', email='s@x.com', password='x', role='student')
+        self.course = Course.objects.create(title='Paid', owner=teacher, price=100)
+        self.client.force_authenticate(self.student)
+
+    def checkout(self, **urls):
+        return self.client.post(CHECKOUT_URL, {'course': self.course.pk, **urls}, format='json')
+
+    @override_settings(CORS_ALLOWED_ORIGINS=['https://app.example.com'])
+    def test_return_urls(self):
+        session = {'id': 'cs_test_1', 'url': 'https://checkout.stripe.com/c/pay/cs_test_1'}
+        with mock.patch('stripe.checkout.Session.create', return_value=session) as create:
+            response = self.checkout(success_url='https://app.example.com/paid')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['url'], session['url'])
+        self.assertEqual(create.call_args.kwargs['success_url'], 'https://app.example.com/paid')
+        self.assertEqual(create.call_args.kwargs['cancel_url'], settings.STRIPE_CANCEL_URL)
+
+        for url in ('https://evil.example.com/paid', 'https://app.example.com.evil.com/', 'javascript:alert(1)'):
+            with mock.patch('stripe.checkout.Session.create') as create:
+                self.assertEqual(self.checkout(cancel_url=url).status_code, 400, url)
+            create.assert_not_called()
+
+    def test_stripe_down(self):
+        error = stripe.APIConnectionError('Connection refused')
+        with mock.patch('stripe.checkout.Session.create', side_effect=error), self.assertLogs('users.views', 'ERROR'):
+            self.assertEqual(self.checkout().status_code, 502)
+        self.assertEqual(Payment.objects.get().status, 'failed')
+        # The failed payment is not reused, the next click gets a session
+        session = {'id': 'cs_test_2', 'url': 'https://checkout.stripe.com/c/pay/cs_test_2'}
+        with mock.patch('stripe.checkout.Session.create', return_value=session):
+            self.assertEqual(self.checkout().status_code, 201)
+        self.assertEqual(Payment.objects.get(status='pending').stripe_session_id, 'cs_test_2')
+
+
+class LoginThrottleTests(TestCase):
+    def setUp(self):
+        throttling._bucket = None  # Fresh buckets for every test
+        self.client = APIClient()
+        self.capacity = throttling.LoginRateThrottle().num_requests
+
+    def login(self, **headers):
+        return self.client.post(LOGIN_URL, {}, format='json', **headers)
+
+    def test_bucket_empties(self):
+        for _ in range(self.capacity):
+            self.assertNotEqual(self.login().status_code, 429)
+        response = self.login()
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response.headers)
+
+    def test_rotating_forwarded_for_keeps_the_bucket(self):
+        for number in range(self.capacity):
+            self.assertNotEqual(self.login(HTTP_X_FORWARDED_FOR=f'10.0.0.{number}').status_code, 429)
+        self.assertEqual(self.login(HTTP_X_FORWARDED_FOR='10.0.1.1').status_code, 429)
+
+    def test_behind_proxy(self):
+        # The proxy appends the address it saw, anything to its left comes from the client
+        with override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'NUM_PROXIES': 1}):
+            for number in range(self.capacity):
+                response = self.login(HTTP_X_FORWARDED_FOR=f'10.0.0.{number}, 203.0.113.7')
+                self.assertNotEqual(response.status_code, 429)
+            self.assertEqual(self.login(HTTP_X_FORWARDED_FOR='10.0.1.1, 203.0.113.7').status_code, 429)
+            self.assertNotEqual(self.login(HTTP_X_FORWARDED_FOR='203.0.113.8').status_code, 429)
+
+
+class RedisTokenBucketTests(TestCase):
+    def setUp(self):
+        self.redis = fakeredis.FakeRedis()
+        self.enterContext(mock.patch('users.throttling.get_redis_connection', return_value=self.redis))
+        self.bucket = throttling.RedisTokenBucket()
+
+    def test_burst_then_refill(self):
+        self.assertEqual([self.bucket.consume('b', 3, 5)[0] for _ in range(4)], [True, True, True, False])
+        allowed, wait = self.bucket.consume('b', 3, 5)
+        self.assertFalse(allowed)
+        self.assertTrue(0 < wait <= 0.2)
+        self.assertTrue(self.bucket.consume('other', 3, 5)[0])
+        time.sleep(wait + 0.02)
+        self.assertTrue(self.bucket.consume('b', 3, 5)[0])
+        # Idle buckets expire once they would be full again
+        self.assertEqual(self.redis.ttl('b'), 2)
+
+    def test_fails_open_without_redis(self):
+        with mock.patch.object(fakeredis.FakeRedis, 'evalsha', side_effect=RedisError), \
+                self.assertLogs('users.throttling', 'WARNING'):
+            self.assertEqual(self.bucket.consume('b', 1, 1), (True, None))
+
+
+class UserImportTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        self.client = APIClient()
+        self.admin = User.objects.create_user(username='a@x.com', email='a@x.com', password='x', is_staff=True)
+        self.client.force_authenticate(self.admin)
+        self.course = Course.objects.create(title='C', owner=self.admin)
+
+    def upload(self, rows, courses=()):
+        data = '\n'.join(json.dumps(row) for row in rows).encode()
+        response = self.client.post(IMPORT_URL, {
+            'file': SimpleUploadedFile('cohort.ndjson', data), 'courses': list(courses),
+        }, format='multipart')
+        self.assertEqual(response.status_code, 202, response.content)
+        # Celery runs eagerly in tests, the job is done by now
+        return self.client.get(f"{IMPORT_URL}{response.json()['job']}/").json()
+
+    def test_import_job(self):
+        job = self.upload(
+            [{'email': 'u1@x.com', 'role': 'student'}, {'email': 'u2@x.com', 'role': 'teacher', 'password': 'Zebra-Lantern-42'},
+             {'email': 'u1@x.com', 'role': 'student'}],
+            courses=[self.course.pk, self.course.pk],  # Listed twice is still one course
+        )
+        self.assertEqual((job['status'], job['created'], job['enrolled'], job['failed']), ('done', 2, 2, 1))
+        self.assertTrue(User.objects.get(email='u2@x.com').check_password('Zebra-Lantern-42'))
+
+    def test_registered_during_import(self):
+        real = importing.UserImport.existing_emails
+
+        def registered_meanwhile(import_, emails):
+            emails = list(emails)
+            if not User.objects.filter(email='u1@x.com').exists():
+                # Misses the user that is registered right after the check
+                User.objects.create_user(username='u1@x.com', email='u1@x.com', password='x')
+                return set()
+            return real(import_, emails)
+
+        with mock.patch.object(importing.UserImport, 'existing_emails', registered_meanwhile):
+            job = self.upload([{'email': 'u1@x.com', 'role': 'student'}, {'email': 'u2@x.com', 'role': 'student'}])
+        self.assertEqual((job['status'], job['created'], job['failed']), ('done', 1, 1))
+        self.assertEqual(job['errors'][0]['row'], 1)
+        self.assertTrue(User.objects.filter(email='u2@x.com').exists())
+
+    def test_teachers_are_suggested(self):
+        redis = fakeredis.FakeRedis()
+        with mock.patch('lms.search.get_connection', return_value=redis), \
+                self.captureOnCommitCallbacks(execute=True):
+            self.upload([{'email': 'u1@x.com', 'role': 'teacher', 'name': 'Анна Петрова'},
+                         {'email': 'u2@x.com', 'role': 'student', 'name': 'Пётр Анисимов'}])
+        with mock.patch('lms.search.get_connection', return_value=redis):
+            self.assertEqual(search.suggest('teachers', 'пет'),
+                             [(User.objects.get(email='u1@x.com').pk, 'Анна Петрова')])
+            self.assertEqual(search.suggest('teachers', 'ани'), [])
+
+    def test_role_counters_are_refreshed(self):
+        cache.clear()
+        tiered.local.clear()
+        self.assertEqual(self.client.get('/api/users/students-count/').json(), {'count': 1})  # The admin
+        with self.captureOnCommitCallbacks(execute=True):
+            self.upload([{'email': 'u1@x.com', 'role': 'student'}, {'email': 'u2@x.com', 'role': 'student'}])
+        self.assertEqual(self.client.get('/api/users/students-count/').json(), {'count': 3})
+
+    def test_unknown_job(self):
+        self.assertEqual(self.client.get(f'{IMPORT_URL}nope/').status_code, 404)
+
+
+class TeachersDirectoryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.teacher = User.objects.create_user(username='t@x.com', email='t@x.com', password='x', role='teacher',
+                                                name='Анна')
+
+    def names(self):
+        return [teacher['name'] for teacher in self.client.get(TEACHERS_URL).json()['results']]
+
+    def test_role_changes(self):
+        self.assertEqual(self.names(), ['Анна'])
+        self.teacher.role = 'student'
+        self.teacher.save()
+        self.assertEqual(self.names(), [])
+        self.teacher.role = 'teacher'
+        self.teacher.save(update_fields=['role'])
+        self.assertEqual(self.names(), ['Анна'])
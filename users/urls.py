@@ -20,6 +20,10 @@ urlpatterns = [
         views.UserViewSet.as_view({'get': 'students'}),
         name='students'
     ),
+    path('import/', views.UserImportView.as_view(), name='user-import'),
+    path('import/<str:job_id>/', views.UserImportStatusView.as_view(), name='user-import-status'),
+    path('payments/checkout/', views.CheckoutView.as_view(), name='payment-checkout'),
+    path('payments/webhook/', views.StripeWebhookView.as_view(), name='stripe-webhook'),
     path('api/profile/update/', ProfileUpdateView.as_view(), name='profile-update'),
     path('', include(router.urls)),
 ]
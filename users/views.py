@@ -1,11 +1,24 @@
 
 from rest_framework import viewsets, permissions
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db.models import Count, F, Window
+from Diploma_Self_study.cache import tiered
+from django.db.models.functions import RowNumber
 from rest_framework.decorators import action, permission_classes
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.parsers import MultiPartParser
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
 from .serializers import UserSerializer, ProfileSerializer
 from rest_framework_simplejwt.views import TokenObtainPairView
 from .serializers import CustomTokenObtainPairSerializer
+from .throttling import LoginRateThrottle, SignupRateThrottle
+from .pagination import TeachersPagination
+from lms.models import Course, Material
+from .payments import create_checkout, redirect_url
+from .importing import FORMATS, format_from_name, get_job, queue_import
+from .tasks import CHECKOUT_EVENTS, process_stripe_event
+from django.conf import settings
+import stripe
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
@@ -16,12 +29,30 @@ logger = logging.getLogger(__name__)
 
 User = get_user_model()
 
+TEACHERS_CACHE_VERSION_KEY = 'teachers:version'
+TEACHERS_CACHE_TIMEOUT = 60 * 10
+TEACHER_COURSES_LIMIT = 5
+ROLE_COUNTS_KEY = 'users:role-counts'
+ROLE_COUNTS_TIMEOUT = 60 * 10
+
+
+def role_counts():
+    """Number of users per role for the public counters, from the two-tier cache."""
+    return tiered.get_or_set(
+        ROLE_COUNTS_KEY,
+        lambda: dict(User.objects.values_list('role').annotate(count=Count('id')).order_by()),
+        ROLE_COUNTS_TIMEOUT,
+    )
+
+
 class UserViewSet(viewsets.ModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
     permission_classes = [permissions.AllowAny]
 
     def get_queryset(self):
+        if getattr(self, 'swagger_fake_view', False):  # OpenAPI schema generation, no request user
+            return self.queryset.none()
         if not self.request.user.is_authenticated:
             return self.queryset.none()
         if self.request.user.role == 'admin':
@@ -35,7 +66,7 @@ class UserViewSet(viewsets.ModelViewSet):
         URL: /api/users/authors-count/
         No authentication required.
         """
-        count = self.queryset.filter(role='teacher').count()
+        count = role_counts().get('teacher', 0)
         return Response({'count': count}, status=status.HTTP_200_OK)
 
     @action(detail=False, methods=['get'], url_path='students-count', permission_classes=[])
@@ -45,7 +76,7 @@ class UserViewSet(viewsets.ModelViewSet):
         URL: /api/users/authors-count/
         No authentication required.
         """
-        count = self.queryset.filter(role='student').count()
+        count = role_counts().get('student', 0)
         return Response({'count': count}, status=status.HTTP_200_OK)
 
     @action(detail=False, methods=['get', 'put', 'patch'], url_path='me')
@@ -64,31 +95,65 @@ class UserViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=['get'], url_path='teachers', permission_classes=[AllowAny])
     def teachers(self, request):
-        # Get all users with role='teacher'
-        teachers = User.objects.filter(role='teacher').prefetch_related('courses')
-
-        data = []
-        for teacher in teachers:
-            data.append({
-                'id': teacher.id,
-                'name': teacher.name,
-                'avatar': teacher.avatar.url if teacher.avatar else None,
-                'courses': [
-                    {'id': course.id, 'title': course.title}
-                    for course in teacher.courses.all()
-                ]
-            })
+        """
+        Public paginated teachers directory: ?page=N&page_size=M.
+        Each teacher comes with the course count and the newest course titles.
+        Pages are cached until a teacher or a course changes.
+        """
+        paginator = TeachersPagination()
+        cache_key = 'teachers:{}:{}:{}'.format(
+            cache.get_or_set(TEACHERS_CACHE_VERSION_KEY, 1, None),
+            request.query_params.get(paginator.page_query_param, 1),
+            paginator.get_page_size(request),
+        )
+        data = cache.get(cache_key)
+        if data is None:
+            teachers = (
+                User.objects.filter(role='teacher')
+                .annotate(courses_count=Count('courses'))
+                .order_by('name', 'id')
+                .values('id', 'name', 'avatar', 'courses_count')
+            )
+            page = paginator.paginate_queryset(teachers, request, view=self)
+            avatar_storage = User._meta.get_field('avatar').storage
+
+            # Top N newest courses of every teacher on the page in one window query
+            courses = {teacher['id']: [] for teacher in page}
+            top_courses = (
+                Course.objects.filter(owner_id__in=courses)
+                .annotate(position=Window(RowNumber(), partition_by=F('owner_id'), order_by=F('created_at').desc()))
+                .filter(position__lte=TEACHER_COURSES_LIMIT)
+                .order_by('owner_id', 'position')
+                .values_list('owner_id', 'id', 'title')
+            )
+            for owner_id, course_id, title in top_courses:
+                courses[owner_id].append({'id': course_id, 'title': title})
+
+            results = [
+                {
+                    'id': teacher['id'],
+                    'name': teacher['name'],
+                    'avatar': avatar_storage.url(teacher['avatar']) if teacher['avatar'] else None,
+                    'courses_count': teacher['courses_count'],
+                    'courses': courses[teacher['id']],
+                }
+                for teacher in page
+            ]
+            data = paginator.get_paginated_response(results).data
+            cache.set(cache_key, data, TEACHERS_CACHE_TIMEOUT)
 
         return Response(data, status=status.HTTP_200_OK)
 
 
 class CustomTokenObtainPairView(TokenObtainPairView):
     serializer_class = CustomTokenObtainPairSerializer
+    throttle_classes = [LoginRateThrottle]
 
 class RegisterView(APIView):
     serializer_class = UserSerializer
     authentication_classes = []
     permission_classes = [permissions.AllowAny]
+    throttle_classes = [SignupRateThrottle]
 
     def post(self, request):
         logger.info("RegisterView POST hit!")
@@ -96,9 +161,7 @@ class RegisterView(APIView):
         print("Request data:", request.data)  # See what's being sent
         serializer = UserSerializer(data=request.data)
         if serializer.is_valid():
-            user = serializer.save()
-            user.set_password(request.data['password'])  # Hash password
-            user.save()
+            serializer.save()  # create_user() hashes the password
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         print("Serializer errors:", serializer.errors)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -106,6 +169,8 @@ class RegisterView(APIView):
 
 @permission_classes([AllowAny])
 class LoginView(APIView):
+    throttle_classes = [LoginRateThrottle]
+
     def post(self, request):
         print("=== LOGIN DEBUG ===")
         print("Request method:", request.method)
@@ -146,4 +211,117 @@ class ProfileUpdateView(APIView):
         if serializer.is_valid():
             serializer.save()
             return Response(serializer.data, status=status.HTTP_200_OK)
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+class UserImportView(APIView):
+    """
+    POST: Bulk import of users (admins only).
+    Multipart: file (CSV or NDJSON with email, name, phone, city, role, password, courses),
+    optional format ("csv" / "ndjson", defaults to the file extension) and courses (ids to enroll everybody in).
+    The file is imported by a Celery task; returns its job id for GET /api/users/import/{job}/.
+    """
+    permission_classes = [IsAdminUser]
+    parser_classes = [MultiPartParser]
+
+    def post(self, request):
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({'error': 'Загрузите файл.'}, status=status.HTTP_400_BAD_REQUEST)
+        fmt = request.data.get('format') or format_from_name(upload.name)
+        if fmt not in FORMATS:
+            return Response({'error': f"Формат: {', '.join(FORMATS)}."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            course_ids = {int(course_id) for course_id in request.data.getlist('courses')}
+        except ValueError:
+            return Response({'error': 'courses: ожидаются id курсов.'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(course_ids) != Course.objects.filter(pk__in=course_ids).count():
+            return Response({'error': 'Курс не найден.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        job_id = queue_import(upload, fmt, course_ids)
+        return Response({'job': job_id, **get_job(job_id)}, status=status.HTTP_202_ACCEPTED)
+
+
+class UserImportStatusView(APIView):
+    """
+    GET: State of an import job: queued, running, failed or done; a done job
+    has the number of created users and enrollments and the rejected rows.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, job_id):
+        job = get_job(job_id)
+        if job is None:
+            return Response({'error': 'Задача импорта не найдена.'}, status=status.HTTP_404_NOT_FOUND)
+        return Response({'job': job_id, **job}, status=status.HTTP_200_OK)
+
+
+class CheckoutView(APIView):
+    """
+    POST: Start a Stripe Checkout for a paid course or material.
+    Body: {"course": id} or {"material": id}, optional "success_url" / "cancel_url"
+    on one of the frontend origins.
+    Returns the payment id and the Stripe payment page URL.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        course_id = request.data.get('course')
+        material_id = request.data.get('material')
+        if bool(course_id) == bool(material_id):
+            return Response({'error': 'Укажите course или material.'}, status=status.HTTP_400_BAD_REQUEST)
+        model, object_id = (Course, course_id) if course_id else (Material, material_id)
+        item = model.objects.filter(pk=object_id).first()
+        if item is None:
+            return Response({'error': 'Объект не найден.'}, status=status.HTTP_404_NOT_FOUND)
+        if not item.price:
+            return Response({'error': 'Объект бесплатный.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            success_url = redirect_url(request.data.get('success_url'), settings.STRIPE_SUCCESS_URL)
+            cancel_url = redirect_url(request.data.get('cancel_url'), settings.STRIPE_CANCEL_URL)
+        except ValueError:
+            return Response({'error': 'Недопустимый адрес возврата.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            payment = create_checkout(
+                request.user,
+                success_url=success_url,
+                cancel_url=cancel_url,
+                course=item if model is Course else None,
+                material=item if model is Material else None,
+            )
+        except stripe.StripeError:
+            logger.exception("Stripe checkout failed")
+            return Response({'error': 'Платёжный сервис недоступен.'}, status=status.HTTP_502_BAD_GATEWAY)
+        return Response({'payment': payment.pk, 'url': payment.payment_url}, status=status.HTTP_201_CREATED)
+
+
+class StripeWebhookView(APIView):
+    """
+    POST: Stripe webhook. Verifies the signature, queues the event for
+    Celery and answers 200 right away; the processing is idempotent per
+    Checkout Session, so Stripe redeliveries are harmless. Answers 503
+    while STRIPE_WEBHOOK_SECRET is not configured.
+    """
+    authentication_classes = []
+    permission_classes = [AllowAny]
+
+    def post(self, request):
+        if not settings.STRIPE_WEBHOOK_SECRET:
+            # An empty secret would make any self-signed payload valid
+            logger.error("STRIPE_WEBHOOK_SECRET is not set, rejecting the Stripe webhook")
+            return Response(status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        try:
+            event = stripe.Webhook.construct_event(
+                request.body, request.META.get('HTTP_STRIPE_SIGNATURE', ''), settings.STRIPE_WEBHOOK_SECRET
+            )
+        except (ValueError, stripe.SignatureVerificationError):
+            return Response(status=status.HTTP_400_BAD_REQUEST)
+
+        if event['type'] in CHECKOUT_EVENTS:
+            session = event['data']['object']
+            process_stripe_event.delay(event['type'], {
+                'id': session['id'], 'status': session.get('status'), 'payment_status': session.get('payment_status'),
+            })
+        return Response(status=status.HTTP_200_OK)